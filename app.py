@@ -1,14 +1,43 @@
-from flask import Flask, request, jsonify, render_template
-from openai import OpenAI
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from dotenv import load_dotenv
+import atexit
 import os
 import sqlite3
-from sql_validator import validate_sql
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sql_validator import ALLOWED_TABLES, validate_sql
+from sql_cache import SQLCache
+from result_cache import ResultCache
+from http_cache import (
+    COMPRESSIBLE_MIMETYPES, available_encodings, compress_body, compress_stream, matching_etag, result_etag
+)
+from db_pool import ConnectionPool, PoolTimeoutError
+from result_stream import fetch_page, iter_ndjson
+from query_rewriter import (
+    ITEM_CATALOG_TABLE, TEXT_SEARCH_TABLE, rewrite_text_search, rewrite_to_item_catalog, rewrite_to_rollup,
+    rollup_is_current
+)
+from query_governor import QueryGovernor, QueryTooExpensiveError
+from partition_executor import PARTITION_STATE, PartitionedExecutor
+import metrics
+from nl_pipeline import (
+    NLQueryPipeline, SingleFlight, StubSQLGenerator, PipelineBusyError, GenerationTimeoutError
+)
+from sql_cache import normalize_question
+from result_format import (
+    FORMAT_ROWS, FORMAT_COLUMNAR, FORMAT_ARROW, SUPPORTED_FORMATS, ARROW_MIMETYPE,
+    to_columnar, to_arrow_ipc
+)
+from training_manifest import (
+    KIND_DDL, KIND_DOCUMENTATION, KIND_SQL, make_item, parse_example_queries, split_documentation,
+    load_manifest, save_manifest, plan_training, training_fingerprint
+)
+from prompt_context import DEFAULT_DDL_KEEP_COLUMNS
+from warmup import Warmup
 import logging
-from vanna.openai import OpenAI_Chat
-from vanna.chromadb import ChromaDB_VectorStore
 import traceback
-import pandas as pd
 
 # 載入環境變數
 load_dotenv()
@@ -20,95 +49,350 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class MyVanna(ChromaDB_VectorStore, OpenAI_Chat):
-    def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
-        OpenAI_Chat.__init__(self, config=config)
+# 資料庫位置
+DB_PATH = os.getenv('SALES_DB_PATH', 'database/sales_data.db')
 
-    def run_sql(self, sql):
-        """重寫 run_sql 方法以使用 SQLite"""
-        try:
-            conn = sqlite3.connect('database/sales_data.db')
-            df = pd.read_sql_query(sql, conn)
-            conn.close()
-            return df
-        except Exception as e:
-            logger.error(f"執行 SQL 失敗: {str(e)}")
-            raise
+# 唯讀連線池 (raw-sql 與 nl-query 共用)
+db_pool = ConnectionPool(
+    DB_PATH,
+    max_connections=int(os.getenv('DB_POOL_SIZE', 8)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10))
+)
+
+# SELECT 查詢結果快取
+result_cache = ResultCache(
+    DB_PATH,
+    max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+)
+
+# 查詢執行預算：執行時間、VM 步數、結果筆數與執行計畫預先篩選
+query_governor = QueryGovernor(
+    max_seconds=float(os.getenv('QUERY_MAX_SECONDS', 10)),
+    max_vm_steps=int(os.getenv('QUERY_MAX_VM_STEPS', 500_000_000)),
+    max_rows=int(os.getenv('QUERY_MAX_ROWS', 100_000)),
+    screen_plans=os.getenv('QUERY_PLAN_SCREEN', '1') == '1'
+)
+
+# 實際執行的查詢記錄 (JSONL)，供 database/index_advisor.py 分析索引；設為空字串可關閉
+QUERY_LOG_PATH = os.getenv('SQL_QUERY_LOG', 'database/query_log.jsonl')
+query_log_lock = threading.Lock()
+
+# 將可改寫的彙總查詢導向每日彙總表 sales_daily；設為 0 關閉
+QUERY_REWRITE_ENABLED = os.getenv('QUERY_REWRITE_ENABLED', '1') == '1'
+
+def route_sql(sql, conn):
+    """
+    回傳實際要執行的 SQL：品項目錄或彙總表可回答且資料已是最新時使用改寫後的查詢
+    (只用到 Item 維度的查詢優先使用較小的品項目錄)；仍需讀取 sales 的查詢，
+    LIKE 條件改為使用子字串搜尋索引
+    """
+    if not QUERY_REWRITE_ENABLED:
+        return sql
+    rewritten = rewrite_to_item_catalog(sql)
+    if rewritten is not None and rollup_is_current(conn, ITEM_CATALOG_TABLE):
+        logger.info("查詢改寫為使用品項目錄")
+        return rewritten
+    rewritten = rewrite_to_rollup(sql)
+    if rewritten is not None and rollup_is_current(conn):
+        logger.info("查詢改寫為使用每日彙總表")
+        return rewritten
+    rewritten = rewrite_text_search(sql)
+    if rewritten is None or not rollup_is_current(conn, TEXT_SEARCH_TABLE):
+        return sql
+    logger.info("LIKE 條件改寫為使用子字串搜尋索引")
+    return rewritten
+
+# 依月份分區的資料夾 (database/csv_to_sqlite.py --partition-dir)；設定後無法改寫的彙總查詢
+# 以 process pool 平行查詢各分區再合併，空字串表示關閉
+SALES_PARTITION_DIR = os.getenv('SALES_PARTITION_DIR', '')
+partition_executor = PartitionedExecutor(
+    SALES_PARTITION_DIR, query_governor, workers=int(os.getenv('PARTITION_WORKERS', 0)) or None
+) if SALES_PARTITION_DIR else None
+
+def run_partitioned(sql, conn):
+    """
+    分區已涵蓋最新資料且查詢可依分區執行時，以分區執行查詢
+
+    Returns:
+        Optional[Tuple[List[str], List[tuple]]]: (欄位名稱, 資料列)，無法以分區執行時為 None
+    """
+    if partition_executor is None or not rollup_is_current(conn, PARTITION_STATE):
+        return None
+    plan = partition_executor.plan(sql)
+    if plan is None:
+        return None
+    result = partition_executor.execute(plan)
+    if result is None:
+        return None
+    mode = 'single' if plan.final_sql is None else 'fan_out'
+    metrics.PARTITION_QUERIES.inc(mode=mode)
+    metrics.PARTITIONS.inc(len(plan.paths), result='scanned')
+    metrics.PARTITIONS.inc(plan.skipped, result='skipped')
+    logger.info(f"以分區執行查詢 ({mode}，{len(plan.paths)} 個分區，略過 {plan.skipped} 個)")
+    return result
+
+def log_query(sql, elapsed_ms):
+    """將實際送到資料庫的查詢附加到查詢記錄"""
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({'ts': time.time(), 'sql': sql, 'ms': round(elapsed_ms, 2)}, ensure_ascii=False)
+    try:
+        with query_log_lock, open(QUERY_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logger.warning(f"寫入查詢記錄失敗: {str(e)}")
+
+def query_database(sql):
+    """
+    執行 SELECT 查詢，優先使用結果快取
+
+    Returns:
+        Tuple[List[str], List[tuple], bool]: (欄位名稱, 資料列, 是否命中快取)
+    """
+    with metrics.span('result_cache'):
+        cached = result_cache.get(sql)
+    if cached is not None:
+        metrics.RESULT_CACHE_LOOKUPS.inc(result='hit')
+        columns, rows = cached
+        logger.info(f"查詢結果快取命中，返回 {len(rows)} 筆結果")
+        return columns, rows, True
+    metrics.RESULT_CACHE_LOOKUPS.inc(result='miss')
+
+    # 執行前讀取版本：執行期間有新資料寫入時結果不寫入快取
+    version = result_cache.data_version()
+    start = time.perf_counter()
+    with metrics.span('execution'), db_pool.connection() as conn:
+        executed_sql = route_sql(sql, conn)
+        # 彙總表等可回答的查詢已改寫，只有仍需讀取 sales 的查詢才考慮分區
+        result = run_partitioned(sql, conn) if executed_sql == sql else None
+        columns, rows = result if result is not None else query_governor.execute(conn, executed_sql)
+    log_query(executed_sql, (time.perf_counter() - start) * 1000)
+    result_cache.put(sql, columns, rows, version)
+    return columns, rows, False
 
 app = Flask(__name__)
 
-# 初始化 Vanna
-vn = MyVanna(
-    config={
-        'api_key': os.getenv('OPENAI_API_KEY'),
-        'model': 'gpt-4',
-        'temperature': 0.1
-    }
+# Chroma 向量資料庫的資料目錄；CHROMA_MEMORY_LIMIT_BYTES > 0 時以 LRU 限制同時載入記憶體的 HNSW segment
+CHROMA_PATH = os.getenv('CHROMA_PATH', 'database/chroma')
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv('CHROMA_MEMORY_LIMIT_BYTES', 0))
+
+# Vanna (vanna / chromadb / openai) 在第一次使用時才載入與建立
+_vn = None
+_vn_lock = threading.Lock()
+
+def get_vanna():
+    """回傳 Vanna 實例，第一次呼叫時載入相關套件並建立"""
+    global _vn
+    if _vn is not None:
+        return _vn
+    with _vn_lock:
+        if _vn is None:
+            start = time.perf_counter()
+            from vanna_backend import MyVanna
+            from vector_store import create_client
+            vn = MyVanna(
+                config={
+                    # segment 存放在 CHROMA_PATH (vanna 預設為目前目錄，會散落在專案根目錄)，collection 在第一次查詢時才載入
+                    'path': CHROMA_PATH,
+                    'client': create_client(CHROMA_PATH, CHROMA_MEMORY_LIMIT_BYTES),
+                    'api_key': os.getenv('OPENAI_API_KEY'),
+                    'model': 'gpt-4',
+                    'temperature': 0.1,
+                    # 每個 collection 取回的筆數與 prompt 中檢索內容的 token 預算
+                    'n_results_sql': int(os.getenv('PROMPT_TOP_K_SQL', 5)),
+                    'n_results_ddl': int(os.getenv('PROMPT_TOP_K_DDL', 2)),
+                    'n_results_documentation': int(os.getenv('PROMPT_TOP_K_DOCUMENTATION', 5)),
+                    'prompt_context_tokens': int(os.getenv('PROMPT_CONTEXT_TOKENS', 2000)),
+                    'ddl_keep_columns': [
+                        name.strip() for name in
+                        os.getenv('PROMPT_DDL_KEEP_COLUMNS', ','.join(DEFAULT_DDL_KEEP_COLUMNS)).split(',')
+                        if name.strip()
+                    ]
+                },
+                query_fn=query_database
+            )
+            # 不使用 vn.connect_to_sqlite()：它會以自己的連線覆蓋 MyVanna.run_sql，
+            # 繞過連線池與結果快取
+            vn.dialect = "SQLite"
+            vn.run_sql_is_set = True
+            vn.client = vn.client.with_options(timeout=NL_LLM_TIMEOUT)
+            _vn = vn
+            logger.info(f"Vanna 初始化完成，耗時 {(time.perf_counter() - start) * 1000:.1f}ms")
+    return _vn
+
+# 訓練 manifest：記錄已訓練項目的內容 hash
+TRAINING_MANIFEST_PATH = os.getenv('TRAINING_MANIFEST_PATH', 'database/training_manifest.json')
+
+# SQL 生成後端：vanna (預設，呼叫 OpenAI) 或 stub (離線壓測用)
+NL_LLM_BACKEND = os.getenv('NL_LLM_BACKEND', 'vanna')
+
+# 問句 → SQL 快取 (stub 後端離線執行，只使用完全比對)
+sql_cache = SQLCache(
+    path=os.getenv('SQL_CACHE_PATH', 'database/sql_cache.json'),
+    max_entries=int(os.getenv('SQL_CACHE_MAX_ENTRIES', 500)),
+    ttl_seconds=float(os.getenv('SQL_CACHE_TTL', 7 * 24 * 3600)),
+    similarity_threshold=float(os.getenv('SQL_CACHE_SIMILARITY', 0.95)),
+    embed_fn=(lambda text: get_vanna().generate_embedding(text)) if NL_LLM_BACKEND != 'stub' else None,
+    save_interval=float(os.getenv('SQL_CACHE_SAVE_INTERVAL', 1.0))
+)
+# 快取檔案由背景 thread 延遲寫入，結束時寫入尚未寫入的變更
+atexit.register(sql_cache.flush)
+
+NL_LLM_TIMEOUT = float(os.getenv('NL_LLM_TIMEOUT', 60))
+# 同步等待 SQL 生成的秒數，超過時轉為背景工作
+NL_QUERY_WAIT = float(os.getenv('NL_QUERY_WAIT', 15))
+
+if NL_LLM_BACKEND == 'stub':
+    generate_sql_fn = StubSQLGenerator(latency=float(os.getenv('NL_STUB_LATENCY', 0))).generate_sql
+else:
+    def generate_sql_fn(question, **kwargs):
+        return get_vanna().generate_sql(question, **kwargs)
+
+nl_pipeline = NLQueryPipeline(
+    generate_sql_fn,
+    max_in_flight=int(os.getenv('NL_MAX_IN_FLIGHT', 4)),
+    max_queue=int(os.getenv('NL_MAX_QUEUE', 32)),
+    timeout=NL_LLM_TIMEOUT
 )
 
-# 連接資料庫並訓練
-def init_vanna():
-    """初始化 Vanna"""
+# 啟動時讀入 OS page cache 的資料庫大小上限 (bytes)；設為 0 關閉
+WARMUP_PRIME_BYTES = int(os.getenv('WARMUP_PRIME_BYTES', db_pool.mmap_size))
+# NL 查詢在 app 尚未就緒時最多等待的秒數，超過時回傳 503
+NL_READY_WAIT = float(os.getenv('NL_READY_WAIT', 10))
+
+def load_vector_store():
+    """建立 Vanna 並載入 Chroma collection"""
+    counts = get_vanna().load_collections()
+    logger.info(f"向量資料庫已載入: {counts}")
+
+def warmup_stages():
+    """暖機階段：連線池、page cache，以及 (非 stub 後端時) 向量資料庫與訓練"""
+    stages = [
+        ('db_pool', db_pool.prewarm),
+        ('page_cache', lambda: db_pool.prime_page_cache(WARMUP_PRIME_BYTES))
+    ]
+    if NL_LLM_BACKEND != 'stub':
+        stages.append(('vector_store', load_vector_store))
+        # train_data 定義在後面，執行時才取用
+        stages.append(('training', lambda: train_data()))
+    return stages
+
+# 暖機階段失敗時的重試間隔 (秒)：每次加倍，最多 WARMUP_RETRY_MAX_DELAY
+WARMUP_RETRY_DELAY = float(os.getenv('WARMUP_RETRY_DELAY', 1))
+WARMUP_RETRY_MAX_DELAY = float(os.getenv('WARMUP_RETRY_MAX_DELAY', 60))
+warmup = Warmup(warmup_stages(), retry_delay=WARMUP_RETRY_DELAY, max_retry_delay=WARMUP_RETRY_MAX_DELAY)
+
+def start_warmup():
+    """在背景開始暖機；/api/raw-sql 不需等待，/api/nl-query 等到就緒才處理"""
+    if warmup.start():
+        logger.info("開始背景暖機...")
+
+def view_ddl(conn, name):
+    """以 view 的欄位名稱與型別組成等效的 CREATE TABLE 語句"""
+    columns = [
+        f"{'id' if column == 'id' else f'[{column}]'} {col_type or 'TEXT'}"
+        for _, column, col_type, *_ in conn.execute(f'PRAGMA table_info("{name}")')
+    ]
+    return f"CREATE TABLE {name} (\n    " + ',\n    '.join(columns) + "\n)"
+
+def collect_training_items():
+    """收集所有訓練項目：資料表 DDL、業務術語與範例查詢"""
+    items = []
+
+    with db_pool.connection() as conn:
+        # 只訓練允許查詢的表格 (彙總表、匯入記錄等內部表格不提供給 LLM)
+        # normalized 配置的 sales 是 view，以欄位資訊組成 CREATE TABLE，讓 LLM 看到原本的欄位
+        cursor = conn.execute("SELECT name, type, sql FROM sqlite_master WHERE type IN ('table', 'view')")
+        for name, kind, ddl in cursor.fetchall():
+            if ddl and name.lower() in ALLOWED_TABLES:
+                items.append(make_item(KIND_DDL, view_ddl(conn, name) if kind == 'view' else ddl))
+
     try:
-        logger.info("開始初始化 Vanna...")
-        
-        # 連接資料庫
-        vn.connect_to_sqlite('database/sales_data.db')
-        logger.info("Vanna 初始化完成")
-        
-        # 訓練資料
-        train_data()
-        
+        # 每個術語各自一筆，檢索時只取回相關的術語
+        with open('pre-train/business_terms.md', 'r', encoding='utf-8') as f:
+            for entry in split_documentation(f.read()):
+                items.append(make_item(KIND_DOCUMENTATION, entry))
     except Exception as e:
-        logger.error(f"Vanna 初始化失敗: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise
+        logger.error(f"讀取業務術語失敗: {str(e)}")
+
+    try:
+        with open('pre-train/example_queries.sql', 'r', encoding='utf-8') as f:
+            for question, query in parse_example_queries(f.read()):
+                items.append(make_item(KIND_SQL, query, question))
+    except Exception as e:
+        logger.error(f"讀取範例查詢失敗: {str(e)}")
+
+    return items
 
 def train_data():
-    """訓練所有必要的資料"""
+    """
+    增量訓練：以內容 hash 比對 manifest，只 embedding 新增或變更的項目，
+    並移除已不存在的項目
+    """
     try:
         logger.info("開始訓練資料...")
-        
-        # 訓練 schema
-        conn = sqlite3.connect('database/sales_data.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        for table in tables:
-            if table[0]:
-                logger.info(f"訓練表格 schema: {table[0]}")
-                vn.train(ddl=table[0])
-        
-        # 訓練業務術語
-        try:
-            with open('pre-train/business_terms.md', 'r', encoding='utf-8') as f:
-                terms = f.read()
-                logger.info("訓練業務術語...")
-                vn.train(documentation=terms)
-        except Exception as e:
-            logger.error(f"訓練業務術語失敗: {str(e)}")
-        
-        # 訓練範例查詢
-        try:
-            with open('pre-train/example_queries.sql', 'r', encoding='utf-8') as f:
-                queries = f.read().split(';')
-                logger.info("訓練範例查詢...")
-                for query in queries:
-                    if query.strip():
-                        vn.train(sql=query.strip())
-        except Exception as e:
-            logger.error(f"訓練範例查詢失敗: {str(e)}")
-            
-        logger.info("資料訓練完成")
-        
+        timings = {}
+        start_time = time.perf_counter()
+
+        items = collect_training_items()
+        manifest = load_manifest(TRAINING_MANIFEST_PATH)
+        new_items, stale = plan_training(items, manifest)
+        timings['collect'] = time.perf_counter() - start_time
+
+        # manifest 中記錄但向量資料庫已遺失的項目需重新加入
+        step_time = time.perf_counter()
+        vn = get_vanna()
+        known = [item for item in items if item['hash'] in manifest]
+        existing = vn.existing_training_ids([manifest[item['hash']]['id'] for item in known])
+        missing = [item for item in known if manifest[item['hash']]['id'] not in existing]
+        if missing:
+            logger.warning(f"向量資料庫缺少 {len(missing)} 筆已記錄的訓練項目，重新加入")
+            new_items.extend(missing)
+        timings['verify'] = time.perf_counter() - step_time
+
+        # 移除已不存在的項目
+        step_time = time.perf_counter()
+        # 與向量資料庫維護互斥：重建 collection 期間刪除的項目會在改名後重新出現
+        with vn.maintenance_lock:
+            for item_hash, entry in stale.items():
+                logger.info(f"移除過期訓練項目 ({entry['kind']}): {entry['id']}")
+                try:
+                    vn.remove_training_data(entry['id'])
+                except Exception as e:
+                    logger.error(f"移除訓練項目失敗: {str(e)}")
+                manifest.pop(item_hash, None)
+        timings['remove'] = time.perf_counter() - step_time
+
+        # 批次加入新增或變更的項目
+        step_time = time.perf_counter()
+        for item in new_items:
+            if item['kind'] == KIND_SQL and not item['question']:
+                item['question'] = vn.generate_question(item['content'])
+                logger.info(f"範例查詢缺少問句，由 LLM 產生: {item['question']}")
+        if new_items:
+            ids = vn.train_batch(new_items)
+            for item in new_items:
+                manifest[item['hash']] = {
+                    'kind': item['kind'],
+                    'id': ids[item['hash']],
+                    'question': item['question']
+                }
+        timings['embed'] = time.perf_counter() - step_time
+
+        save_manifest(TRAINING_MANIFEST_PATH, manifest)
+        sql_cache.set_training_version(training_fingerprint(items))
+
+        timings['total'] = time.perf_counter() - start_time
+        logger.info(
+            f"資料訓練完成: 共 {len(items)} 項，新增 {len(new_items)}，移除 {len(stale)}，"
+            f"略過 {len(items) - len(new_items)}；耗時 " +
+            ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items())
+        )
+
     except Exception as e:
         logger.error(f"訓練資料時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         raise
-    finally:
-        conn.close()
 
 # 全域錯誤處理
 @app.errorhandler(Exception)
@@ -134,16 +418,6 @@ def before_request():
         if not request.is_json and request.method != 'GET':
             return jsonify({'error': '只接受 JSON 格式的請求'}), 400, {'Content-Type': 'application/json'}
 
-def get_db_connection():
-    """建立資料庫連線"""
-    try:
-        conn = sqlite3.connect('database/sales_data.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    except Exception as e:
-        logger.error(f"資料庫連線失敗: {str(e)}")
-        raise
-
 @app.route('/')
 def index():
     try:
@@ -152,6 +426,242 @@ def index():
         logger.error(f"渲染首頁失敗: {str(e)}")
         return jsonify({'error': '頁面渲染失敗'}), 500, {'Content-Type': 'application/json'}
 
+def streamed_or_paged_response(sql, data, header):
+    """
+    依請求參數以串流 (stream: true) 或分頁 (page_size / page_token) 回傳結果
+
+    Returns:
+        回應物件；請求未要求串流或分頁時回傳 None
+    """
+    if not data.get('stream') and 'page_size' not in data and 'page_token' not in data:
+        return None
+    with db_pool.connection() as conn:
+        sql = route_sql(sql, conn)
+
+    if data.get('stream'):
+        logger.info("以 NDJSON 串流回傳查詢結果")
+        return Response(
+            stream_with_context(iter_ndjson(db_pool, sql, header, governor=query_governor)),
+            mimetype='application/x-ndjson'
+        )
+
+    if 'page_size' in data or 'page_token' in data:
+        try:
+            page_size = int(data.get('page_size', 100))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'page_size 必須是整數'}), 400, {'Content-Type': 'application/json'}
+        try:
+            with db_pool.connection() as conn, query_governor.guard(conn):
+                columns, rows, next_token = fetch_page(conn, sql, page_size, data.get('page_token'))
+        except QueryTooExpensiveError as e:
+            return jsonify(e.to_dict()), 422, {'Content-Type': 'application/json'}
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400, {'Content-Type': 'application/json'}
+        except sqlite3.Error as e:
+            logger.error(f"資料庫錯誤: {str(e)}")
+            return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 400, {'Content-Type': 'application/json'}
+        logger.info(f"分頁查詢完成，返回 {len(rows)} 筆結果")
+        metrics.ROWS_RETURNED.inc(len(rows), endpoint=request.endpoint)
+        page = {
+            **header,
+            'results': [dict(zip(columns, row)) for row in rows],
+            'next_page_token': next_token
+        }
+        if data.get('timings'):
+            page['timings'] = g.timings.as_dict()
+        return jsonify(page), 200, {'Content-Type': 'application/json'}
+
+    return None
+
+# 影響查詢結果回應內容的請求參數，列入 ETag
+ETAG_OPTIONS = ('format', 'compression', 'page_size', 'page_token')
+
+def query_etag(sql, data, *parts):
+    """
+    查詢結果的 ETag：正規化 SQL、資料庫版本與回應參數的摘要；
+    要求 timings、串流回應或無法取得資料庫版本時為 None
+
+    版本在執行前讀取：執行期間若有新資料寫入，回應內容可能較新但 ETag 對應舊版本，
+    下次請求時版本不同只會重新執行，不會誤回 304。
+    串流回應在送出狀態碼與標頭之後才執行查詢，可能以錯誤或超過查詢預算的訊息結束，
+    不能以 ETag 讓用戶端沿用。
+    """
+    if data.get('timings') or data.get('stream'):
+        return None
+    version = result_cache.data_version()
+    if version is None:
+        return None
+    options = {key: data.get(key) for key in ETAG_OPTIONS if key in data}
+    return result_etag(sql, version, request.endpoint, options, *parts)
+
+def not_modified_response(sql, data, *parts):
+    """
+    計算查詢結果的 ETag (成功的回應由 add_etag_and_compress 加上)；
+    If-None-Match 符合時回傳 304，不需生成回應或執行查詢，否則回傳 None
+    """
+    g.etag = query_etag(sql, data, *parts)
+    if g.etag is None:
+        return None
+    if not matching_etag(request.if_none_match, g.etag):
+        return None
+    metrics.NOT_MODIFIED.inc(endpoint=request.endpoint)
+    logger.info("If-None-Match 符合，資料未變更，回傳 304")
+    response = app.response_class(status=304)
+    response.set_etag(g.etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def results_response(payload, columns, rows, data):
+    """
+    依請求的 format 輸出查詢結果
+
+    - rows (預設)：每筆資料一個 dict
+    - columnar：欄位名稱只出現一次，每個欄位一個陣列並附型別
+    - arrow：Arrow IPC stream (需 pyarrow)，可用 compression 指定 lz4 / zstd
+    """
+    result_format = data.get('format', FORMAT_ROWS)
+    metrics.ROWS_RETURNED.inc(len(rows), endpoint=request.endpoint)
+    if result_format == FORMAT_ARROW:
+        try:
+            with metrics.span('serialization'):
+                body = to_arrow_ipc(columns, rows, data.get('compression'))
+        except (RuntimeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400, {'Content-Type': 'application/json'}
+        metrics.RESPONSE_BYTES.inc(len(body), format=result_format)
+        headers = {'X-Row-Count': str(len(rows))}
+        if data.get('timings'):
+            headers['X-Timings'] = json.dumps(g.timings.as_dict())
+        return Response(body, mimetype=ARROW_MIMETYPE, headers=headers)
+
+    with metrics.span('serialization'):
+        if result_format == FORMAT_COLUMNAR:
+            payload['format'] = FORMAT_COLUMNAR
+            payload['results'] = to_columnar(columns, rows)
+        else:
+            payload['results'] = [dict(zip(columns, row)) for row in rows]
+        body = app.json.dumps(payload)
+    metrics.RESPONSE_BYTES.inc(len(body), format=result_format)
+    if data.get('timings'):
+        # 序列化完成後才知道各階段時間，直接接在 JSON 物件的結尾
+        body = f'{body[:-1]}, "timings": {json.dumps(g.timings.as_dict())}}}'
+    return app.response_class(body + '\n', status=200, mimetype='application/json')
+
+@app.before_request
+def ensure_warmup_started():
+    """由 WSGI 伺服器 (gunicorn 等) 載入、沒有執行 __main__ 時，在第一個請求開始暖機"""
+    start_warmup()
+
+@app.before_request
+def start_request_timings():
+    """每個請求建立自己的 Timings，metrics.span 記錄的階段時間會累加到這裡"""
+    g.timings = metrics.Timings()
+    metrics.set_current_timings(g.timings)
+
+@app.after_request
+def record_request_metrics(response):
+    timings = getattr(g, 'timings', None)
+    if timings is not None:
+        endpoint = request.endpoint or 'unknown'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - timings.started, endpoint=endpoint)
+        metrics.REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
+# 回應壓縮：依 Accept-Encoding 在 RESPONSE_COMPRESSION 中選擇 (伺服器偏好順序，br 需安裝 brotli，空字串關閉)，
+# 小於 RESPONSE_COMPRESS_MIN_BYTES 的回應不壓縮
+RESPONSE_ENCODINGS = available_encodings(os.getenv('RESPONSE_COMPRESSION', 'br,gzip').split(','))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+
+def compress_response(response, encoding):
+    """
+    壓縮達到門檻的回應；串流回應 (NDJSON) 不等待內容達到門檻，直接逐段壓縮，第一批資料列即可送出
+    """
+    def record(original, compressed):
+        metrics.COMPRESSION_BYTES.inc(original, encoding=encoding, size='original')
+        metrics.COMPRESSION_BYTES.inc(compressed, encoding=encoding, size='compressed')
+
+    if response.is_streamed:
+        chunks = response.response
+        if hasattr(chunks, 'close'):
+            response.call_on_close(chunks.close)
+        response.response = compress_stream(chunks, encoding, record)
+    else:
+        body = response.get_data()
+        if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+            return
+        compressed = compress_body(body, encoding)
+        record(len(body), len(compressed))
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+
+@app.after_request
+def add_etag_and_compress(response):
+    """成功的查詢結果加上 ETag，並依 Accept-Encoding 壓縮文字回應"""
+    etag = g.get('etag') if response.status_code == 200 else None
+    if etag is not None:
+        response.headers['Cache-Control'] = 'no-cache'
+        # 弱 ETag：不同 Content-Encoding 與診斷欄位 (result_cached 等) 的回應代表相同的查詢結果
+        response.set_etag(etag, weak=True)
+    if (response.status_code == 200 and RESPONSE_ENCODINGS and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and not response.direct_passthrough and 'Content-Encoding' not in response.headers):
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(RESPONSE_ENCODINGS)
+        if encoding is not None:
+            compress_response(response, encoding)
+    return response
+
+@app.teardown_request
+def clear_request_timings(exc):
+    metrics.set_current_timings(None)
+
+def collect_component_stats():
+    """將連線池、快取、生成管線與查詢預算的既有統計轉為指標"""
+    pool = db_pool.stats()
+    pipeline = nl_pipeline.stats()
+    governor = query_governor.stats()
+    yield ('vanna_db_pool_connections', 'gauge', '連線池連線數',
+           [({'state': 'in_use'}, pool['in_use']), ({'state': 'idle'}, pool['idle'])])
+    yield ('vanna_db_pool_timeouts_total', 'counter', '等待連線逾時次數', [({}, pool['timeouts'])])
+    yield ('vanna_nl_pipeline_in_flight', 'gauge', '生成中或排隊中的 SQL 生成數', [({}, pipeline['in_flight'])])
+    yield ('vanna_nl_pipeline_events_total', 'counter', 'SQL 生成管線事件數',
+           [({'event': key}, pipeline[key])
+            for key in ('submitted', 'coalesced', 'rejected', 'timeouts', 'failures', 'completed')])
+    yield ('vanna_query_limit_exceeded_total', 'counter', '查詢超過執行預算的次數',
+           [({'limit': key}, governor[key]) for key in ('plan', 'timeout', 'vm_steps', 'max_rows')])
+    yield ('vanna_result_cache_bytes', 'gauge', '查詢結果快取使用的記憶體 (估計)',
+           [({}, result_cache.stats().get('bytes', 0))])
+    yield ('vanna_ready', 'gauge', '暖機是否完成 (1 表示可處理 NL 查詢)', [({}, 1 if warmup.ready else 0)])
+    yield ('vanna_warmup_stage_seconds', 'gauge', '各暖機階段耗時',
+           [({'stage': name}, seconds) for name, seconds in warmup.stage_seconds()])
+
+metrics.REGISTRY.register_collector(collect_component_stats)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 格式的指標"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.PROMETHEUS_MIMETYPE)
+
+@app.route('/healthz')
+def healthz():
+    """存活檢查：程序可接受請求即回傳 200"""
+    return jsonify({'status': 'ok'}), 200, {'Content-Type': 'application/json'}
+
+@app.route('/readyz')
+def readyz():
+    """就緒檢查：暖機完成 (可處理 NL 查詢) 時回傳 200，否則 503"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503, {'Content-Type': 'application/json'}
+
+@app.route('/api/db-health')
+def db_health():
+    """資料庫連線池健康狀態與使用統計"""
+    health = db_pool.health()
+    health['result_cache'] = result_cache.stats()
+    health['nl_pipeline'] = nl_pipeline.stats()
+    health['query_governor'] = query_governor.stats()
+    status = 200 if health['ok'] else 503
+    return jsonify(health), status, {'Content-Type': 'application/json'}
+
 @app.route('/api/raw-sql', methods=['POST'])
 def raw_sql():
     """直接執行 SQL 查詢的端點"""
@@ -168,40 +678,119 @@ def raw_sql():
 
         logger.info(f"準備執行 SQL 查詢: {sql}")
 
+        if data.get('format', FORMAT_ROWS) not in SUPPORTED_FORMATS:
+            return jsonify({'error': f"format 只支援 {', '.join(SUPPORTED_FORMATS)}"}), 400, {'Content-Type': 'application/json'}
+
         # SQL 驗證
-        is_valid, error_message = validate_sql(sql)
+        with metrics.span('validation'):
+            is_valid, error_message = validate_sql(sql)
         if not is_valid:
+            metrics.VALIDATION_FAILURES.inc(endpoint='raw_sql')
             return jsonify({'error': f'SQL 語法錯誤: {error_message}'}), 400, {'Content-Type': 'application/json'}
 
-        conn = get_db_connection()
+        if sql.strip().upper().startswith('SELECT'):
+            response = not_modified_response(sql, data)
+            if response is not None:
+                return response
+
+            response = streamed_or_paged_response(sql, data, {'sql': sql})
+            if response is not None:
+                return response
+
+            try:
+                columns, rows, cached = query_database(sql)
+            except QueryTooExpensiveError as e:
+                return jsonify(e.to_dict()), 422, {'Content-Type': 'application/json'}
+            except PoolTimeoutError as e:
+                logger.error(f"資料庫連線忙碌: {str(e)}")
+                return jsonify({'error': '資料庫忙碌中，請稍後再試'}), 503, {'Content-Type': 'application/json'}
+            except sqlite3.Error as e:
+                logger.error(f"資料庫錯誤: {str(e)}")
+                return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 400, {'Content-Type': 'application/json'}
+            logger.info(f"查詢完成，返回 {len(rows)} 筆結果")
+            return results_response({
+                'sql': sql,
+                'result_cached': cached
+            }, columns, rows, data)
+
         try:
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            
-            if sql.strip().upper().startswith('SELECT'):
-                results = [dict(row) for row in cursor.fetchall()]
-                logger.info(f"查詢完成，返回 {len(results)} 筆結果")
-            else:
-                conn.commit()
+            with db_pool.connection() as conn, query_governor.guard(conn):
+                cursor = conn.execute(sql)
                 results = {'affected_rows': cursor.rowcount}
-                logger.info(f"非查詢操作完成，影響 {cursor.rowcount} 筆資料")
+            logger.info(f"非查詢操作完成，影響 {cursor.rowcount} 筆資料")
             
             return jsonify({
                 'sql': sql,
                 'results': results
             }), 200, {'Content-Type': 'application/json'}
 
+        except QueryTooExpensiveError as e:
+            return jsonify(e.to_dict()), 422, {'Content-Type': 'application/json'}
+        except PoolTimeoutError as e:
+            logger.error(f"資料庫連線忙碌: {str(e)}")
+            return jsonify({'error': '資料庫忙碌中，請稍後再試'}), 503, {'Content-Type': 'application/json'}
         except sqlite3.Error as e:
             logger.error(f"資料庫錯誤: {str(e)}")
             return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 400, {'Content-Type': 'application/json'}
-        finally:
-            conn.close()
 
     except Exception as e:
         logger.error(f"處理 SQL 查詢時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'error': '處理查詢時發生錯誤'}), 500, {'Content-Type': 'application/json'}
 
+def check_generated_sql(question, sql, cache_match, embedding=None):
+    """
+    驗證生成的 SQL，有效時寫入問句快取
+
+    Args:
+        embedding: 已算好的問句 embedding (省略時由快取自行計算)
+
+    Returns:
+        Optional[str]: 錯誤訊息，SQL 有效時為 None
+    """
+    with metrics.span('validation'):
+        is_valid, error_message = validate_sql(sql)
+    if not is_valid:
+        metrics.VALIDATION_FAILURES.inc(endpoint='nl_query')
+        logger.error(f"生成的 SQL 無效: {error_message}")
+        return f'生成的 SQL 無效: {error_message}'
+    if not cache_match:
+        sql_cache.put(question, sql, embedding=embedding)
+    return None
+
+def run_nl_job(question, future, start_time, result_format, embedding=None):
+    """背景工作：等待 SQL 生成完成後驗證並執行，回傳與同步回應相同的內容"""
+    sql = nl_pipeline.wait(future)
+    generation_ms = (time.perf_counter() - start_time) * 1000
+    logger.info(f"生成的 SQL: {sql}")
+    error_message = check_generated_sql(question, sql, None, embedding)
+    if error_message:
+        raise ValueError(error_message)
+    columns, rows, cached = query_database(sql)
+    return {
+        'question': question,
+        'sql': sql,
+        'cache_hit': False,
+        'cache_match': None,
+        'generation_ms': round(generation_ms, 2),
+        'result_cached': cached,
+        'format': result_format,
+        'results': to_columnar(columns, rows) if result_format == FORMAT_COLUMNAR
+        else [dict(zip(columns, row)) for row in rows]
+    }
+
+def job_accepted_response(question, future, start_time, data, embedding=None):
+    """將尚未完成的生成轉為背景工作，回傳 202 與查詢位址"""
+    result_format = FORMAT_COLUMNAR if data.get('format') == FORMAT_COLUMNAR else FORMAT_ROWS
+    job_id = nl_pipeline.submit_job(run_nl_job, question, future, start_time, result_format, embedding)
+    logger.info(f"SQL 生成較慢，轉為背景工作: {job_id}")
+    return jsonify({
+        'question': question,
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': f'/api/nl-query/jobs/{job_id}'
+    }), 202, {'Content-Type': 'application/json'}
+
 @app.route('/api/nl-query', methods=['POST'])
 def nl_query():
     try:
@@ -215,27 +804,76 @@ def nl_query():
         if not question:
             return jsonify({'error': '查詢問題不能為空'}), 400, {'Content-Type': 'application/json'}
 
+        if data.get('format', FORMAT_ROWS) not in SUPPORTED_FORMATS:
+            return jsonify({'error': f"format 只支援 {', '.join(SUPPORTED_FORMATS)}"}), 400, {'Content-Type': 'application/json'}
+
+        if not warmup.wait(NL_READY_WAIT):
+            logger.warning("尚未完成暖機，無法處理自然語言查詢")
+            return jsonify({
+                'error': '服務暖機中，請稍後再試',
+                'warmup': warmup.status()
+            }), 503, {'Content-Type': 'application/json', 'Retry-After': '5'}
+
         logger.info(f"處理查詢問題: {question}")
         
         try:
-            sql = vn.generate_sql(question=question)
-            logger.info(f"生成的 SQL: {sql}")
+            start_time = time.perf_counter()
+            with metrics.span('sql_cache'):
+                sql, cache_match, embedding = sql_cache.get(question)
+            metrics.SQL_CACHE_LOOKUPS.inc(result=cache_match or 'miss')
+            if sql:
+                logger.info(f"SQL 快取命中 ({cache_match}): {sql}")
+            else:
+                # 相似比對時已算好的 embedding 交給生成與寫入快取共用
+                future = nl_pipeline.submit(question, embedding=embedding)
+                if data.get('async'):
+                    return job_accepted_response(question, future, start_time, data, embedding)
+                try:
+                    with metrics.span('generation'):
+                        sql = nl_pipeline.wait(future, timeout=min(NL_QUERY_WAIT, nl_pipeline.timeout))
+                except GenerationTimeoutError:
+                    return job_accepted_response(question, future, start_time, data, embedding)
+                g.timings.merge(future.timings)
+                logger.info(f"生成的 SQL: {sql}")
+            generation_ms = (time.perf_counter() - start_time) * 1000
             
             # 驗證生成的 SQL
-            is_valid, error_message = validate_sql(sql)
-            if not is_valid:
-                logger.error(f"生成的 SQL 無效: {error_message}")
-                return jsonify({'error': f'生成的 SQL 無效: {error_message}'}), 400, {'Content-Type': 'application/json'}
+            error_message = check_generated_sql(question, sql, cache_match, embedding)
+            if error_message:
+                return jsonify({'error': error_message}), 400, {'Content-Type': 'application/json'}
+
+            # 回應中包含問句，ETag 也以問句區分
+            response = not_modified_response(sql, data, question)
+            if response is not None:
+                return response
+
+            response = streamed_or_paged_response(sql, data, {
+                'question': question,
+                'sql': sql,
+                'cache_hit': cache_match is not None,
+                'cache_match': cache_match,
+                'generation_ms': round(generation_ms, 2)
+            })
+            if response is not None:
+                return response
             
-            df = vn.run_sql(sql)
+            columns, rows, cached = query_database(sql)
             logger.info("SQL 執行成功")
             
-            return jsonify({
+            return results_response({
                 'question': question,
                 'sql': sql,
-                'results': df.to_dict(orient='records')
-            }), 200, {'Content-Type': 'application/json'}
-            
+                'cache_hit': cache_match is not None,
+                'cache_match': cache_match,
+                'generation_ms': round(generation_ms, 2),
+                'result_cached': cached
+            }, columns, rows, data)
+
+        except PipelineBusyError as e:
+            logger.error(f"LLM 請求過多: {str(e)}")
+            return jsonify({'error': str(e)}), 503, {'Content-Type': 'application/json'}
+        except QueryTooExpensiveError as e:
+            return jsonify({**e.to_dict(), 'question': question, 'sql': sql}), 422, {'Content-Type': 'application/json'}
         except Exception as e:
             logger.error(f"Vanna 處理失敗: {str(e)}")
             logger.error(traceback.format_exc())
@@ -246,9 +884,180 @@ def nl_query():
         logger.error(traceback.format_exc())
         return jsonify({'error': '處理查詢時發生錯誤'}), 500, {'Content-Type': 'application/json'}
 
+# 批次自然語言查詢：每批最多的問題數，與所有批次共用的處理執行緒數 (同時生成與執行的問題數上限)
+NL_BATCH_MAX_QUESTIONS = int(os.getenv('NL_BATCH_MAX_QUESTIONS', 50))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('NL_BATCH_WORKERS', 4)), thread_name_prefix='nl-batch'
+)
+
+def embed_questions(questions):
+    """以一次呼叫計算所有問句的 embedding；stub 後端或失敗時回傳 None (各自在生成時計算)"""
+    if NL_LLM_BACKEND == 'stub' or not questions:
+        return [None] * len(questions)
+    try:
+        return get_vanna().embed_questions(questions)
+    except Exception as e:
+        logger.warning(f"批次計算問句 embedding 失敗: {str(e)}")
+        return [None] * len(questions)
+
+def run_batch_item(question, embedding, result_format, shared_queries):
+    """
+    處理批次中的一個問題：查問句快取、生成 SQL、驗證並執行
+
+    相同的 SQL 在同一批次中只執行一次。錯誤不會拋出，而是以 error 與 status 回傳。
+    """
+    start_time = time.perf_counter()
+    item = {'question': question}
+    try:
+        sql, cache_match, embedding = sql_cache.get(question, embedding=embedding)
+        metrics.SQL_CACHE_LOOKUPS.inc(result=cache_match or 'miss')
+        if not sql:
+            sql = nl_pipeline.wait(nl_pipeline.submit(question, embedding=embedding))
+        item.update({
+            'sql': sql,
+            'cache_hit': cache_match is not None,
+            'cache_match': cache_match,
+            'generation_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        })
+        error_message = check_generated_sql(question, sql, cache_match, embedding)
+        if error_message:
+            return {**item, 'error': error_message, 'status': 400}
+        (columns, rows, cached), shared = shared_queries.do(sql, query_database, sql)
+    except PipelineBusyError as e:
+        return {**item, 'error': str(e), 'status': 503}
+    except GenerationTimeoutError as e:
+        return {**item, 'error': str(e), 'status': 504}
+    except QueryTooExpensiveError as e:
+        return {**item, **e.to_dict(), 'status': 422}
+    except PoolTimeoutError:
+        return {**item, 'error': '資料庫忙碌中，請稍後再試', 'status': 503}
+    except sqlite3.Error as e:
+        return {**item, 'error': f'資料庫錯誤: {str(e)}', 'status': 400}
+    except Exception as e:
+        logger.error(f"批次查詢項目失敗: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {**item, 'error': f'自然語言處理失敗: {str(e)}', 'status': 500}
+    metrics.ROWS_RETURNED.inc(len(rows), endpoint='nl_query_batch')
+    return {
+        **item,
+        'result_cached': cached,
+        'shared_result': shared,
+        'status': 200,
+        'format': result_format,
+        'results': to_columnar(columns, rows) if result_format == FORMAT_COLUMNAR
+        else [dict(zip(columns, row)) for row in rows]
+    }
+
+def iter_batch_results(questions, result_format):
+    """
+    以 NDJSON 依完成順序輸出批次結果
+
+    第一行為 {"batch_size": n, "unique_questions": m}，之後每個問題一行 (含 index)，
+    最後一行為 {"done": true, "count": n, "errors": k}。正規化後相同的問句只處理一次。
+    """
+    groups = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(normalize_question(question), []).append(index)
+    unique = [questions[indices[0]] for indices in groups.values()]
+    yield json.dumps({'batch_size': len(questions), 'unique_questions': len(unique)}) + '\n'
+
+    embeddings = embed_questions(unique)
+    shared_queries = SingleFlight()
+    futures = {
+        batch_executor.submit(run_batch_item, question, embedding, result_format, shared_queries): indices
+        for question, embedding, indices in zip(unique, embeddings, groups.values())
+    }
+    errors = 0
+    try:
+        for future in as_completed(futures):
+            item = future.result()
+            for index in futures[future]:
+                if item['status'] != 200:
+                    errors += 1
+                yield json.dumps({'index': index, **item, 'question': questions[index]},
+                                 ensure_ascii=False, default=str) + '\n'
+        yield json.dumps({'done': True, 'count': len(questions), 'errors': errors}) + '\n'
+        logger.info(f"批次查詢完成: {len(questions)} 個問題，{errors} 個失敗")
+    finally:
+        # 用戶端中途斷線時取消尚未開始的項目
+        for future in futures:
+            future.cancel()
+
+@app.route('/api/nl-query/batch', methods=['POST'])
+def nl_query_batch():
+    """一次送出多個自然語言問題，以 NDJSON 串流回傳各問題的結果"""
+    data = request.get_json()
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': '請提供 questions 陣列'}), 400, {'Content-Type': 'application/json'}
+    if len(questions) > NL_BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'每批最多 {NL_BATCH_MAX_QUESTIONS} 個問題'}), 400, {'Content-Type': 'application/json'}
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return jsonify({'error': '查詢問題不能為空'}), 400, {'Content-Type': 'application/json'}
+    result_format = data.get('format', FORMAT_ROWS)
+    if result_format not in (FORMAT_ROWS, FORMAT_COLUMNAR):
+        return jsonify({'error': f'批次查詢的 format 只支援 {FORMAT_ROWS}, {FORMAT_COLUMNAR}'}), 400, {'Content-Type': 'application/json'}
+
+    if not warmup.wait(NL_READY_WAIT):
+        return jsonify({
+            'error': '服務暖機中，請稍後再試',
+            'warmup': warmup.status()
+        }), 503, {'Content-Type': 'application/json', 'Retry-After': '5'}
+
+    logger.info(f"收到批次自然語言查詢: {len(questions)} 個問題")
+    questions = [question.strip() for question in questions]
+    return Response(
+        stream_with_context(iter_batch_results(questions, result_format)),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/api/nl-query/jobs/<job_id>')
+def nl_query_job(job_id):
+    """查詢背景自然語言查詢工作的狀態與結果"""
+    job = nl_pipeline.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '找不到該工作'}), 404, {'Content-Type': 'application/json'}
+    response = {'job_id': job_id, 'status': job['status']}
+    if job['result'] is not None:
+        response.update(job['result'])
+    if job['error']:
+        response['error'] = job['error']
+    return jsonify(response), 200, {'Content-Type': 'application/json'}
+
+@app.route('/api/vector-store')
+def vector_store_report():
+    """Chroma 各 collection 的筆數、重複筆數與 segment 大小"""
+    if NL_LLM_BACKEND == 'stub':
+        return jsonify({'error': 'stub 後端不使用向量資料庫'}), 400, {'Content-Type': 'application/json'}
+    return jsonify(get_vanna().vector_store_report()), 200, {'Content-Type': 'application/json'}
+
+@app.route('/api/vector-store/maintenance', methods=['POST'])
+def vector_store_maintenance():
+    """
+    向量資料庫維護：依內容去除重複的訓練項目 (保留訓練 manifest 記錄的 id)、
+    以既有 embedding 重建 HNSW segment 並刪除殘留的 segment 目錄
+
+    參數 (JSON，皆可省略)：dedup (預設 true)、compact (預設 true)、dry_run (預設 false)
+    """
+    if NL_LLM_BACKEND == 'stub':
+        return jsonify({'error': 'stub 後端不使用向量資料庫'}), 400, {'Content-Type': 'application/json'}
+    data = request.get_json(silent=True) or {}
+    keep_ids = [entry['id'] for entry in load_manifest(TRAINING_MANIFEST_PATH).values()]
+    start = time.perf_counter()
+    result = get_vanna().maintain_vector_store(
+        keep_ids,
+        dedup=bool(data.get('dedup', True)),
+        compact=bool(data.get('compact', True)),
+        dry_run=bool(data.get('dry_run', False))
+    )
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info(f"向量資料庫維護完成: 刪除重複 {result['removed_duplicates']}，重建 {result['rebuilt']}，"
+                f"刪除殘留 segment {len(result['removed_orphans'])} 個")
+    return jsonify(result), 200, {'Content-Type': 'application/json'}
+
 if __name__ == '__main__':
     try:
-        init_vanna()
+        start_warmup()
         port = int(os.getenv('FLASK_PORT', 5000))
         app.run(host='0.0.0.0', port=port, debug=False)
     except Exception as e:
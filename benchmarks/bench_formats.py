@@ -0,0 +1,87 @@
+"""
+比較查詢結果回應格式的大小與序列化時間
+
+用法：
+    python benchmarks/bench_formats.py --rows 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_format import arrow_available, to_arrow_ipc, to_columnar  # noqa: E402
+from sql_validator import ALLOWED_COLUMNS  # noqa: E402
+
+ITEMS = ['牛肉麵 BeefNoodles', 'Black Tea 蜜香紅茶', 'Matcha Latte', 'Cheese cake', 'Drip Coffee']
+LOCATIONS = ['Flushing', 'Manhattan', 'Brooklyn']
+
+
+def make_rows(count: int):
+    """產生與 sales 表同寬 (32 欄) 的模擬資料列"""
+    columns = sorted(ALLOWED_COLUMNS)
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        row = []
+        for col in columns:
+            if col == 'id':
+                row.append(i + 1)
+            elif col in ('Qty', 'Gross Sales', 'Net Sales', 'Tax', 'Discounts', 'Count'):
+                row.append(round(rng.uniform(0, 30), 2))
+            elif col == 'Date':
+                row.append(f"2025-01-{rng.randint(1, 28):02d}")
+            elif col == 'Item':
+                row.append(rng.choice(ITEMS))
+            elif col == 'Location':
+                row.append(rng.choice(LOCATIONS))
+            elif col in ('Notes', 'Fulfillment Note', 'Customer Name', 'GTIN'):
+                row.append(None)
+            else:
+                row.append(f"{col[:3].upper()}-{rng.randint(1000, 9999)}")
+        rows.append(tuple(row))
+    return columns, rows
+
+
+def measure(name, encode, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    gzipped = len(gzip.compress(body, 6))
+    return {'format': name, 'bytes': len(body), 'gzip_bytes': gzipped, 'ms': elapsed_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較查詢結果回應格式')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    columns, rows = make_rows(args.rows)
+    results = [
+        measure('rows', lambda: json.dumps(
+            [dict(zip(columns, row)) for row in rows], ensure_ascii=False).encode('utf-8'), args.repeat),
+        measure('columnar', lambda: json.dumps(
+            to_columnar(columns, rows), ensure_ascii=False).encode('utf-8'), args.repeat),
+    ]
+    if arrow_available():
+        results.append(measure('arrow', lambda: to_arrow_ipc(columns, rows), args.repeat))
+        results.append(measure('arrow+zstd', lambda: to_arrow_ipc(columns, rows, 'zstd'), args.repeat))
+    else:
+        print("未安裝 pyarrow，略過 arrow 格式")
+
+    base = results[0]
+    print(f"{args.rows} 筆 x {len(columns)} 欄")
+    print(f"{'format':<12}{'bytes':>12}{'gzip':>12}{'ms':>10}{'大小比':>10}{'時間比':>10}")
+    for result in results:
+        print(f"{result['format']:<12}{result['bytes']:>12,}{result['gzip_bytes']:>12,}"
+              f"{result['ms']:>10.1f}{result['bytes'] / base['bytes']:>10.2f}{result['ms'] / base['ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
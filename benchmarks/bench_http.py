@@ -0,0 +1,111 @@
+"""
+比較查詢結果回應在不同 Content-Encoding 下的大小與延遲，以及 If-None-Match 重新驗證 (304) 的效果
+
+以模擬資料建立資料庫後以 Flask test client 呼叫 /api/raw-sql (不經過網路)，每個查詢測量：
+- 執行：清空結果快取後的完整請求 (執行查詢、序列化，不壓縮)
+- identity / gzip / br：結果快取命中時的請求，只差在壓縮
+- 304：帶上一次回應的 ETag，資料未變更，不執行查詢
+並依 --mbps 估計傳輸時間 (回應大小 / 頻寬)，列出伺服器時間加上傳輸時間的總延遲。
+
+用法：
+    python benchmarks/bench_http.py --rows 1000000 --mbps 10 100
+    python benchmarks/bench_http.py --size small --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_sales import SIZES, build_database  # noqa: E402
+
+QUERIES = {
+    'by_item': {'sql': 'SELECT Item, SUM(Qty) AS qty, SUM("Net Sales") AS net FROM sales GROUP BY Item'},
+    'daily_items': {'sql': 'SELECT Date, Item, SUM(Qty) AS qty, SUM("Net Sales") AS net FROM sales '
+                           'GROUP BY Date, Item ORDER BY Date, Item LIMIT 5000'},
+    'detail_rows': {'sql': "SELECT * FROM sales WHERE Date >= '2024-03-01' ORDER BY Date LIMIT 5000"},
+    'detail_stream': {'sql': "SELECT * FROM sales WHERE Date >= '2024-03-01' ORDER BY Date LIMIT 5000",
+                      'stream': True},
+}
+
+
+def timed(run, repeat: int):
+    """先執行一次暖快取，回傳 (中位數 ms, 最後一次的回應)"""
+    response = run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = run()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較回應壓縮與 ETag 重新驗證的大小與延遲')
+    parser.add_argument('--size', choices=sorted(SIZES), default=None, help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=SIZES['small'])
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--mbps', type=float, nargs='+', default=[10, 100], help='估計傳輸時間的頻寬 (Mbit/s)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = SIZES[args.size] if args.size else args.rows
+    db_path = build_database(args.workdir, rows)['db_path']
+
+    # app 在 import 時讀取設定，必須先設定環境變數
+    os.environ.update({'SALES_DB_PATH': db_path, 'NL_LLM_BACKEND': 'stub', 'SQL_QUERY_LOG': ''})
+    os.environ.setdefault('OPENAI_API_KEY', 'offline')
+    os.chdir(REPO_ROOT)
+    import logging
+    import app as app_module
+    logging.disable(logging.INFO)
+
+    client = app_module.app.test_client()
+    encodings = ['identity', *app_module.RESPONSE_ENCODINGS]
+
+    def post(body, headers):
+        response = client.post('/api/raw-sql', json=body, headers=headers)
+        response.get_data()  # 讀完串流回應
+        if response.status_code not in (200, 304):
+            sys.exit(f"請求失敗 ({response.status_code}): {response.get_data(as_text=True)[:200]}")
+        return response
+
+    def uncached(body):
+        app_module.result_cache.clear()
+        return post(body, {'Accept-Encoding': 'identity'})
+
+    results = {}
+    for name, body in QUERIES.items():
+        entry = {'執行': timed(lambda: uncached(body), args.repeat)}
+        for encoding in encodings:
+            entry[encoding] = timed(lambda: post(body, {'Accept-Encoding': encoding}), args.repeat)
+        etag = entry[encodings[-1]][1].headers['ETag']
+        entry['304'] = timed(lambda: post(body, {'Accept-Encoding': encodings[-1], 'If-None-Match': etag}),
+                             args.repeat)
+        if entry['304'][1].status_code != 304:
+            sys.exit(f"{name}: If-None-Match 沒有回傳 304")
+        results[name] = entry
+
+    print(f"{rows:,} 筆，壓縮門檻 {app_module.RESPONSE_COMPRESS_MIN_BYTES} bytes")
+    header = f"{'query':<15}{'variant':<10}{'bytes':>10}{'server ms':>11}" + \
+        ''.join(f"{f'@{mbps:g} Mbps ms':>16}" for mbps in args.mbps)
+    print(header)
+    for name, entry in results.items():
+        for variant, (ms, response) in entry.items():
+            size = len(response.get_data())
+            line = f"{name:<15}{variant:<10}{size:>10,}{ms:>11.2f}"
+            for mbps in args.mbps:
+                line += f"{ms + size * 8 / (mbps * 1000):>16.1f}"
+            encoding = response.headers.get('Content-Encoding')
+            if variant not in ('identity', '執行', '304') and encoding != variant:
+                line += '  (未壓縮)'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+離線壓力測試：以模擬銷售資料與 stub LLM 同時對 /api/nl-query 與 /api/raw-sql 送出請求
+
+不需要網路與 OpenAI API key：SQL 生成使用 nl_pipeline.StubSQLGenerator
+(依 pre-train/example_queries.sql 的問句對應 SQL)。
+
+用法：
+    python benchmarks/bench_load.py --size small --requests 500 --concurrency 16
+    python benchmarks/bench_load.py --size medium --json result.json
+    python benchmarks/bench_load.py --size small --baseline result.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_sales import SIZES, build_database, peak_rss_mb  # noqa: E402
+
+RAW_SQL_TEMPLATES = [
+    'SELECT SUM("Net Sales") FROM sales WHERE Date BETWEEN \'{start}\' AND \'{end}\'',
+    'SELECT Item, SUM(Qty) AS qty FROM sales WHERE Date BETWEEN \'{start}\' AND \'{end}\' '
+    'GROUP BY Item ORDER BY qty DESC LIMIT 10',
+    'SELECT Location, SUM("Net Sales") AS net FROM sales WHERE Date BETWEEN \'{start}\' AND \'{end}\' '
+    'GROUP BY Location ORDER BY net DESC',
+    'SELECT Date, Category, SUM("Gross Sales"), COUNT(*) FROM sales WHERE Date BETWEEN \'{start}\' AND \'{end}\' '
+    'GROUP BY Date, Category ORDER BY Date LIMIT 200',
+    'SELECT Item, "Net Sales", Location FROM sales WHERE Date = \'{start}\' LIMIT 100',
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def make_workload(count: int, nl_ratio: float, nl_miss_ratio: float, seed: int):
+    """產生請求清單：[(endpoint, body)]"""
+    from training_manifest import parse_example_queries
+
+    with open(os.path.join(REPO_ROOT, 'pre-train/example_queries.sql'), 'r', encoding='utf-8') as f:
+        questions = [q for q, _ in parse_example_queries(f.read()) if q]
+    rng = random.Random(seed)
+    workload = []
+    for i in range(count):
+        if rng.random() < nl_ratio:
+            question = rng.choice(questions)
+            if rng.random() < nl_miss_ratio:
+                # 加上編號避開問句快取，讓請求經過生成管線
+                question = f"{question} (第 {i} 次)"
+            workload.append(('/api/nl-query', {'question': question}))
+        else:
+            day = rng.randint(0, 500)
+            start = time.strftime('%Y-%m-%d', time.gmtime(1704067200 + day * 86400))
+            end = time.strftime('%Y-%m-%d', time.gmtime(1704067200 + (day + rng.randint(0, 30)) * 86400))
+            sql = rng.choice(RAW_SQL_TEMPLATES).format(start=start, end=end)
+            workload.append(('/api/raw-sql', {'sql': sql}))
+    return workload
+
+
+def send(base_url: str, endpoint: str, body: dict, timeout: float):
+    """送出一個請求，回傳 (endpoint, 秒數, HTTP 狀態, 回應大小)"""
+    data = json.dumps(body).encode('utf-8')
+    req = urllib.request.Request(base_url + endpoint, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            size = len(resp.read())
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    except Exception:
+        size, status = 0, 0
+    return endpoint, time.perf_counter() - start, status, size
+
+
+def start_server(app):
+    """在背景執行緒啟動 app (本機隨機埠)"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def summarize(results, elapsed):
+    summary = {'requests': len(results), 'elapsed_s': elapsed,
+               'requests_per_s': len(results) / elapsed if elapsed else None, 'endpoints': {}}
+    for endpoint in sorted({r[0] for r in results}):
+        latencies = [r[1] * 1000 for r in results if r[0] == endpoint and r[2] == 200]
+        errors = sum(1 for r in results if r[0] == endpoint and r[2] != 200)
+        summary['endpoints'][endpoint] = {
+            'count': sum(1 for r in results if r[0] == endpoint),
+            'errors': errors,
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+            'bytes': sum(r[3] for r in results if r[0] == endpoint)
+        }
+    return summary
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """與基準結果比較，回傳退步的項目"""
+    regressions = []
+    if baseline.get('requests_per_s') and result['requests_per_s'] < baseline['requests_per_s'] * (1 - tolerance):
+        regressions.append(f"requests/sec {result['requests_per_s']:.1f} < 基準 {baseline['requests_per_s']:.1f}")
+    base_import = (baseline.get('import') or {}).get('import_rows_per_s')
+    new_import = (result.get('import') or {}).get('import_rows_per_s')
+    if base_import and new_import and new_import < base_import * (1 - tolerance):
+        regressions.append(f"匯入 rows/sec {new_import:,.0f} < 基準 {base_import:,.0f}")
+    for endpoint, stats in result['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(endpoint)
+        if not base or not base.get('p99_ms') or stats['p99_ms'] is None:
+            continue
+        if stats['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint} p99 {stats['p99_ms']:.1f}ms > 基準 {base['p99_ms']:.1f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='離線壓力測試 (stub LLM + 模擬銷售資料)')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=None, help='自訂資料筆數 (覆寫 --size)')
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--nl-ratio', type=float, default=0.5, help='nl-query 請求的比例')
+    parser.add_argument('--nl-miss-ratio', type=float, default=0.5, help='nl-query 中避開問句快取的比例')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='stub LLM 每次生成的延遲秒數')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    parser.add_argument('--baseline', help='與先前的 JSON 結果比較，退步超過 tolerance 時以非零狀態結束')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    rows = args.rows or SIZES[args.size]
+    os.makedirs(args.workdir, exist_ok=True)
+    import_stats = build_database(args.workdir, rows, args.seed)
+    if import_stats.get('reused'):
+        print(f"沿用既有資料庫 {import_stats['db_path']} ({rows:,} 筆)")
+    else:
+        print(f"匯入 {rows:,} 筆: {import_stats['import_s']:.1f} 秒，"
+              f"{import_stats['import_rows_per_s']:,.0f} rows/sec，最高 RSS {import_stats['peak_rss_mb']:.0f} MB")
+
+    # app 在 import 時讀取設定，必須先設定環境變數
+    sql_cache_path = os.path.join(args.workdir, 'sql_cache.json')
+    if os.path.exists(sql_cache_path):
+        os.remove(sql_cache_path)
+    os.environ.update({
+        'SALES_DB_PATH': import_stats['db_path'],
+        'NL_LLM_BACKEND': 'stub',
+        'NL_STUB_LATENCY': str(args.stub_latency),
+        'SQL_CACHE_PATH': sql_cache_path,
+        'SQL_QUERY_LOG': '',
+    })
+    os.environ.setdefault('OPENAI_API_KEY', 'offline')
+    os.chdir(REPO_ROOT)
+    import logging
+    import app as app_module
+    logging.disable(logging.INFO)  # 壓測時不輸出每個請求的 log
+
+    server, base_url = start_server(app_module.app)
+    app_module.start_warmup()
+    if not app_module.warmup.wait(args.timeout):
+        sys.exit(f"app 暖機失敗: {app_module.warmup.status()}")
+    workload = make_workload(args.requests, args.nl_ratio, args.nl_miss_ratio, args.seed)
+    for endpoint, body in workload[:min(10, len(workload))]:
+        send(base_url, endpoint, body, args.timeout)  # 暖機
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda item: send(base_url, item[0], item[1], args.timeout), workload))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    summary = summarize(results, elapsed)
+    summary.update({'rows': rows, 'concurrency': args.concurrency, 'import': import_stats,
+                    'peak_rss_mb': peak_rss_mb()})
+
+    print(f"\n{rows:,} 筆資料，{args.requests} 個請求，並行 {args.concurrency}")
+    print(f"{'endpoint':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for endpoint, stats in summary['endpoints'].items():
+        def fmt(value):
+            return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+        print(f"{endpoint:<16}{stats['count']:>7}{stats['errors']:>8}{fmt(stats['p50_ms'])}"
+              f"{fmt(stats['p90_ms'])}{fmt(stats['p99_ms'])}{fmt(stats['mean_ms'])}")
+    print(f"requests/sec: {summary['requests_per_s']:.1f}")
+    if import_stats.get('import_rows_per_s'):
+        print(f"匯入 rows/sec: {import_stats['import_rows_per_s']:,.0f}")
+    print(f"最高 RSS: {summary['peak_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"退步: {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+比較在單一資料庫執行彙總查詢與依月份分區平行執行 (partition_executor.py) 的延遲
+
+以模擬資料建立資料庫後以 refresh_partitions 建立分區檔，每個查詢分別在主資料庫執行原始 SQL
+(不經過彙總表改寫) 與以 PartitionedExecutor 執行 (依 --workers 逐一測試)，確認結果相同並比較中位數延遲。
+
+用法：
+    python benchmarks/bench_partitions.py --rows 3000000 --workers 1 2 4 8
+    python benchmarks/bench_partitions.py --size medium --repeat 3
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from partition_executor import PartitionedExecutor  # noqa: E402
+from query_governor import QueryGovernor  # noqa: E402
+from query_rewriter import results_match  # noqa: E402
+from synthetic_sales import SIZES, build_database  # noqa: E402
+import csv_to_sqlite  # noqa: E402
+
+QUERIES = {
+    'by_item': 'SELECT Item, SUM(Qty), SUM("Net Sales") FROM sales GROUP BY Item',
+    'channel_count': 'SELECT Channel, [Dining Option], COUNT(*) FROM sales GROUP BY Channel, [Dining Option]',
+    'device_month': "SELECT strftime('%Y-%m', Date) AS month, [Device Name], SUM(\"Net Sales\") "
+                    "FROM sales GROUP BY month, [Device Name] ORDER BY month",
+    'filtered_total': 'SELECT COUNT(*), SUM("Gross Sales"), SUM(Discounts) FROM sales WHERE Qty > 1',
+    'quarter': "SELECT Location, SUM(\"Net Sales\") FROM sales "
+               "WHERE Date BETWEEN '2024-04-01' AND '2024-06-30' GROUP BY Location",
+    'one_month': "SELECT Category, COUNT(*) FROM sales WHERE Date LIKE '2024-03%' GROUP BY Category",
+}
+
+
+def timed(run, repeat: int):
+    """先執行一次暖快取，回傳 (中位數 ms, 結果)"""
+    result = run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較單一資料庫與依月份分區平行執行的彙總查詢')
+    parser.add_argument('--size', choices=sorted(SIZES), default=None, help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=SIZES['medium'])
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = SIZES[args.size] if args.size else args.rows
+    db_path = build_database(args.workdir, rows)['db_path']
+    # 分區由資料庫衍生，目錄名稱跟著資料庫 (筆數與 seed)
+    partition_dir = f'{os.path.splitext(db_path)[0]}-partitions'
+    with contextlib.closing(sqlite3.connect(db_path)) as conn, contextlib.redirect_stdout(io.StringIO()):
+        csv_to_sqlite.refresh_partitions(conn, partition_dir)
+
+    governor = QueryGovernor(max_seconds=0, max_vm_steps=0, max_rows=0, screen_plans=False)
+    results = {}
+    with contextlib.closing(sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)) as conn:
+        for name, sql in QUERIES.items():
+            results[name] = {'single': timed(lambda: conn.execute(sql).fetchall(), args.repeat)}
+    for workers in args.workers:
+        executor = PartitionedExecutor(partition_dir, governor, workers)
+        try:
+            for name, sql in QUERIES.items():
+                plan = executor.plan(sql)
+                results[name][workers] = timed(lambda: executor.execute(plan)[1], args.repeat)
+                results[name]['partitions'] = f'{len(plan.paths)}/{len(plan.paths) + plan.skipped}'
+        finally:
+            executor.close()
+
+    print(f"{rows:,} 筆，CPU {os.cpu_count()} 核")
+    header = f"{'query':<16}{'分區':>8}{'single ms':>12}" + ''.join(f"{f'{w} workers':>14}" for w in args.workers)
+    print(header)
+    mismatches = []
+    for name, entry in results.items():
+        single_ms, single_rows = entry['single']
+        line = f"{name:<16}{entry['partitions']:>8}{single_ms:>12.1f}"
+        for workers in args.workers:
+            ms, rows_ = entry[workers]
+            if not results_match(single_rows, rows_):
+                mismatches.append(f'{name} ({workers} workers)')
+            line += f"{ms:>9.1f} ({single_ms / ms:.1f}x)"
+        print(line)
+    if mismatches:
+        print(f"結果不一致: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
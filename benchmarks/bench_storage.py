@@ -0,0 +1,111 @@
+"""
+比較 plain 與 normalized (字典編碼) 儲存配置的資料庫大小與彙總查詢延遲
+
+兩種配置由同一份模擬 CSV 匯入，查詢直接對 sales 執行 (不經過彙總表改寫)，
+並確認兩邊結果相同。
+
+用法：
+    python benchmarks/bench_storage.py --size medium
+    python benchmarks/bench_storage.py --rows 200000 --repeat 5
+"""
+import argparse
+import contextlib
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_sales import SIZES, build_database  # noqa: E402
+import csv_to_sqlite  # noqa: E402
+
+QUERIES = {
+    'total': 'SELECT SUM([Net Sales]) FROM sales',
+    'by_item': 'SELECT Item, SUM(Qty), SUM([Net Sales]) FROM sales GROUP BY Item',
+    'location_range': "SELECT Location, SUM([Net Sales]) FROM sales "
+                      "WHERE Date BETWEEN '2024-03-01' AND '2024-05-31' GROUP BY Location",
+    'category_channel': 'SELECT Category, Channel, COUNT(*) FROM sales GROUP BY Category, Channel',
+    'item_filter': "SELECT [Dining Option], SUM([Net Sales]) FROM sales "
+                   "WHERE Item = '牛肉麵' GROUP BY [Dining Option]",
+    'location_daily': "SELECT Date, SUM(Qty) FROM sales WHERE Location = 'Flushing' "
+                      "GROUP BY Date ORDER BY Date LIMIT 30",
+}
+
+
+def database_size(db_path: str) -> dict:
+    """checkpoint WAL 後的檔案大小與頁數"""
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return {'bytes': os.path.getsize(db_path), 'pages': pages}
+
+
+def normalize(rows):
+    """排序並四捨五入浮點數，讓兩種配置的結果可以比較"""
+    return sorted(tuple(round(v, 4) if isinstance(v, float) else v for v in row) for row in rows)
+
+
+def measure_queries(db_path: str, repeat: int) -> dict:
+    """
+    每個查詢先執行一次暖快取，再取 repeat 次的中位數
+
+    Returns:
+        dict: 查詢名稱 → (中位數 ms, 正規化後的結果)
+    """
+    results = {}
+    with contextlib.closing(sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)) as conn:
+        for name, sql in QUERIES.items():
+            rows = conn.execute(sql).fetchall()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(sql).fetchall()
+                times.append((time.perf_counter() - start) * 1000)
+            results[name] = (statistics.median(times), normalize(rows))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 plain 與 normalized 儲存配置')
+    parser.add_argument('--size', choices=sorted(SIZES), default=None, help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=SIZES['small'])
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = SIZES[args.size] if args.size else args.rows
+    layouts = [csv_to_sqlite.LAYOUT_PLAIN, csv_to_sqlite.LAYOUT_NORMALIZED]
+    stats = {}
+    for layout in layouts:
+        build = build_database(args.workdir, rows, layout=layout)
+        stats[layout] = {
+            'build': build,
+            'size': database_size(build['db_path']),
+            'queries': measure_queries(build['db_path'], args.repeat),
+        }
+
+    plain, normalized = (stats[layout] for layout in layouts)
+    print(f"{rows:,} 筆")
+    print(f"{'':<20}{'plain':>12}{'normalized':>12}{'比例':>10}")
+    print(f"{'DB 大小 (MB)':<20}{plain['size']['bytes'] / 1e6:>12.1f}{normalized['size']['bytes'] / 1e6:>12.1f}"
+          f"{normalized['size']['bytes'] / plain['size']['bytes']:>10.2f}")
+    print(f"{'頁數':<20}{plain['size']['pages']:>12,}{normalized['size']['pages']:>12,}")
+    if not (plain['build'].get('reused') or normalized['build'].get('reused')):
+        print(f"{'匯入 (秒)':<20}{plain['build']['import_s']:>12.1f}{normalized['build']['import_s']:>12.1f}")
+    mismatches = []
+    for name in QUERIES:
+        plain_ms, plain_rows = plain['queries'][name]
+        normalized_ms, normalized_rows = normalized['queries'][name]
+        if plain_rows != normalized_rows:
+            mismatches.append(name)
+        print(f"{name + ' (ms)':<20}{plain_ms:>12.2f}{normalized_ms:>12.2f}{normalized_ms / plain_ms:>10.2f}")
+    if mismatches:
+        print(f"結果不一致: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+比較子字串搜尋 (LIKE '%...%') 直接掃描 sales 與改寫為 FTS5 trigram 索引後的延遲
+
+以模擬資料建立資料庫 (匯入時同時建立子字串搜尋索引)，每個查詢分別執行原始 SQL 與
+query_rewriter.rewrite_text_search 改寫後的 SQL，確認結果相同並比較中位數延遲。
+
+用法：
+    python benchmarks/bench_text_search.py --rows 3000000
+    python benchmarks/bench_text_search.py --size large --repeat 3
+"""
+import argparse
+import contextlib
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from query_rewriter import TEXT_SEARCH_TABLE, results_match, rewrite_text_search, rollup_is_current  # noqa: E402
+from synthetic_sales import SIZES, build_database  # noqa: E402
+
+QUERIES = {
+    'item_cjk': "SELECT COUNT(*), SUM(\"Net Sales\") FROM sales WHERE Item LIKE '%牛肉麵%'",
+    'item_short': "SELECT COUNT(*) FROM sales WHERE Item LIKE '%麵%'",
+    'item_rows': "SELECT Date, Item, Qty FROM sales WHERE Item LIKE '%matcha%' AND Location = 'Flushing' "
+                 "ORDER BY id LIMIT 100",
+    'category': "SELECT Category, SUM(Qty) FROM sales WHERE Category LIKE '%rice%' GROUP BY Category",
+    'modifiers': "SELECT COUNT(*) FROM sales WHERE \"Modifiers Applied\" LIKE '%Spicy%'",
+    'notes': "SELECT Date, Item, Notes FROM sales WHERE Notes LIKE '%生日%' ORDER BY id LIMIT 100",
+    'notes_count': "SELECT COUNT(*) FROM sales WHERE Notes LIKE '%peanut%'",
+}
+
+
+def timed(conn: sqlite3.Connection, sql: str, repeat: int):
+    """先執行一次暖快取，回傳 (中位數 ms, 結果)"""
+    rows = conn.execute(sql).fetchall()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 LIKE 掃描與子字串搜尋索引')
+    parser.add_argument('--size', choices=sorted(SIZES), default=None, help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=SIZES['medium'])
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = SIZES[args.size] if args.size else args.rows
+    db_path = build_database(args.workdir, rows)['db_path']
+    mismatches = []
+    with contextlib.closing(sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)) as conn:
+        if not rollup_is_current(conn, TEXT_SEARCH_TABLE):
+            print(f"{TEXT_SEARCH_TABLE} 不存在或尚未涵蓋所有資料，請刪除 {db_path} 後重新執行")
+            sys.exit(1)
+        values = conn.execute("SELECT COUNT(*) FROM sales_text_values").fetchone()[0]
+        print(f"{rows:,} 筆，子字串搜尋索引 {values:,} 個不重複值")
+        print(f"{'query':<14}{'LIKE ms':>12}{'FTS ms':>12}{'加速':>10}{'筆數':>10}")
+        for name, sql in QUERIES.items():
+            rewritten = rewrite_text_search(sql)
+            raw_ms, raw_rows = timed(conn, sql, args.repeat)
+            fts_ms, fts_rows = timed(conn, rewritten, args.repeat)
+            if not results_match(raw_rows, fts_rows):
+                mismatches.append(name)
+            print(f"{name:<14}{raw_ms:>12.2f}{fts_ms:>12.2f}{raw_ms / fts_ms:>10.1f}{len(raw_rows):>10}")
+    if mismatches:
+        print(f"結果不一致: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
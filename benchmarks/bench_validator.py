@@ -0,0 +1,112 @@
+"""
+比較 SQL 驗證器：舊版 (多次解析 + 字串掃描) 與單次解析 + 快取的 analyze_sql
+
+用法：
+    python benchmarks/bench_validator.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import sqlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql_validator import ALLOWED_TABLES, analyze_sql, validate_sql  # noqa: E402
+
+QUERIES = [
+    'SELECT SUM("Net Sales") FROM sales WHERE DATE(Date) = DATE(\'now\');',
+    'SELECT Item, SUM(Qty) AS total_quantity FROM sales GROUP BY Item ORDER BY total_quantity DESC LIMIT 10;',
+    "SELECT DISTINCT Item FROM sales WHERE Item LIKE '%牛肉麵%';",
+    # 模擬 LLM 產生的長 SQL
+    """
+    SELECT Location, Category, strftime('%Y-%m', Date) AS month,
+           SUM("Net Sales") AS net_sales, SUM("Gross Sales") AS gross_sales,
+           SUM(Qty) AS qty, COUNT(DISTINCT "Transaction ID") AS transactions,
+           AVG("Net Sales") AS avg_sale
+    FROM sales
+    WHERE Date BETWEEN '2025-01-01' AND '2025-03-31'
+      AND Location IN (SELECT Location FROM sales GROUP BY Location HAVING SUM("Net Sales") > 1000)
+      AND (Item LIKE '%Tea%' OR Item LIKE '%茶%' OR Category = 'Drinks')
+    GROUP BY Location, Category, month
+    HAVING SUM(Qty) > 10
+    ORDER BY net_sales DESC, qty DESC
+    LIMIT 100;
+    """,
+]
+
+
+def legacy_extract_tables(sql):
+    """舊版 extract_tables (會再解析一次)"""
+    tables = []
+    parsed = sqlparse.parse(sql)[0]
+
+    def extract_from_token(token):
+        if isinstance(token, sqlparse.sql.Identifier):
+            tables.append(token.get_name())
+        elif isinstance(token, sqlparse.sql.TokenList):
+            for sub_token in token.tokens:
+                extract_from_token(sub_token)
+
+    from_seen = False
+    for token in parsed.tokens:
+        if token.is_keyword and token.normalized == 'FROM':
+            from_seen = True
+            continue
+        if from_seen:
+            if token.is_whitespace:
+                continue
+            if isinstance(token, (sqlparse.sql.Identifier, sqlparse.sql.TokenList)):
+                extract_from_token(token)
+            break
+    return tables
+
+
+def legacy_validate_sql(sql):
+    """舊版 validate_sql"""
+    parsed = sqlparse.parse(sql)
+    if not parsed:
+        return False, "無效的 SQL 查詢"
+    stmt = parsed[0]
+    if stmt.get_type().upper() not in ['SELECT', 'SHOW', 'DESCRIBE', 'EXPLAIN']:
+        return False, "type"
+    sql_upper = sql.upper()
+    for keyword in ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'TRUNCATE', 'CREATE']:
+        if f" {keyword} " in f" {sql_upper} ":
+            return False, keyword
+    for table in legacy_extract_tables(sql):
+        if table.lower() not in ALLOWED_TABLES:
+            return False, table
+    return True, "SQL 查詢有效"
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sql in QUERIES:
+            fn(sql)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(QUERIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 SQL 驗證器效能')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    def cold(sql):
+        analyze_sql.cache_clear()
+        return validate_sql(sql)
+
+    legacy_us = timed(legacy_validate_sql, args.repeat)
+    cold_us = timed(cold, args.repeat)
+    warm_us = timed(validate_sql, args.repeat)
+
+    print(f"{'實作':<24}{'每次 (µs)':>12}{'倍數':>8}")
+    print(f"{'舊版 (兩次解析)':<24}{legacy_us:>12.1f}{1:>8.2f}")
+    print(f"{'單次解析 (無快取)':<24}{cold_us:>12.1f}{legacy_us / cold_us:>8.2f}")
+    print(f"{'單次解析 (快取命中)':<24}{warm_us:>12.1f}{legacy_us / warm_us:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+產生與 POS 匯出格式相同的模擬銷售 CSV，並以 database/csv_to_sqlite.py 匯入
+
+用法：
+    python benchmarks/synthetic_sales.py --rows 1000000 --workdir /tmp/vanna-bench
+"""
+import argparse
+import contextlib
+import io
+import os
+import resource
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'database'))
+
+import csv_to_sqlite  # noqa: E402
+
+# 資料集大小
+SIZES = {'small': 10_000, 'medium': 1_000_000, 'large': 10_000_000}
+
+# POS 匯出檔的欄位順序
+CSV_COLUMNS = [
+    'Date', 'Time', 'Time Zone', 'Category', 'Item', 'Qty', 'Price Point Name', 'SKU',
+    'Modifiers Applied', 'Gross Sales', 'Discounts', 'Net Sales', 'Tax', 'Transaction ID',
+    'Payment ID', 'Device Name', 'Notes', 'Details', 'Event Type', 'Location', 'Dining Option',
+    'Customer ID', 'Customer Name', 'Customer Reference ID', 'Unit', 'Count', 'GTIN',
+    'Itemization Type', 'Fulfillment Note', 'Channel', 'Token'
+]
+
+# (類別, 品項, 單價)
+CATALOG = [
+    ('Noodles', '牛肉麵', 15.95), ('Noodles', '紅燒牛肉麵 Braised Beef Noodles', 16.95),
+    ('Noodles', '炸醬麵', 12.50), ('Rice', '滷肉飯', 9.95), ('Rice', '雞肉飯 Chicken Rice', 10.50),
+    ('Drinks', 'Black Tea 蜜香紅茶', 5.25), ('Drinks', 'Matcha Latte', 6.50),
+    ('Drinks', 'Drip Coffee', 3.75), ('Drinks', '珍珠奶茶 Bubble Tea', 6.25),
+    ('Dessert', 'Cheese cake', 7.00), ('Dessert', '豆花', 5.50), ('Snacks', '鹽酥雞', 8.95),
+]
+LOCATIONS = ['Flushing', 'Manhattan', 'Brooklyn', 'Queens Center']
+MODIFIERS = ['', '', '', 'Less Ice', 'No Sugar', 'Extra Spicy', 'Add Egg']
+DINING_OPTIONS = ['For Here', 'To Go', 'Delivery']
+# 約 5% 的明細有備註，附上桌號讓備註有較多不重複值
+NOTES = ['Birthday 生日蠟燭', '少辣 less spicy', 'Extra napkins', '外帶餐具 utensils', 'Allergy: peanuts 花生過敏']
+NOTE_RATE = 0.05
+CHANNELS = ['Register', 'Online', 'Kiosk']
+TAX_RATE = 0.08875
+CHUNK_ROWS = 250_000
+FILE_ROWS = 1_000_000
+
+
+def make_chunk(rng, start_row: int, rows: int, start_date: str, days: int) -> pd.DataFrame:
+    """產生一批模擬明細 (每筆交易平均 2 個品項)"""
+    catalog = np.array(CATALOG, dtype=object)
+    picks = rng.integers(0, len(CATALOG), rows)
+    qty = rng.integers(1, 4, rows)
+    price = catalog[picks, 2].astype(float)
+    gross = np.round(price * qty, 2)
+    discount = np.where(rng.random(rows) < 0.1, np.round(gross * 0.1, 2), 0.0)
+    net = np.round(gross - discount, 2)
+    tax = np.round(net * TAX_RATE, 2)
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(rng.integers(0, days, rows), unit='D')
+    seconds = rng.integers(10 * 3600, 22 * 3600, rows)
+    transaction = (start_row + np.arange(rows)) // 2
+
+    def currency(values):
+        return pd.Series(values).map('${:,.2f}'.format)
+
+    frame = pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Time': pd.to_datetime(seconds, unit='s').strftime('%H:%M:%S'),
+        'Time Zone': 'Eastern Time (US & Canada)',
+        'Category': catalog[picks, 0],
+        'Item': catalog[picks, 1],
+        'Qty': qty,
+        'Price Point Name': 'Regular',
+        'SKU': '',
+        'Modifiers Applied': np.array(MODIFIERS)[rng.integers(0, len(MODIFIERS), rows)],
+        'Gross Sales': currency(gross),
+        'Discounts': pd.Series(-discount).map(lambda v: f"-${-v:,.2f}" if v else '$0.00'),
+        'Net Sales': currency(net),
+        'Tax': currency(tax),
+        'Transaction ID': pd.Series(transaction).map('T{:09d}'.format),
+        'Payment ID': pd.Series(transaction).map('P{:09d}'.format),
+        'Device Name': 'iPad',
+        'Notes': '',
+        'Details': '',
+        'Event Type': 'Payment',
+        'Location': np.array(LOCATIONS)[rng.integers(0, len(LOCATIONS), rows)],
+        'Dining Option': np.array(DINING_OPTIONS)[rng.integers(0, len(DINING_OPTIONS), rows)],
+        'Customer ID': '',
+        'Customer Name': '',
+        'Customer Reference ID': '',
+        'Unit': 'ea',
+        'Count': 1,
+        'GTIN': '',
+        'Itemization Type': 'Itemized Sale',
+        'Fulfillment Note': '',
+        'Channel': np.array(CHANNELS)[rng.integers(0, len(CHANNELS), rows)],
+        'Token': '',
+    }, columns=CSV_COLUMNS)
+    # 最後才抽備註，其他欄位與沒有備註時的資料相同
+    has_note = rng.random(rows) < NOTE_RATE
+    notes = pd.Series(np.array(NOTES, dtype=object)[rng.integers(0, len(NOTES), rows)])
+    tables = pd.Series(rng.integers(1, 60, rows)).astype(str)
+    frame['Notes'] = (notes + ' (table ' + tables + ')').where(has_note, '')
+    return frame
+
+
+def write_sales_csv(csv_folder: str, rows: int, seed: int = 42, start_date: str = '2024-01-01',
+                    days: int = 540) -> list:
+    """
+    寫入模擬銷售 CSV (每個檔案最多 FILE_ROWS 筆)，內容由 seed 決定
+
+    Returns:
+        list: 產生的檔案路徑
+    """
+    os.makedirs(csv_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    written = 0
+    while written < rows:
+        path = os.path.join(csv_folder, f'sales-{len(paths):03d}.csv')
+        file_rows = min(FILE_ROWS, rows - written)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            done = 0
+            while done < file_rows:
+                count = min(CHUNK_ROWS, file_rows - done)
+                make_chunk(rng, written + done, count, start_date, days).to_csv(
+                    f, index=False, header=(done == 0))
+                done += count
+        written += file_rows
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb() -> float:
+    """目前行程 (含已結束的子行程) 的最高 RSS (MB)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def build_database(workdir: str, rows: int, seed: int = 42, mode: str = 'streaming',
+                   quiet: bool = True, layout: str = csv_to_sqlite.LAYOUT_PLAIN) -> dict:
+    """
+    產生 CSV 並匯入 SQLite，同一組筆數與 seed 的資料庫已存在且筆數相同時直接沿用
+    (CSV 目錄與資料庫檔名都包含筆數與 seed；normalized 配置的資料庫檔名加上 -normalized，
+    與 plain 配置共用同一份 CSV)
+
+    Returns:
+        dict: 資料庫路徑、筆數、產生與匯入時間、匯入速度與最高 RSS
+    """
+    csv_folder = os.path.join(workdir, f'csv-{rows}-seed{seed}')
+    suffix = '' if layout == csv_to_sqlite.LAYOUT_PLAIN else f'-{layout}'
+    db_path = os.path.join(workdir, f'sales-{rows}-seed{seed}{suffix}.db')
+    result = {'db_path': db_path, 'rows': rows, 'seed': seed, 'generate_s': 0.0, 'import_s': 0.0, 'import_rows_per_s': None}
+
+    if os.path.exists(db_path):
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            try:
+                existing = conn.execute("SELECT SUM(row_count) FROM import_manifest").fetchone()[0]
+            except sqlite3.Error:
+                existing = None
+        if existing == rows:
+            result['reused'] = True
+            result['peak_rss_mb'] = peak_rss_mb()
+            return result
+        os.remove(db_path)
+
+    start = time.perf_counter()
+    if not os.path.isdir(csv_folder) or not os.listdir(csv_folder):
+        write_sales_csv(csv_folder, rows, seed)
+    result['generate_s'] = time.perf_counter() - start
+
+    output = io.StringIO() if quiet else sys.stdout
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        if mode == 'parallel':
+            csv_to_sqlite.import_csv_parallel(csv_folder, db_path, layout=layout)
+        else:
+            csv_to_sqlite.import_csv_streaming(csv_folder, db_path, layout=layout)
+    result['import_s'] = time.perf_counter() - start
+    result['import_rows_per_s'] = rows / result['import_s'] if result['import_s'] else None
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='產生並匯入模擬銷售資料')
+    parser.add_argument('--size', choices=sorted(SIZES), default=None, help='small=10k, medium=1M, large=10M')
+    parser.add_argument('--rows', type=int, default=SIZES['small'])
+    parser.add_argument('--workdir', default='/tmp/vanna-bench')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mode', choices=['streaming', 'parallel'], default='streaming')
+    parser.add_argument('--layout', choices=[csv_to_sqlite.LAYOUT_PLAIN, csv_to_sqlite.LAYOUT_NORMALIZED],
+                        default=csv_to_sqlite.LAYOUT_PLAIN)
+    args = parser.parse_args()
+
+    rows = SIZES[args.size] if args.size else args.rows
+    stats = build_database(args.workdir, rows, args.seed, args.mode, quiet=False, layout=args.layout)
+    print(f"資料庫: {stats['db_path']} ({rows:,} 筆)")
+    print(f"產生 CSV {stats['generate_s']:.1f} 秒，匯入 {stats['import_s']:.1f} 秒"
+          + (f"，{stats['import_rows_per_s']:,.0f} rows/sec" if stats['import_rows_per_s'] else ''))
+    print(f"最高 RSS {stats['peak_rss_mb']:.0f} MB")
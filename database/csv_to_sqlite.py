@@ -1,9 +1,60 @@
+import argparse
+import csv
+import hashlib
+import shutil
 import sqlite3
+import tempfile
+import time
 import pandas as pd
 import os
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tabulate import tabulate
 
+# 需要轉換的貨幣欄位
+CURRENCY_COLUMNS = ['Gross Sales', 'Net Sales', 'Tax', 'Discounts']
+# 數值欄位
+NUMERIC_COLUMNS = {'Qty', 'Gross Sales', 'Discounts', 'Net Sales', 'Tax', 'Count'}
+# day_key 的起算日
+EPOCH = pd.Timestamp('1970-01-01')
+# sales 的覆蓋索引：索引名稱 → 欄位 (附上常用的彙總欄位以免回表)
+SALES_INDEXES = {
+    'idx_sales_date_location': '[Date], [Location], [Net Sales], [Qty]',
+    'idx_sales_item_date': '[Item], [Date], [Qty], [Net Sales]',
+    'idx_sales_category': '[Category], [Net Sales], [Qty]',
+    'idx_sales_day_key': '[day_key]',
+}
+# 每日彙總表 sales_daily 的維度與加總欄位 (與 query_rewriter.py 一致)
+ROLLUP_DIMENSIONS = ['Date', 'day_key', 'Item', 'Category', 'Location']
+ROLLUP_MEASURES = ['Qty', 'Gross Sales', 'Discounts', 'Net Sales', 'Tax']
+# 串流匯入時每次讀取的筆數
+DEFAULT_CHUNKSIZE = 50000
+# 去除重複明細：有 Transaction ID 或 Payment ID 的資料列以交易 ID、品項內容 (LINE_IDENTITY_COLUMNS) 與
+# 在同一交易中第幾次出現識別 (同一筆交易可有多個相同品項)，兩者皆空時以原始資料列的 hash 識別
+DEDUP_ID_COLUMNS = ['Transaction ID', 'Payment ID']
+LINE_IDENTITY_COLUMNS = ['Item', 'Price Point Name', 'SKU', 'Modifiers Applied']
+# rollup_state 中記錄 row_key 已使用上述格式的名稱 (舊版資料庫的 row_key 一律為原始資料列的 hash)
+ROW_KEY_STATE = 'sales_row_keys'
+# 子字串搜尋 (LIKE '%...%') 的 FTS5 trigram 索引涵蓋的欄位 (與 query_rewriter.py 一致)
+TEXT_SEARCH_COLUMNS = ['Item', 'Category', 'Modifiers Applied', 'Notes']
+# 沒有既有索引的搜尋欄位：改寫後的 IN (...) 以這些索引找出資料列
+TEXT_SEARCH_INDEXES = {
+    'idx_sales_modifiers': '[Modifiers Applied]',
+    'idx_sales_notes': '[Notes]',
+}
+# 依月份分區：每個月份一個 SQLite 檔 sales-YYYY-MM.db，Date 為空值的資料列放在 sales-unknown.db
+# (檔名與 partition_executor.py 一致)；主資料庫仍保有完整資料，分區檔由 refresh_partitions 增量維護
+PARTITION_STATE = 'sales_partitions'
+UNKNOWN_PARTITION = 'unknown'
+# 儲存配置：plain 直接以文字儲存於 sales 表；normalized 將重複的文字欄位
+# 以整數代碼存於 sales_fact，文字值存於 dict_* 查詢表，再以 sales view 還原原本的欄位
+LAYOUT_PLAIN = 'plain'
+LAYOUT_NORMALIZED = 'normalized'
+SALES_FACT_TABLE = 'sales_fact'
+# normalized 配置中以字典編碼儲存的欄位
+DICTIONARY_COLUMNS = ['Item', 'Category', 'Location', 'Device Name', 'Dining Option', 'Channel',
+                      'Time Zone', 'Event Type']
+
 def clean_currency(value):
     """
     處理美金 (USD) 貨幣字串轉換為浮點數：
@@ -29,12 +80,903 @@ def clean_date(value):
         print(f"日期解析錯誤: {value} ({str(e)})")
         return None
 
+def clean_currency_series(series):
+    """
+    clean_currency 的向量化版本：移除 '$' 與逗號後轉為浮點數，
+    無法解析的字串轉為 0.0，空值維持空值
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    text = series.astype('string').str.replace(r'[$,]', '', regex=True).str.strip()
+    numbers = pd.to_numeric(text, errors='coerce')
+    return numbers.where(numbers.notna() | series.isna(), 0.0).astype(float)
+
+def clean_date_series(series):
+    """
+    clean_date 的向量化版本：先以推斷出的單一格式整欄解析，
+    解析失敗的值再逐一以 mixed 格式補解析，轉為 'YYYY-MM-DD'，空值轉為 None
+    """
+    text = series.astype('string').str.strip()
+    text = text.mask(text.str.lower().isin(['', 'nan', 'nat', 'none', 'null']))
+    parsed = pd.to_datetime(text, errors='coerce')
+    retry = parsed.isna() & text.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(text[retry], errors='coerce', format='mixed')
+        failed = parsed.isna() & text.notna()
+        if failed.any():
+            print(f"日期解析錯誤: {failed.sum()} 筆，例如 {text[failed].iloc[0]}")
+    return parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None)
+
+def sales_column_type(col):
+    """依欄位名稱判斷 SQLite 欄位型別"""
+    if col in NUMERIC_COLUMNS:
+        return 'REAL'
+    lowered = col.lower()
+    # 名稱與代碼欄位 (例如 Price Point Name) 即使含有關鍵字也是文字
+    if 'name' in lowered or 'id' in lowered.split():
+        return 'TEXT'
+    if any(kw in lowered for kw in ['price', 'sales', 'tax', 'amount', 'qty']):
+        return 'REAL'
+    return 'TEXT'  # SQLite沒有DATE類型，日期以 'YYYY-MM-DD' TEXT 儲存，另有 day_key 整數欄位
+
+def add_day_key(df):
+    """依已清理的 Date ('YYYY-MM-DD') 計算 day_key (1970-01-01 起算的天數)"""
+    dates = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
+    days = (dates - EPOCH).dt.days
+    df['day_key'] = days.astype(object).where(days.notna(), None)
+    return df
+
+def dictionary_table(col):
+    """字典編碼欄位的查詢表名稱，例如 Device Name → dict_device_name"""
+    return 'dict_' + col.lower().replace(' ', '_')
+
+def sales_layout(conn):
+    """
+    判斷既有資料庫的儲存配置
+
+    Returns:
+        str: LAYOUT_PLAIN、LAYOUT_NORMALIZED，尚未建立 sales 時為 None
+    """
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'sales'").fetchone()
+    if row is None:
+        return None
+    return LAYOUT_NORMALIZED if row[0] == 'view' else LAYOUT_PLAIN
+
+def sales_storage_table(conn):
+    """實際儲存明細的表格：plain 為 sales，normalized 為 sales_fact"""
+    return SALES_FACT_TABLE if sales_layout(conn) == LAYOUT_NORMALIZED else 'sales'
+
+def ensure_day_key(conn):
+    """新增 day_key 欄位，並為既有資料補上數值"""
+    table = sales_storage_table(conn)
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if 'day_key' in columns:
+        return
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN day_key INTEGER")
+    cursor = conn.execute(
+        f"UPDATE {table} SET day_key = CAST(julianday(Date) - 2440587.5 AS INTEGER) WHERE Date IS NOT NULL"
+    )
+    conn.commit()
+    print(f"Debug: 新增 day_key 欄位，補上 {cursor.rowcount:,} 筆")
+
+def ensure_sales_indexes(conn):
+    """
+    建立 sales 的覆蓋索引 (首次匯入時在寫入資料後建立，比逐筆維護快)：
+    - (Date, Location)：依日期篩選、依分店彙總
+    - (Item, Date)：依品項彙總或查詢品項的銷售期間
+    - (Category)：依類別彙總
+    - (day_key)：以整數日期做範圍查詢
+    normalized 配置建立在 sales_fact 上，Item 等欄位為整數代碼
+    """
+    start = time.perf_counter()
+    table = sales_storage_table(conn)
+    for name, columns in SALES_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Debug: 索引檢查完成，{time.perf_counter() - start:.2f} 秒")
+
+def refresh_rollups(conn):
+    """
+    增量更新每日彙總表 sales_daily (日期 × 品項 × 類別 × 分店)
+
+    只彙總上次更新後新增的資料列 (id 大於 rollup_state.last_id)，
+    結果直接附加為新的部分彙總列；查詢時再以 SUM 合併，因此不需要更新既有列。
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sales)")}
+    missing = [col for col in ROLLUP_DIMENSIONS + ROLLUP_MEASURES if col not in columns]
+    if missing:
+        print(f"Debug: sales 缺少欄位 {missing}，略過彙總表")
+        return
+
+    dims = ', '.join(f'[{col}]' for col in ROLLUP_DIMENSIONS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            {', '.join(f'[{col}] {"INTEGER" if col == "day_key" else "TEXT"}' for col in ROLLUP_DIMENSIONS)},
+            {', '.join(f'[{col}] REAL' for col in ROLLUP_MEASURES)},
+            row_count INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_daily_date ON sales_daily ([Date], [Location], [Item])")
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+
+    start = time.perf_counter()
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sales_daily'").fetchone()
+    last_id = row[0] if row else 0
+    max_id = conn.execute("SELECT MAX(id) FROM sales").fetchone()[0] or 0
+    if max_id <= last_id:
+        return
+    sums = ', '.join(f'SUM([{col}])' for col in ROLLUP_MEASURES)
+    cursor = conn.execute(f'''
+        INSERT INTO sales_daily
+        SELECT {dims}, {sums}, COUNT(*)
+        FROM sales
+        WHERE id > ? AND id <= ?
+        GROUP BY {dims}
+    ''', (last_id, max_id))
+    conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('sales_daily', ?)", (max_id,))
+    conn.commit()
+    print(f"Debug: 彙總表新增 {cursor.rowcount:,} 列 (sales id {last_id + 1}-{max_id})，"
+          f"{time.perf_counter() - start:.2f} 秒")
+
+def ensure_item_catalog(conn):
+    """建立品項目錄 item_catalog：每個品項一列 (Item 為 NULL 的資料列也合併為一列)"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS item_catalog (
+            item_id INTEGER PRIMARY KEY,
+            [Item] TEXT UNIQUE,
+            first_date TEXT,
+            last_date TEXT,
+            row_count INTEGER NOT NULL,
+            {', '.join(f'[{col}] REAL' for col in ROLLUP_MEASURES)}
+        )
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+
+def refresh_item_catalog(conn):
+    """
+    增量更新品項目錄 item_catalog (品項、首次與最後銷售日期、筆數與加總欄位)
+
+    只彙總上次更新後新增的資料列 (id 大於 rollup_state 中 item_catalog 的 last_id)，
+    並合併到既有的品項列，目錄大小與品項數相同。
+
+    Returns:
+        bool: 目錄是否有變更
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sales)")}
+    missing = [col for col in ['Date', 'Item'] + ROLLUP_MEASURES if col not in columns]
+    if missing:
+        print(f"Debug: sales 缺少欄位 {missing}，略過品項目錄")
+        return False
+    ensure_item_catalog(conn)
+
+    start = time.perf_counter()
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'item_catalog'").fetchone()
+    last_id = row[0] if row else 0
+    max_id = conn.execute("SELECT MAX(id) FROM sales").fetchone()[0] or 0
+    if max_id <= last_id:
+        return False
+
+    measures = ', '.join(f'[{col}]' for col in ROLLUP_MEASURES)
+    sums = ', '.join(f'SUM([{col}])' for col in ROLLUP_MEASURES)
+    # 部分加總合併：任一邊為 NULL 時取另一邊，與直接對原始資料 SUM 的結果相同
+    merge = ',\n'.join(
+        f'[{col}] = CASE WHEN [{col}] IS NULL THEN excluded.[{col}] '
+        f'WHEN excluded.[{col}] IS NULL THEN [{col}] ELSE [{col}] + excluded.[{col}] END'
+        for col in ROLLUP_MEASURES
+    )
+    cursor = conn.execute(f'''
+        INSERT INTO item_catalog ([Item], first_date, last_date, row_count, {measures})
+        SELECT [Item], MIN([Date]), MAX([Date]), COUNT(*), {sums}
+        FROM sales
+        WHERE id > ? AND id <= ? AND [Item] IS NOT NULL
+        GROUP BY [Item]
+        ON CONFLICT ([Item]) DO UPDATE SET
+            first_date = CASE WHEN first_date IS NULL OR excluded.first_date < first_date
+                              THEN excluded.first_date ELSE first_date END,
+            last_date = CASE WHEN last_date IS NULL OR excluded.last_date > last_date
+                             THEN excluded.last_date ELSE last_date END,
+            row_count = row_count + excluded.row_count,
+            {merge}
+    ''', (last_id, max_id))
+    changed_items = cursor.rowcount
+
+    # UNIQUE 不會讓 NULL 衝突，Item 為 NULL 的資料列另外合併
+    null_row = conn.execute(
+        f"SELECT MIN([Date]), MAX([Date]), COUNT(*), {sums} FROM sales "
+        "WHERE id > ? AND id <= ? AND [Item] IS NULL",
+        (last_id, max_id)
+    ).fetchone()
+    if null_row[2]:
+        changed_items += 1
+        updated = conn.execute(f'''
+            UPDATE item_catalog SET
+                first_date = CASE WHEN first_date IS NULL OR ?1 < first_date THEN ?1 ELSE first_date END,
+                last_date = CASE WHEN last_date IS NULL OR ?2 > last_date THEN ?2 ELSE last_date END,
+                row_count = row_count + ?3,
+                {', '.join(f"[{col}] = CASE WHEN [{col}] IS NULL THEN ?{i} WHEN ?{i} IS NULL THEN [{col}] "
+                           f"ELSE [{col}] + ?{i} END" for i, col in enumerate(ROLLUP_MEASURES, start=4))}
+            WHERE [Item] IS NULL
+        ''', null_row).rowcount
+        if not updated:
+            conn.execute(
+                f"INSERT INTO item_catalog ([Item], first_date, last_date, row_count, {measures}) "
+                f"VALUES (NULL, {', '.join('?' for _ in null_row)})",
+                null_row
+            )
+
+    conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('item_catalog', ?)", (max_id,))
+    conn.commit()
+    print(f"Debug: 品項目錄更新 {changed_items:,} 個品項 (sales id {last_id + 1}-{max_id})，"
+          f"{time.perf_counter() - start:.2f} 秒")
+    return True
+
+def ensure_text_search(conn):
+    """
+    建立子字串搜尋用的結構：
+    - sales_text_values：各搜尋欄位的不重複值 (欄位名稱, 值)
+    - sales_text_fts：以 sales_text_values 為內容的 FTS5 trigram 索引 (不分大小寫，中文也適用)
+    - Modifiers Applied / Notes 的索引 (Item、Category 已有 SALES_INDEXES)
+
+    Returns:
+        bool: 是否建立成功 (SQLite 不支援 FTS5 trigram 時為 False)
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_text_values (
+            id INTEGER PRIMARY KEY,
+            [column] TEXT NOT NULL,
+            value TEXT NOT NULL,
+            UNIQUE ([column], value)
+        )
+    """)
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS sales_text_fts USING fts5("
+            "value, content='sales_text_values', content_rowid='id', tokenize='trigram')"
+        )
+    except sqlite3.OperationalError as e:
+        print(f"Debug: SQLite 不支援 FTS5 trigram ({e})，略過子字串搜尋索引")
+        return False
+    table = sales_storage_table(conn)
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column in TEXT_SEARCH_INDEXES.items():
+        if column.strip('[]') in columns:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+    conn.commit()
+    return True
+
+def refresh_text_search(conn):
+    """
+    增量更新子字串搜尋索引
+
+    只讀取上次更新後新增的資料列 (id 大於 rollup_state 中 sales_text_fts 的 last_id)，
+    把尚未出現過的欄位值加入 sales_text_values 與 FTS 索引；索引大小與不重複值的數量相同，
+    不隨資料列數成長。
+
+    Returns:
+        bool: 索引是否有變更
+    """
+    if not ensure_text_search(conn):
+        return False
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sales)")}
+    search_columns = [col for col in TEXT_SEARCH_COLUMNS if col in columns]
+    if not search_columns:
+        print("Debug: sales 沒有可搜尋的文字欄位，略過子字串搜尋索引")
+        return False
+
+    start = time.perf_counter()
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sales_text_fts'").fetchone()
+    last_id = row[0] if row else 0
+    max_id = conn.execute("SELECT MAX(id) FROM sales").fetchone()[0] or 0
+    if max_id <= last_id:
+        return False
+
+    last_value_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales_text_values").fetchone()[0]
+    for col in search_columns:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO sales_text_values ([column], value)
+            SELECT DISTINCT ?, [{col}] FROM sales
+            WHERE id > ? AND id <= ? AND [{col}] IS NOT NULL
+        ''', (col, last_id, max_id))
+    cursor = conn.execute(
+        "INSERT INTO sales_text_fts (rowid, value) SELECT id, value FROM sales_text_values WHERE id > ?",
+        (last_value_id,)
+    )
+    conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('sales_text_fts', ?)", (max_id,))
+    conn.commit()
+    print(f"Debug: 子字串搜尋索引新增 {cursor.rowcount:,} 個值 (sales id {last_id + 1}-{max_id})，"
+          f"{time.perf_counter() - start:.2f} 秒")
+    return True
+
+def partition_path(partition_dir, month):
+    """月份 (YYYY-MM 或 unknown) 對應的分區檔"""
+    return os.path.join(partition_dir, f'sales-{month}.db')
+
+def refresh_partitions(conn, partition_dir):
+    """
+    增量更新依月份分區的資料庫檔 (供 partition_executor.py 平行查詢)
+
+    只複製上次更新後新增的資料列 (id 大於 rollup_state 中 sales_partitions 的 last_id)：
+    依 Date 的月份 ATTACH 對應的分區檔並附加到其中的 sales 表 (id 與主資料庫相同)，
+    再建立與主資料庫相同的索引。normalized 配置由 sales view 讀取，分區檔一律以文字儲存。
+
+    Returns:
+        bool: 分區是否有變更
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+    conn.commit()
+    start = time.perf_counter()
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (PARTITION_STATE,)).fetchone()
+    last_id = row[0] if row else 0
+    max_id = conn.execute("SELECT MAX(id) FROM sales").fetchone()[0] or 0
+    if max_id <= last_id:
+        return False
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sales)") if row[1] != 'id']
+    types = {'day_key': 'INTEGER', 'row_key': 'TEXT'}
+    definitions = ', '.join(f'[{col}] {types.get(col) or sales_column_type(col)}' for col in columns)
+    column_list = ', '.join(['id'] + [f'[{col}]' for col in columns])
+    months = [month or UNKNOWN_PARTITION for (month,) in conn.execute(
+        "SELECT DISTINCT substr(Date, 1, 7) FROM sales WHERE id > ? AND id <= ?", (last_id, max_id)
+    )]
+    copied = 0
+    for month in sorted(months):
+        # Date 為 'YYYY-MM-DD'，以範圍條件篩選可使用 (Date, Location) 索引
+        if month == UNKNOWN_PARTITION:
+            condition, params = "Date IS NULL", ()
+        else:
+            condition, params = "Date BETWEEN ? AND ?", (f'{month}-01', f'{month}-31')
+        conn.execute("ATTACH DATABASE ? AS part", (partition_path(partition_dir, month),))
+        try:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS part.sales (id INTEGER PRIMARY KEY, {definitions})")
+            cursor = conn.execute(f'''
+                INSERT OR IGNORE INTO part.sales ({column_list})
+                SELECT {column_list} FROM main.sales
+                WHERE id > ? AND id <= ? AND {condition}
+            ''', (last_id, max_id) + params)
+            copied += cursor.rowcount
+            for name, index_columns in SALES_INDEXES.items():
+                if all(col.strip('[]') in columns for col in index_columns.split(', ')):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS part.{name} ON sales ({index_columns})")
+            conn.execute("ANALYZE part")
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE part")
+    conn.execute("INSERT OR REPLACE INTO rollup_state VALUES (?, ?)", (PARTITION_STATE, max_id))
+    conn.commit()
+    print(f"Debug: 分區新增 {copied:,} 筆到 {len(months)} 個月份 (sales id {last_id + 1}-{max_id})，"
+          f"{time.perf_counter() - start:.2f} 秒")
+    return True
+
+def ensure_sales_table(conn, csv_columns, layout=None):
+    """
+    依 CSV 欄位建立 sales 表 (已存在時不變更)
+
+    layout 為 normalized 時改為建立 sales_fact、各欄位的 dict_* 查詢表與 sales view
+    (補上 row_key、day_key 後需再呼叫 ensure_sales_view)。既有資料庫沿用原本的配置，
+    新資料庫未指定 layout 時為 plain。
+
+    Returns:
+        str: 實際使用的儲存配置
+    """
+    existing = sales_layout(conn)
+    if existing is not None:
+        if layout is not None and existing != layout:
+            print(f"Debug: 資料庫已使用 {existing} 配置，忽略 layout={layout}")
+        return existing
+
+    layout = layout or LAYOUT_PLAIN
+    table = 'sales'
+    if layout == LAYOUT_NORMALIZED:
+        table = SALES_FACT_TABLE
+        for col in csv_columns:
+            if col in DICTIONARY_COLUMNS:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {dictionary_table(col)} "
+                    "(id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)"
+                )
+    columns = [
+        f'[{col}] {"INTEGER" if table == SALES_FACT_TABLE and col in DICTIONARY_COLUMNS else sales_column_type(col)}'
+        for col in csv_columns
+    ]
+    create_table_sql = f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        {', '.join(columns)}
+    )
+    '''
+    conn.execute(create_table_sql)
+    conn.commit()
+    if layout == LAYOUT_NORMALIZED:
+        ensure_sales_view(conn)
+    return layout
+
+def indexed_dictionary_columns():
+    """出現在 SALES_INDEXES 中的字典編碼欄位 (sales_fact 上有以代碼建立的索引)"""
+    indexed = ' '.join(SALES_INDEXES.values())
+    return [col for col in DICTIONARY_COLUMNS if f'[{col}]' in indexed]
+
+def ensure_sales_view(conn):
+    """
+    (重新) 建立 normalized 配置的 sales view：欄位名稱與順序與 plain 配置的 sales 表相同
+
+    sales_fact 上有索引的字典欄位 (Item、Category、Location) 以 LEFT JOIN dict_* 還原為文字
+    (代碼為 NULL 時仍為 NULL)：以文字值過濾時 (例如 Item = ...、Item IN (...)) 先由 dict_*.value 的
+    唯一索引找到代碼，再使用 sales_fact 的索引。SQLite 不會在彙總查詢中省略沒有用到的 LEFT JOIN，
+    每個 JOIN 都讓每一列多一次查詢，因此沒有索引可用的其他字典欄位仍以純量子查詢還原，
+    只在查詢實際用到該欄位時才查詢 dict_* 表。
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({SALES_FACT_TABLE})")]
+    joined = [col for col in indexed_dictionary_columns() if col in columns]
+    select = []
+    for col in columns:
+        if col in joined:
+            select.append(f'{dictionary_table(col)}.value AS [{col}]')
+        elif col in DICTIONARY_COLUMNS:
+            select.append(f'(SELECT value FROM {dictionary_table(col)} WHERE id = f.[{col}]) AS [{col}]')
+        else:
+            select.append(f'f.[{col}]')
+    joins = ''.join(
+        f' LEFT JOIN {dictionary_table(col)} ON {dictionary_table(col)}.id = f.[{col}]' for col in joined
+    )
+    conn.execute("DROP VIEW IF EXISTS sales")
+    conn.execute(f"CREATE VIEW sales AS SELECT {', '.join(select)} FROM {SALES_FACT_TABLE} f{joins}")
+    conn.commit()
+
+class DictionaryEncoder:
+    """
+    normalized 配置的字典編碼：將文字欄位換成 dict_* 查詢表中的整數代碼
+
+    代碼對照表保留在記憶體中，新出現的值在同一個交易中寫入查詢表；
+    交易 rollback 後需呼叫 reload 與資料庫重新同步。
+    """
+
+    def __init__(self, conn, columns):
+        self.conn = conn
+        self.columns = [col for col in DICTIONARY_COLUMNS if col in columns]
+        self.reload()
+
+    def reload(self):
+        self.codes = {
+            col: dict(self.conn.execute(f"SELECT value, id FROM {dictionary_table(col)}"))
+            for col in self.columns
+        }
+
+    def encode(self, chunk):
+        """將一批資料的字典欄位換成整數代碼 (空值維持空值)"""
+        for col in self.columns:
+            if col not in chunk.columns:
+                continue
+            codes = self.codes[col]
+            new_values = [value for value in chunk[col].dropna().unique() if value not in codes]
+            if new_values:
+                next_id = max(codes.values(), default=0) + 1
+                added = {value: next_id + i for i, value in enumerate(new_values)}
+                self.conn.executemany(
+                    f"INSERT INTO {dictionary_table(col)} (id, value) VALUES (?, ?)",
+                    ((code, value) for value, code in added.items())
+                )
+                codes.update(added)
+            chunk[col] = chunk[col].map(codes).astype('Int64')
+        return chunk
+
+def sniff_delimiter(csv_path, sample_bytes=64 * 1024):
+    """只讀取檔案開頭一次來判斷分隔符號"""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        sample = f.read(sample_bytes)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        return ','
+
+def clean_chunk(chunk):
+    """以向量化運算清理一批資料：日期、貨幣與其他數值欄位"""
+    if 'Date' in chunk.columns:
+        chunk['Date'] = clean_date_series(chunk['Date'])
+    for col in chunk.columns:
+        if col in CURRENCY_COLUMNS:
+            chunk[col] = clean_currency_series(chunk[col])
+        elif sales_column_type(col) == 'REAL':
+            # 與 to_sql 相同：能轉成數值的轉為數值，其餘保留原字串
+            numbers = pd.to_numeric(chunk[col], errors='coerce')
+            chunk[col] = numbers.astype(object).where(numbers.notna(), chunk[col])
+    return chunk
+
+def apply_bulk_load_pragmas(conn):
+    """大量寫入時使用的 PRAGMA：WAL、降低 fsync 次數、加大快取"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+def ensure_import_tables(conn):
+    """
+    建立增量匯入需要的結構：
+    - sales.row_key：交易中的明細識別 (見 line_keys)，用來辨識同一筆明細
+    - 以 Transaction ID / Payment ID / row_key 建立的唯一索引，跨檔案去除重複
+    - import_manifest：已匯入檔案的 hash、大小與筆數
+    """
+    table = sales_storage_table(conn)
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if 'row_key' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN row_key TEXT")
+    migrate_row_keys(conn)
+    conn.execute(f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_dedup ON {table} (
+        COALESCE([Transaction ID], ''), COALESCE([Payment ID], ''), row_key
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS import_manifest (
+        sha256 TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        inserted_rows INTEGER NOT NULL,
+        imported_at TEXT NOT NULL
+    )
+    """)
+    conn.commit()
+
+def _text_column(chunk, col):
+    """欄位值轉為文字 (空值與缺少的欄位為空字串)，匯入與既有資料計算出相同的 hash"""
+    if col not in chunk.columns:
+        return pd.Series('', index=chunk.index)
+    return chunk[col].astype(object).where(chunk[col].notna(), '').astype(str)
+
+def line_keys(chunk, fallback, seen):
+    """
+    明細的 row_key (與 Transaction ID / Payment ID 一起組成去除重複的唯一鍵)
+
+    有交易 ID 的資料列為「品項內容的 hash:在同一交易中第幾次出現」，重新匯出的同一筆明細
+    即使金額等欄位被修正仍視為重複；兩個 ID 皆空時使用 fallback (原始資料列的 hash)。
+
+    Args:
+        seen: 先前各批資料中每組 (交易 ID, 品項內容) 出現的次數，跨批次累計並就地更新
+            (只保存 64-bit hash，大小與檔案中不同明細的數量成正比)
+
+    Returns:
+        ndarray: 每列的 row_key
+    """
+    ids = pd.DataFrame({col: _text_column(chunk, col) for col in DEDUP_ID_COLUMNS})
+    identity = pd.DataFrame({col: _text_column(chunk, col) for col in LINE_IDENTITY_COLUMNS})
+    has_id = (ids != '').any(axis=1)
+    line = pd.util.hash_pandas_object(identity, index=False)
+    group = pd.util.hash_pandas_object(pd.concat([ids, identity], axis=1), index=False)
+    occurrence = group.groupby(group).cumcount() + group.map(seen).fillna(0).astype('int64')
+    for key, count in group[has_id].value_counts().items():
+        seen[key] = seen.get(key, 0) + count
+    keys = line.map('{:016x}'.format) + ':' + occurrence.astype(str)
+    return keys.where(has_id, pd.Series(fallback, index=chunk.index)).values
+
+def migrate_row_keys(conn):
+    """
+    將舊版資料庫 row_key (有交易 ID 的資料列也是原始資料列的 hash) 改為 line_keys 的格式，
+    已匯入的明細才能與之後重新匯出的檔案比對；每個資料庫只執行一次
+
+    同一交易中相同品項的出現順序依 id (匯入順序)，與匯入時依檔案中的順序相同。
+    新格式含有 ':'，不會與舊的 hash 衝突，更新途中唯一索引仍然成立。
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+    if conn.execute("SELECT 1 FROM rollup_state WHERE name = ?", (ROW_KEY_STATE,)).fetchone():
+        return
+    table = sales_storage_table(conn)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sales)")}
+    id_columns = [col for col in DEDUP_ID_COLUMNS if col in columns]
+    identity_columns = [col for col in LINE_IDENTITY_COLUMNS if col in columns]
+    start = time.perf_counter()
+    migrated = 0
+    if id_columns:
+        id_filter = ' OR '.join(f"COALESCE([{col}], '') != ''" for col in id_columns)
+        select = ', '.join(f'[{col}]' for col in id_columns + identity_columns)
+        conn.execute("DROP TABLE IF EXISTS temp.row_key_lines")
+        conn.execute("CREATE TEMP TABLE row_key_lines (id INTEGER PRIMARY KEY, tx TEXT, payment TEXT, line TEXT)")
+        for chunk in pd.read_sql_query(f"SELECT id, {select} FROM sales WHERE {id_filter} ORDER BY id", conn,
+                                       chunksize=DEFAULT_CHUNKSIZE):
+            identity = pd.DataFrame({col: _text_column(chunk, col) for col in LINE_IDENTITY_COLUMNS})
+            line = pd.util.hash_pandas_object(identity, index=False).map('{:016x}'.format)
+            conn.executemany("INSERT INTO temp.row_key_lines VALUES (?, ?, ?, ?)", zip(
+                chunk['id'].tolist(), *(_text_column(chunk, col).tolist() for col in DEDUP_ID_COLUMNS),
+                line.tolist()
+            ))
+            migrated += len(chunk)
+        conn.execute(f"""
+        UPDATE {table} SET row_key = (
+            SELECT k.row_key FROM (
+                SELECT id, line || ':' || (ROW_NUMBER() OVER (PARTITION BY tx, payment, line ORDER BY id) - 1)
+                    AS row_key
+                FROM temp.row_key_lines
+            ) k WHERE k.id = {table}.id
+        )
+        WHERE id IN (SELECT id FROM temp.row_key_lines)
+        """)
+        conn.execute("DROP TABLE temp.row_key_lines")
+    conn.execute("INSERT OR REPLACE INTO rollup_state VALUES (?, 0)", (ROW_KEY_STATE,))
+    conn.commit()
+    if migrated:
+        print(f"Debug: 已將 {migrated:,} 筆明細的 row_key 改為交易明細識別，{time.perf_counter() - start:.2f} 秒")
+
+def file_sha256(path, block_size=1024 * 1024):
+    """計算檔案內容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_imported(conn, sha256):
+    """檔案內容是否已匯入過"""
+    return conn.execute("SELECT 1 FROM import_manifest WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+def record_import(conn, csv_file, sha256, row_count, inserted_rows):
+    """在 manifest 記錄已匯入的檔案"""
+    conn.execute(
+        "INSERT OR REPLACE INTO import_manifest VALUES (?, ?, ?, ?, ?, datetime('now'))",
+        (sha256, Path(csv_file).name, os.path.getsize(csv_file), row_count, inserted_rows)
+    )
+
+def read_clean_chunks(csv_file, table_columns, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    分批讀取並清理單一 CSV 檔案
+
+    Yields:
+        DataFrame: 清理後的資料 (含 row_key 欄位，見 line_keys)
+    """
+    delimiter = sniff_delimiter(csv_file)
+    reader = pd.read_csv(csv_file, sep=delimiter, engine='c', encoding='utf-8',
+                         dtype=str, chunksize=chunksize)
+    seen = {}
+    for chunk in reader:
+        unknown = [col for col in chunk.columns if col not in table_columns]
+        if unknown:
+            print(f"Debug: 略過資料表中沒有的欄位: {unknown}")
+            chunk = chunk.drop(columns=unknown)
+        # 沒有交易 ID 的資料列以清理前的原始內容計算 hash，重新匯入同一份匯出檔時結果相同
+        raw_key = pd.util.hash_pandas_object(chunk, index=False).map('{:016x}'.format)
+        row_key = line_keys(chunk, raw_key.values, seen)
+        chunk = clean_chunk(chunk)
+        chunk['row_key'] = row_key
+        if 'Date' in chunk.columns and 'day_key' in table_columns:
+            chunk = add_day_key(chunk)
+        yield chunk
+
+def insert_chunk(conn, chunk, encoder=None):
+    """
+    寫入一批資料，已存在的明細 (唯一索引衝突) 會被略過
+
+    Args:
+        encoder: normalized 配置的 DictionaryEncoder，提供時編碼後寫入 sales_fact
+
+    Returns:
+        int: 實際新增的筆數
+    """
+    table = 'sales'
+    if encoder is not None:
+        chunk = encoder.encode(chunk)
+        table = SALES_FACT_TABLE
+    placeholders = ', '.join('?' for _ in chunk.columns)
+    column_sql = ', '.join(f'[{col}]' for col in chunk.columns)
+    rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+    before = conn.total_changes
+    conn.executemany(f"INSERT OR IGNORE INTO {table} ({column_sql}) VALUES ({placeholders})", rows)
+    return conn.total_changes - before
+
+def prepare_import(conn, csv_files, layout=None):
+    """
+    建立資料表與匯入用結構
+
+    Returns:
+        Tuple[set, Optional[DictionaryEncoder]]: sales 的欄位集合，
+        與 normalized 配置寫入時使用的字典編碼器 (plain 配置為 None)
+    """
+    apply_bulk_load_pragmas(conn)
+    header = pd.read_csv(csv_files[0], sep=sniff_delimiter(csv_files[0]), encoding='utf-8', nrows=0)
+    layout = ensure_sales_table(conn, header.columns, layout)
+    ensure_import_tables(conn)
+    ensure_day_key(conn)
+    table_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({sales_storage_table(conn)})")}
+    if layout != LAYOUT_NORMALIZED:
+        return table_columns, None
+    ensure_sales_view(conn)
+    return table_columns, DictionaryEncoder(conn, table_columns)
+
+def list_csv_files(csv_folder):
+    csv_files = sorted(f for f in Path(csv_folder).glob("*.csv") if f.is_file())
+    print(f"Debug: 找到有效 CSV 檔案數量: {len(csv_files)}")
+    return csv_files
+
+def report_rate(label, rows, elapsed):
+    print(f"{label}: {rows:,} 筆，{elapsed:.2f} 秒 ({rows / elapsed if elapsed else 0:,.0f} rows/sec)")
+
+def import_csv_streaming(csv_folder, db_path, chunksize=DEFAULT_CHUNKSIZE, layout=None):
+    """
+    串流匯入 CSV：每個檔案只判斷一次分隔符號，以 C parser 分批讀取，
+    向量化清理後以 executemany 在單一交易中寫入，記憶體用量以每批資料為上限。
+    已匯入過的檔案 (依內容 hash) 直接略過，重複的明細由唯一索引排除。
+    layout 只在建立新資料庫時生效 (見 ensure_sales_table)。
+
+    Returns:
+        int: 新增的總筆數
+    """
+    csv_files = list_csv_files(csv_folder)
+    if not csv_files:
+        print("錯誤: 找不到CSV檔案")
+        return 0
+
+    conn = sqlite3.connect(db_path)
+    total_rows = 0
+    total_start = time.perf_counter()
+    try:
+        table_columns, encoder = prepare_import(conn, csv_files, layout)
+
+        for csv_file in csv_files:
+            sha256 = file_sha256(csv_file)
+            if is_imported(conn, sha256):
+                print(f"略過已匯入的檔案: {csv_file}")
+                continue
+            print(f"處理檔案: {csv_file}")
+            start = time.perf_counter()
+            file_rows = inserted = 0
+            try:
+                conn.execute("BEGIN")
+                for chunk in read_clean_chunks(csv_file, table_columns, chunksize):
+                    inserted += insert_chunk(conn, chunk, encoder)
+                    file_rows += len(chunk)
+                record_import(conn, csv_file, sha256, file_rows, inserted)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                if encoder is not None:
+                    encoder.reload()
+                print(f"寫入 {csv_file} 時發生錯誤: {e}")
+                continue
+
+            total_rows += inserted
+            report_rate(f"成功匯入 {csv_file} (新增 {inserted:,} 筆)", file_rows, time.perf_counter() - start)
+
+        ensure_sales_indexes(conn)
+        refresh_rollups(conn)
+        refresh_item_catalog(conn)
+        refresh_text_search(conn)
+        if total_rows:
+            bump_import_generation(conn)
+        conn.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        conn.close()
+
+    report_rate(f"成功處理 {len(csv_files)} 個 CSV 檔案，新增", total_rows, time.perf_counter() - total_start)
+    return total_rows
+
+def parse_csv_file(csv_file, table_columns, staging_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    平行匯入的 worker：在子行程中分批讀取並清理檔案，寫入這個檔案專用的暫存 SQLite 資料庫
+
+    暫存表不宣告欄位型別 (沒有型別轉換)，主行程讀回的值與清理後相同；
+    子行程與主行程的記憶體用量都以每批資料為上限，不必把整個檔案經由 pickle 傳回主行程。
+
+    Returns:
+        Tuple[str, int]: (檔案路徑, 筆數)
+    """
+    conn = sqlite3.connect(staging_path)
+    row_count = 0
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for chunk in read_clean_chunks(csv_file, table_columns, chunksize):
+            column_sql = ', '.join(f'[{col}]' for col in chunk.columns)
+            if not row_count:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS staging ({column_sql})")
+            placeholders = ', '.join('?' for _ in chunk.columns)
+            rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(f"INSERT INTO staging ({column_sql}) VALUES ({placeholders})", rows)
+            row_count += len(chunk)
+        conn.commit()
+    finally:
+        conn.close()
+    return str(csv_file), row_count
+
+def read_staged_chunks(staging_path, chunksize=DEFAULT_CHUNKSIZE):
+    """依原檔案順序分批讀回 parse_csv_file 寫入的暫存資料"""
+    conn = sqlite3.connect(staging_path)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'staging'").fetchone():
+            yield from pd.read_sql_query("SELECT * FROM staging ORDER BY rowid", conn, chunksize=chunksize)
+    finally:
+        conn.close()
+
+def import_csv_parallel(csv_folder, db_path, workers=None, chunksize=DEFAULT_CHUNKSIZE, layout=None):
+    """
+    平行匯入 CSV：以 process pool 同時解析與清理多個檔案，各自寫入資料庫旁的暫存目錄，
+    由主行程單一寫入者依完成順序分批讀回並寫入。
+    已匯入過的檔案 (依內容 hash) 不會送去解析，重複的明細由唯一索引排除。
+    字典編碼在主行程寫入時進行，代碼對照表只有一份。
+
+    Returns:
+        int: 新增的總筆數
+    """
+    csv_files = list_csv_files(csv_folder)
+    if not csv_files:
+        print("錯誤: 找不到CSV檔案")
+        return 0
+
+    conn = sqlite3.connect(db_path)
+    total_rows = 0
+    total_start = time.perf_counter()
+    try:
+        table_columns, encoder = prepare_import(conn, csv_files, layout)
+
+        pending = {}
+        for csv_file in csv_files:
+            sha256 = file_sha256(csv_file)
+            if is_imported(conn, sha256):
+                print(f"略過已匯入的檔案: {csv_file}")
+            else:
+                pending[str(csv_file)] = sha256
+        print(f"Debug: 需要匯入 {len(pending)} 個檔案，worker 數量: {workers or os.cpu_count()}")
+
+        # 暫存目錄放在資料庫旁 (與資料庫同一個磁碟)，結束時連同未讀取的暫存檔一起刪除
+        staging_dir = tempfile.mkdtemp(prefix='import-staging-', dir=os.path.dirname(os.path.abspath(db_path)))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                staging_paths = {
+                    path: os.path.join(staging_dir, f'{n:05d}.db') for n, path in enumerate(pending)
+                }
+                futures = [
+                    executor.submit(parse_csv_file, path, table_columns, staging_paths[path], chunksize)
+                    for path in pending
+                ]
+                for future in as_completed(futures):
+                    try:
+                        csv_file, file_rows = future.result()
+                    except Exception as e:
+                        print(f"解析 CSV 時發生錯誤: {e}")
+                        continue
+                    inserted = 0
+                    try:
+                        conn.execute("BEGIN")
+                        for chunk in read_staged_chunks(staging_paths[csv_file], chunksize):
+                            inserted += insert_chunk(conn, chunk, encoder)
+                        record_import(conn, csv_file, pending[csv_file], file_rows, inserted)
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        if encoder is not None:
+                            encoder.reload()
+                        print(f"寫入 {csv_file} 時發生錯誤: {e}")
+                        continue
+                    finally:
+                        os.remove(staging_paths[csv_file])
+                    total_rows += inserted
+                    print(f"成功匯入 {csv_file}: {file_rows:,} 筆，新增 {inserted:,} 筆")
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        ensure_sales_indexes(conn)
+        refresh_rollups(conn)
+        refresh_item_catalog(conn)
+        refresh_text_search(conn)
+        if total_rows:
+            bump_import_generation(conn)
+        conn.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        conn.close()
+
+    report_rate(f"成功處理 {len(csv_files)} 個 CSV 檔案，新增", total_rows, time.perf_counter() - total_start)
+    return total_rows
+
 def import_csv_to_db(csv_folder, db_path):
     # Debug: 印出 CSV 資料夾中的所有檔案
     print("Debug: CSV folder 路徑內容:", os.listdir(csv_folder))
     
     # 建立資料庫連線
     conn = sqlite3.connect(db_path)
+    if sales_layout(conn) == LAYOUT_NORMALIZED:
+        # to_sql 只能寫入文字欄位，字典編碼的配置請使用 streaming / parallel 模式
+        print("錯誤: 資料庫使用 normalized 配置，legacy 模式無法寫入")
+        conn.close()
+        return
     
     # 動態建立資料表結構 (新增部分)
     sample_csv = next(Path(csv_folder).glob("*.csv"), None)
@@ -44,26 +986,8 @@ def import_csv_to_db(csv_folder, db_path):
     
     # 自動偵測CSV結構
     df_sample = pd.read_csv(sample_csv, sep=None, engine='python', encoding='utf-8', nrows=1)
-    
-    # 自動生成CREATE TABLE語句
-    columns = []
-    for col in df_sample.columns:
-        # 判斷資料類型 (簡化版)
-        dtype = 'TEXT'
-        if any(kw in col.lower() for kw in ['price', 'sales', 'tax', 'amount', 'qty']):
-            dtype = 'REAL'
-        elif 'date' in col.lower():
-            dtype = 'TEXT'  # SQLite沒有DATE類型
-        columns.append(f'[{col}] {dtype}')
-    
-    create_table_sql = f'''
-    CREATE TABLE IF NOT EXISTS sales (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        {', '.join(columns)}
-    )
-    '''
-    conn.execute(create_table_sql)
-    conn.commit()
+    ensure_sales_table(conn, df_sample.columns)
+    ensure_day_key(conn)
 
     # 修正CSV檔案篩選邏輯
     csv_files = [f for f in Path(csv_folder).glob("*.csv") if f.is_file() and f.suffix.lower() == '.csv']
@@ -80,10 +1004,10 @@ def import_csv_to_db(csv_folder, db_path):
             # 日期欄位處理
             if 'Date' in df.columns:
                 df['Date'] = df['Date'].apply(clean_date)
+                df = add_day_key(df)
             
             # 貨幣欄位處理
-            currency_columns = ['Gross Sales', 'Net Sales', 'Tax', 'Discounts']
-            for col in currency_columns:
+            for col in CURRENCY_COLUMNS:
                 if col in df.columns:
                     df[col] = df[col].apply(clean_currency)
             
@@ -95,9 +1019,24 @@ def import_csv_to_db(csv_folder, db_path):
             print("詳細錯誤資訊:", str(e))
             continue
     
+    ensure_sales_indexes(conn)
+    refresh_rollups(conn)
+    refresh_item_catalog(conn)
+    refresh_text_search(conn)
+    bump_import_generation(conn)
     conn.close()
     print(f"成功處理 {len(csv_files)} 個 CSV 檔案")
 
+def bump_import_generation(conn):
+    """
+    遞增資料庫的匯入版本 (PRAGMA user_version)，
+    讓查詢結果快取知道資料已更新
+    """
+    generation = conn.execute("PRAGMA user_version").fetchone()[0] + 1
+    conn.execute(f"PRAGMA user_version = {generation}")
+    conn.commit()
+    print(f"Debug: 匯入版本更新為 {generation}")
+
 def visualize_schema(db_path):
     conn = sqlite3.connect(db_path)
     try:
@@ -145,18 +1084,15 @@ def visualize_schema(db_path):
 
 def print_items(db_path):
     """
-    印出 sales 表中的總筆數與 distinct items
+    印出 sales 表中的總筆數與 distinct items (讀取品項目錄，不掃描 sales)
     """
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT COUNT(*) FROM sales")
-        total_rows = cursor.fetchone()[0]
+        refresh_item_catalog(conn)
+        total_rows = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM item_catalog").fetchone()[0]
         print(f"總記錄數: {total_rows}")
 
-        cursor.execute("SELECT DISTINCT Item FROM sales")
-        items = cursor.fetchall()
-        items = [item[0] for item in items]
+        items = [row[0] for row in conn.execute("SELECT [Item] FROM item_catalog")]
         print(f"Distinct 'Item' 數量: {len(items)}")
         print("Items:")
         for item in items:
@@ -184,10 +1120,34 @@ def show_top_10_records(db_path):
         conn.close()
 
 if __name__ == "__main__":
-    db_path = "sales_data.db"  # 資料庫儲存位置
-    csv_folder = "./"          # CSV 檔案所在的資料夾，可依需求調整
+    parser = argparse.ArgumentParser(description='匯入 POS 匯出的 CSV 到 SQLite')
+    parser.add_argument('--csv-folder', default='./', help='CSV 檔案所在的資料夾')
+    parser.add_argument('--db', default='sales_data.db', help='資料庫儲存位置')
+    parser.add_argument('--mode', choices=['streaming', 'parallel', 'legacy'], default='streaming',
+                        help='streaming: 分批向量化匯入；parallel: 多行程平行解析；legacy: 整檔讀入後逐列清理')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, default=None, help='parallel 模式的行程數 (預設為 CPU 數)')
+    parser.add_argument('--layout', choices=[LAYOUT_PLAIN, LAYOUT_NORMALIZED], default=None,
+                        help='建立新資料庫時的儲存配置 (預設 plain，既有資料庫沿用原配置)；'
+                             'normalized: 重複的文字欄位以整數代碼與查詢表儲存')
+    parser.add_argument('--partition-dir', default=None,
+                        help='匯入後將資料依月份分區到此資料夾 (每月一個 SQLite 檔，供平行查詢使用)')
+    args = parser.parse_args()
+    db_path = args.db
+    csv_folder = args.csv_folder
     
-    import_csv_to_db(csv_folder, db_path)
+    if args.mode == 'streaming':
+        import_csv_streaming(csv_folder, db_path, args.chunksize, args.layout)
+    elif args.mode == 'parallel':
+        import_csv_parallel(csv_folder, db_path, args.workers, args.chunksize, args.layout)
+    else:
+        import_csv_to_db(csv_folder, db_path)
+    if args.partition_dir:
+        conn = sqlite3.connect(db_path)
+        try:
+            refresh_partitions(conn, args.partition_dir)
+        finally:
+            conn.close()
     visualize_schema(db_path)
     show_top_10_records(db_path)
     print_items(db_path) 
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+索引建議：對範例查詢與實際查詢記錄執行 EXPLAIN QUERY PLAN，找出仍需全表掃描的查詢
+
+用法：
+    python database/index_advisor.py --db database/sales_data.db \
+        --examples pre-train/example_queries.sql --log database/query_log.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+
+from tabulate import tabulate
+
+# 常見的寫法與無法使用索引的原因
+HINTS = [
+    (re.compile(r'\b(DATE|strftime)\s*\(\s*"?Date"?\s*[,)]', re.IGNORECASE),
+     "對 Date 套用函數無法使用索引，Date 已是 'YYYY-MM-DD'，請直接比較 Date = ... 或 Date BETWEEN ..."),
+    (re.compile(r'"?Date"?\s+LIKE\s', re.IGNORECASE),
+     "Date LIKE '2025-01%' 無法使用索引，請改用 Date >= '2025-01-01' AND Date < '2025-02-01'"),
+    (re.compile(r"LIKE\s+'%", re.IGNORECASE),
+     "前置萬用字元的 LIKE 只能掃描，可考慮全文索引"),
+]
+
+
+def load_example_queries(path):
+    """讀取範例 SQL 檔，以分號切開每個查詢"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    queries = []
+    for block in text.split(';'):
+        lines = [line for line in block.splitlines() if not line.strip().startswith('--')]
+        sql = '\n'.join(lines).strip()
+        if sql:
+            queries.append(sql)
+    return queries
+
+
+def load_query_log(path):
+    """讀取查詢記錄 (JSONL)，回傳 {sql: 次數}"""
+    counts = Counter()
+    if not path or not os.path.exists(path):
+        return counts
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            sql = ' '.join(entry.get('sql', '').split())
+            if sql:
+                counts[sql] += 1
+    return counts
+
+
+def explain(conn, sql):
+    """
+    執行 EXPLAIN QUERY PLAN
+
+    Returns:
+        Tuple[str, List[str]]: (判定, 計畫內容)；判定為 SCAN (全表掃描)、
+        COVERING SCAN (掃描覆蓋索引)、INDEX (使用索引搜尋) 或 ERROR
+    """
+    try:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    except sqlite3.Error as e:
+        return 'ERROR', [str(e)]
+    verdict = 'INDEX'
+    for detail in plan:
+        if not detail.startswith('SCAN'):
+            continue
+        if 'INDEX' in detail:
+            verdict = 'COVERING SCAN' if verdict == 'INDEX' else verdict
+        elif 'SUBQUERY' not in detail and 'CONSTANT ROW' not in detail:
+            verdict = 'SCAN'
+    return verdict, plan
+
+
+def hints_for(sql):
+    return [message for pattern, message in HINTS if pattern.search(sql)]
+
+
+def advise(db_path, queries):
+    """
+    檢查每個查詢的執行計畫
+
+    Args:
+        queries: [(來源, SQL, 次數)]
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = []
+    for source, sql, count in queries:
+        verdict, plan = explain(conn, sql)
+        rows.append([
+            source,
+            count,
+            verdict,
+            ' '.join(sql.split())[:80],
+            '\n'.join(plan),
+            '\n'.join(hints_for(sql)) if verdict != 'INDEX' else ''
+        ])
+    indexes = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sales'"
+    ).fetchall()
+    conn.close()
+
+    print(f"sales 上的索引: {', '.join(name for (name,) in indexes) or '(無)'}\n")
+    print(tabulate(rows, headers=['來源', '次數', '判定', 'SQL', '執行計畫', '建議'], tablefmt='grid'))
+
+    scans = sum(1 for row in rows if row[2] == 'SCAN')
+    covering = sum(1 for row in rows if row[2] == 'COVERING SCAN')
+    print(f"\n共 {len(rows)} 個查詢，{scans} 個需要全表掃描，{covering} 個掃描整個覆蓋索引")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='以 EXPLAIN QUERY PLAN 檢查查詢是否使用索引')
+    parser.add_argument('--db', default='database/sales_data.db', help='資料庫位置')
+    parser.add_argument('--examples', default='pre-train/example_queries.sql', help='範例 SQL 檔')
+    parser.add_argument('--log', default='database/query_log.jsonl', help='app.py 寫入的查詢記錄')
+    parser.add_argument('--top', type=int, default=20, help='只檢查記錄中最常出現的前 N 個查詢')
+    args = parser.parse_args()
+
+    queries = [('example', sql, 1) for sql in load_example_queries(args.examples)]
+    queries += [('log', sql, count) for sql, count in load_query_log(args.log).most_common(args.top)]
+    advise(args.db, queries)
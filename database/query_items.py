@@ -1,45 +1,56 @@
+import os
 import sqlite3
 
+from csv_to_sqlite import refresh_item_catalog
+
+def render_items_report(total_items, distinct_items, items):
+    """產生品項報告的 Markdown 內容"""
+    lines = [
+        "# 銷售品項報告\n\n",
+        f"## 統計摘要\n- 總銷售記錄數: {total_items}\n",
+        f"- 獨特品項數量: {distinct_items}\n\n",
+        "## 完整品項清單\n| 品項名稱 |\n|----------|\n",
+    ]
+    lines.extend(f"| {item} |\n" for item in items)
+    return ''.join(lines)
+
 def query_items(db_path, output_md):
-    # 連線到 SQLite 資料庫
+    """
+    由品項目錄 item_catalog 產生品項報告 (讀取的列數與品項數相同，不掃描 sales)
+
+    Returns:
+        bool: 報告內容是否有變更並重新寫入
+    """
+    # 連線到 SQLite 資料庫；目錄不存在或尚未涵蓋最新資料時先增量更新
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # 查詢 sales 資料表的總筆數（所有記錄數）
-    cursor.execute("SELECT COUNT(*) FROM sales")
-    total_items = cursor.fetchone()[0]
-    print(f"DEBUG: Total records in sales table: {total_items}")
-
-    # 查詢 sales 資料表中不重複的產品名稱筆數（假設 Item 欄位儲存產品名稱）
-    cursor.execute("SELECT COUNT(DISTINCT Item) FROM sales")
-    distinct_items = cursor.fetchone()[0]
-    print(f"DEBUG: Distinct items in 'Item' column: {distinct_items}")
-
-    # 新增品項列表查詢
-    cursor.execute("""
-        SELECT DISTINCT Item 
-        FROM sales 
-        ORDER BY Item
-    """)
-    items = [row[0] for row in cursor.fetchall()]
-    print(f"DEBUG: Retrieved {len(items)} distinct items")  # 保留debug資訊
-
-    conn.close()
-
-    # 將查詢結果寫入 Markdown 格式文件 items.md
+    try:
+        refresh_item_catalog(conn)
+
+        # 總銷售記錄數與不重複的品項數 (COUNT(DISTINCT Item) 不計 NULL)
+        total_items, distinct_items = conn.execute(
+            "SELECT COALESCE(SUM(row_count), 0), COUNT([Item]) FROM item_catalog"
+        ).fetchone()
+        print(f"DEBUG: Total records in sales table: {total_items}")
+        print(f"DEBUG: Distinct items in 'Item' column: {distinct_items}")
+
+        items = [row[0] for row in conn.execute("SELECT [Item] FROM item_catalog ORDER BY [Item]")]
+        print(f"DEBUG: Retrieved {len(items)} distinct items")  # 保留debug資訊
+    finally:
+        conn.close()
+
+    # 內容與既有的 items.md 相同時不重寫
+    report = render_items_report(total_items, distinct_items, items)
+    if os.path.exists(output_md):
+        with open(output_md, "r", encoding="utf-8") as f:
+            if f.read() == report:
+                print(f"DEBUG: {output_md} 內容未變更，略過寫入")
+                return False
     with open(output_md, "w", encoding="utf-8") as f:
-        # 保留既有統計資料
-        f.write("# 銷售品項報告\n\n")
-        f.write(f"## 統計摘要\n- 總銷售記錄數: {total_items}\n")
-        f.write(f"- 獨特品項數量: {distinct_items}\n\n")
-        
-        # 新增品項清單表格
-        f.write("## 完整品項清單\n| 品項名稱 |\n|----------|\n")
-        for item in items:
-            f.write(f"| {item} |\n")
+        f.write(report)
+    return True
 
 if __name__ == "__main__":
     db_path = "sales_data.db"  # 資料庫儲存位置，請確認此路徑正確
     output_md = "items.md"     # 輸出的 Markdown 檔案
-    query_items(db_path, output_md)
-    print(f"查詢結果已寫入 {output_md}") 
\ No newline at end of file
+    if query_items(db_path, output_md):
+        print(f"查詢結果已寫入 {output_md}")
@@ -0,0 +1,215 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+
+def read_only_uri(db_path: str) -> str:
+    """唯讀開啟資料庫的 URI：檔案不存在時連線失敗，不會建立空的資料庫"""
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+class PoolTimeoutError(Exception):
+    """等待可用連線逾時"""
+
+
+class ConnectionPool:
+    """
+    唯讀 SQLite 連線池
+
+    連線以 `mode=ro` URI 開啟並設定 query_only，保留 page cache 與
+    prepared statement cache 供後續請求重用。連線數量有上限；
+    同一執行緒在持有連線期間重複取用會拿到同一條連線。
+    """
+
+    def __init__(self, db_path: str, max_connections: int = 8, timeout: float = 10.0,
+                 cache_size_kb: int = 64 * 1024, mmap_size: int = 256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._journal_checked = False
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'in_use': 0,
+            'waits': 0,
+            'wait_ms': 0.0,
+            'timeouts': 0,
+            'errors': 0
+        }
+
+    def _check_journal_mode(self):
+        """
+        記錄資料庫的 journal mode，不是 WAL 時提出警告 (匯入時讀取會被寫入阻擋)
+
+        連線池只讀取資料庫，不切換 journal mode；csv_to_sqlite 匯入時會將資料庫設為 WAL。
+        """
+        if self._journal_checked:
+            return
+        self._journal_checked = True
+        try:
+            conn = sqlite3.connect(read_only_uri(self.db_path), uri=True)
+            try:
+                mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"無法讀取資料庫 journal mode ({self.db_path}): {str(e)}")
+            return
+        if mode.lower() == 'wal':
+            logger.info(f"資料庫 journal mode: {mode}")
+        else:
+            logger.warning(f"資料庫 journal mode 為 {mode}，不是 WAL，匯入期間的查詢可能被阻擋")
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立一條唯讀連線並套用效能相關 PRAGMA"""
+        self._check_journal_mode()
+        conn = sqlite3.connect(read_only_uri(self.db_path), uri=True, check_same_thread=False,
+                               timeout=self.timeout, cached_statements=256)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _close(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats['closed'] += 1
+
+    @contextmanager
+    def connection(self):
+        """
+        取得一條唯讀連線
+
+        Raises:
+            PoolTimeoutError: 超過 timeout 仍沒有可用連線
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # 同一執行緒重複取用，直接沿用
+            yield conn
+            return
+
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolTimeoutError(f"等待資料庫連線超過 {self.timeout} 秒")
+        waited_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_ms'] += waited_ms
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+        except sqlite3.Error as e:
+            # 查詢本身的錯誤 (語法、欄位不存在等) 不影響連線；連線層級的錯誤則丟棄該連線
+            broken = type(e) in (sqlite3.DatabaseError, sqlite3.InterfaceError)
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            self._local.conn = None
+            with self._lock:
+                self._stats['in_use'] -= 1
+            if broken:
+                self._close(conn)
+            else:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def prewarm(self, count: int = None):
+        """預先建立連線 (預設建立到上限)，並讓每條連線先解析 schema"""
+        count = min(count or self.max_connections, self.max_connections)
+        while self._stats['created'] - self._stats['closed'] < count:
+            conn = self._connect()
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            self._idle.put(conn)
+
+    def prime_page_cache(self, max_bytes: int, chunk_size: int = 1024 * 1024) -> int:
+        """
+        循序讀取資料庫檔案，讓作業系統 page cache (與 mmap) 在第一個查詢前就有資料
+
+        Returns:
+            int: 讀取的 bytes 數
+        """
+        if max_bytes <= 0 or not os.path.exists(self.db_path):
+            return 0
+        start = time.perf_counter()
+        total = 0
+        with open(self.db_path, 'rb', buffering=0) as f:
+            while total < max_bytes:
+                chunk = f.read(min(chunk_size, max_bytes - total))
+                if not chunk:
+                    break
+                total += len(chunk)
+        logger.info(f"預先讀取資料庫 {total / 1024 / 1024:.1f} MB，"
+                    f"耗時 {(time.perf_counter() - start) * 1000:.1f}ms")
+        return total
+
+    def health(self) -> dict:
+        """以 SELECT 1 檢查連線狀態並回傳統計"""
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                conn.execute("SELECT 1").fetchone()
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)
+        return {
+            'ok': ok,
+            'error': error,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 3),
+            **self.stats()
+        }
+
+    def stats(self) -> dict:
+        """回傳連線池使用統計"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['max_connections'] = self.max_connections
+        stats['wait_ms'] = round(stats['wait_ms'], 3)
+        return stats
+
+    def close(self):
+        """關閉所有閒置連線"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,112 @@
+"""
+查詢結果的 HTTP 條件式請求與壓縮
+
+ETag 由正規化後的 SQL、資料庫版本與影響回應內容的請求參數計算，不需執行查詢即可比對 If-None-Match。
+ETag 為弱驗證 (W/)：只代表查詢結果相同，result_cached、generation_ms 等診斷欄位與 Content-Encoding 可以不同。
+回應依 Accept-Encoding 以 br (需安裝 brotli) 或 gzip 壓縮，串流回應逐段壓縮並在每段結束時 flush。
+"""
+import hashlib
+import importlib.util
+import json
+import zlib
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+from result_cache import normalize_sql
+
+ENCODING_BROTLI = 'br'
+ENCODING_GZIP = 'gzip'
+SUPPORTED_ENCODINGS = (ENCODING_BROTLI, ENCODING_GZIP)
+
+# 可壓縮的回應類型 (Arrow 回應已可用 compression 參數指定 lz4 / zstd)
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/csv'
+})
+# gzip 等級與 brotli 品質：動態回應取壓縮率與 CPU 時間的折衷
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def brotli_available() -> bool:
+    """是否已安裝 brotli (不實際載入)"""
+    return importlib.util.find_spec('brotli') is not None
+
+
+def available_encodings(preferred: Sequence[str]) -> Tuple[str, ...]:
+    """依伺服器偏好順序列出可用的編碼，未安裝 brotli 時略過 br"""
+    encodings = []
+    for encoding in preferred:
+        encoding = encoding.strip().lower()
+        if encoding not in SUPPORTED_ENCODINGS or encoding in encodings:
+            continue
+        if encoding == ENCODING_BROTLI and not brotli_available():
+            continue
+        encodings.append(encoding)
+    return tuple(encodings)
+
+
+def result_etag(sql: str, version: str, *parts) -> str:
+    """
+    查詢結果的 ETag (不含引號)
+
+    Args:
+        version: 資料庫版本 (ResultCache.data_version)
+        parts: 其他影響回應內容的值 (端點、format、問句等)，需可轉為 JSON
+    """
+    key = json.dumps([normalize_sql(sql), version, *parts], ensure_ascii=False, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def matching_etag(if_none_match, etag: str) -> bool:
+    """If-None-Match (werkzeug 的 ETags) 是否符合 ETag (弱比較)"""
+    return bool(if_none_match) and if_none_match.contains_weak(etag)
+
+
+def _compressor(encoding: str):
+    """回傳 (compress, flush, finish) 函式"""
+    if encoding == ENCODING_BROTLI:
+        import brotli
+
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits=31：gzip 格式的標頭與 CRC
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return (compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            lambda: compressor.flush(zlib.Z_FINISH))
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    compress, _, finish = _compressor(encoding)
+    return compress(body) + finish()
+
+
+def _to_bytes(chunk) -> bytes:
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def compress_stream(chunks: Iterable, encoding: str,
+                    on_done: Optional[Callable[[int, int], None]] = None) -> Iterator[bytes]:
+    """
+    逐段壓縮串流：每段 (例如 NDJSON 的一批資料列) 壓縮後 flush，用戶端可立即解壓顯示
+
+    原串流由呼叫端負責關閉 (例如 Response.call_on_close)，用戶端提早斷線時才會釋放原串流佔用的連線。
+
+    Args:
+        on_done: 串流結束時以 (原始大小, 壓縮後大小) 呼叫
+    """
+    compress, flush, finish = _compressor(encoding)
+    original = compressed = 0
+    try:
+        for chunk in chunks:
+            chunk = _to_bytes(chunk)
+            original += len(chunk)
+            out = compress(chunk) + flush()
+            compressed += len(out)
+            if out:
+                yield out
+        out = finish()
+        compressed += len(out)
+        yield out
+    finally:
+        if on_done is not None:
+            on_done(original, compressed)
+
@@ -0,0 +1,256 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 預設的延遲分界 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in items]
+
+
+class Counter(_Metric):
+    """只增不減的計數器"""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """累積分界的直方圖 (與 Prometheus histogram 相同)"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """
+    指標集合，輸出 Prometheus 文字格式
+
+    除了 Counter / Histogram 之外，也可註冊 collector：回傳
+    [(名稱, 型別, 說明, [(labels dict, 數值), ...]), ...] 的函數，
+    在輸出時才讀取數值 (例如連線池、快取的既有統計)
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, list]]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, type_name, help_text, samples in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {type_name}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(list(labels), list(labels.values()))} '
+                                 f'{_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 請求與各階段延遲
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'vanna_request_duration_seconds', 'API 請求處理時間', ['endpoint']))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'vanna_requests_total', 'API 請求數', ['endpoint', 'status']))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'vanna_stage_duration_seconds', '各處理階段的時間 (retrieval / llm / validation / execution 等)', ['stage']))
+
+# 快取、驗證與結果
+SQL_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'vanna_sql_cache_lookups_total', '問句快取查詢次數', ['result']))
+RESULT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'vanna_result_cache_lookups_total', '查詢結果快取查詢次數', ['result']))
+VALIDATION_FAILURES = REGISTRY.register(Counter(
+    'vanna_sql_validation_failures_total', 'SQL 驗證失敗次數', ['endpoint']))
+ROWS_RETURNED = REGISTRY.register(Counter(
+    'vanna_rows_returned_total', '回傳的資料列數', ['endpoint']))
+RESPONSE_BYTES = REGISTRY.register(Counter(
+    'vanna_response_bytes_total', '序列化後的查詢結果大小 (bytes)', ['format']))
+NOT_MODIFIED = REGISTRY.register(Counter(
+    'vanna_not_modified_total', 'If-None-Match 符合而以 304 回應 (不執行查詢) 的請求數', ['endpoint']))
+COMPRESSION_BYTES = REGISTRY.register(Counter(
+    'vanna_response_compression_bytes_total', '壓縮回應在壓縮前 (original) 與壓縮後 (compressed) 的大小 (bytes)',
+    ['encoding', 'size']))
+PARTITION_QUERIES = REGISTRY.register(Counter(
+    'vanna_partition_queries_total', '以月份分區執行的查詢數 (single: 只查詢一個分區；fan_out: 平行合併部分彙總)',
+    ['mode']))
+PARTITIONS = REGISTRY.register(Counter(
+    'vanna_partitions_total', '分區查詢掃描與依 Date 條件略過的分區數', ['result']))
+
+# LLM
+LLM_TOKENS = REGISTRY.register(Counter(
+    'vanna_llm_tokens_total', 'LLM token 用量', ['type']))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    'vanna_llm_requests_total', 'LLM 呼叫次數', ['status']))
+PROMPT_CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    'vanna_prompt_context_tokens', '每次 SQL 生成放入 prompt 的檢索內容 (估計 token 數)', ['section'],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)))
+
+
+class Timings:
+    """單一請求 (或單次 SQL 生成) 各階段的累計時間"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, other: Optional['Timings']):
+        """併入另一個 Timings (例如在 LLM 執行緒中記錄的生成階段)"""
+        if other is None or other is self:
+            return
+        with other._lock:
+            stages = dict(other.stages)
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            stages = {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        return {'stages_ms': stages, 'total_ms': round((time.perf_counter() - self.started) * 1000, 3)}
+
+
+_local = threading.local()
+
+
+def current_timings() -> Optional[Timings]:
+    """目前執行緒正在記錄的 Timings"""
+    return getattr(_local, 'timings', None)
+
+
+def set_current_timings(timings: Optional[Timings]):
+    _local.timings = timings
+
+
+@contextmanager
+def activate(timings: Optional[Timings]):
+    """在區塊內將 timings 設為目前執行緒的記錄對象"""
+    previous = current_timings()
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def span(stage: str):
+    """記錄一個處理階段：寫入 STAGE_SECONDS，並累加到目前執行緒的 Timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = current_timings()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def record_token_usage(usage):
+    """記錄 OpenAI 回應中的 usage (prompt_tokens / completion_tokens)"""
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = getattr(usage, kind, None)
+        if value:
+            LLM_TOKENS.inc(value, type=kind.replace('_tokens', ''))
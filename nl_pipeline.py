@@ -0,0 +1,229 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from metrics import Timings, activate
+from sql_cache import normalize_question
+from training_manifest import parse_example_queries
+
+logger = logging.getLogger(__name__)
+
+# 工作狀態
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+
+
+class PipelineBusyError(Exception):
+    """等待中的 LLM 呼叫已達上限"""
+
+
+class GenerationTimeoutError(Exception):
+    """SQL 生成逾時"""
+
+
+class StubSQLGenerator:
+    """
+    離線用的 LLM 替身：以 example_queries.sql 中的問句對應 SQL
+
+    問句完全相符時回傳對應 SQL，否則回傳字元 bigram 重疊最多的範例，
+    結果是確定的，適合在沒有網路的環境下做壓力測試。
+    """
+
+    def __init__(self, example_path: str = 'pre-train/example_queries.sql', latency: float = 0.0):
+        with open(example_path, 'r', encoding='utf-8') as f:
+            pairs = parse_example_queries(f.read())
+        self.examples = [(normalize_question(q), sql) for q, sql in pairs if q]
+        if not self.examples:
+            raise ValueError(f"{example_path} 中沒有帶問句的範例查詢")
+        self.latency = latency
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+    def generate_sql(self, question: str, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        key = normalize_question(question)
+        grams = self._bigrams(key)
+        best_sql, best_score = self.examples[0][1], -1
+        for example_question, sql in self.examples:
+            if example_question == key:
+                return sql
+            score = len(grams & self._bigrams(example_question))
+            if score > best_score:
+                best_sql, best_score = sql, score
+        return best_sql
+
+
+class SingleFlight:
+    """
+    相同 key 的呼叫只執行一次，其餘呼叫等待並共用結果 (例如同一批次中相同的 SQL)
+
+    結果在物件存在期間都會保留，適合每個批次建立一個。
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args) -> Tuple[Any, bool]:
+        """
+        Returns:
+            Tuple[Any, bool]: (fn 的結果, 是否共用其他呼叫的結果)
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result(), not owner
+
+
+class NLQueryPipeline:
+    """
+    自然語言查詢的非同步執行管線
+
+    - LLM 呼叫在獨立的 thread pool 中執行，同時進行的呼叫數不超過 max_in_flight，
+      排隊數超過 max_queue 時直接拒絕
+    - 相同 (正規化後) 問句同時送出時共用同一次生成
+    - 較慢的問題可轉為背景工作，以 job id 查詢結果
+    """
+
+    def __init__(self, generate_fn: Callable[..., str], max_in_flight: int = 4,
+                 max_queue: int = 32, timeout: float = 60.0, job_workers: int = 8,
+                 job_ttl: float = 600.0):
+        self.generate_fn = generate_fn
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.job_ttl = job_ttl
+        self._llm_executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='nl-llm')
+        self._job_executor = ThreadPoolExecutor(max_workers=job_workers, thread_name_prefix='nl-job')
+        self._inflight = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'completed': 0
+        }
+
+    def submit(self, question: str, **kwargs) -> Future:
+        """
+        送出 SQL 生成，相同問句正在生成時回傳同一個 Future
+
+        Args:
+            kwargs: 傳給 generate_fn 的參數 (例如已算好的問句 embedding)
+
+        Raises:
+            PipelineBusyError: 排隊中的生成已達上限
+        """
+        key = normalize_question(question)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                logger.info(f"合併相同問句的生成請求: {question}")
+                return future
+            if len(self._inflight) >= self.max_in_flight + self.max_queue:
+                self._stats['rejected'] += 1
+                raise PipelineBusyError("LLM 請求過多，請稍後再試")
+            # 生成階段的時間 (排隊、檢索、LLM) 記錄在 future.timings，合併請求共用
+            timings = Timings()
+            future = self._llm_executor.submit(self._generate, question, timings, kwargs)
+            future.timings = timings
+            self._inflight[key] = future
+            self._stats['submitted'] += 1
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def _generate(self, question: str, timings: Timings, kwargs: dict) -> str:
+        start = time.perf_counter()
+        timings.add('llm_queue', start - timings.started)
+        with activate(timings):
+            sql = self.generate_fn(question, **kwargs)
+        logger.info(f"SQL 生成耗時 {(time.perf_counter() - start) * 1000:.1f}ms")
+        return sql
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.exception() is not None:
+                self._stats['failures'] += 1
+            else:
+                self._stats['completed'] += 1
+
+    def wait(self, future: Future, timeout: Optional[float] = None) -> str:
+        """
+        等待生成結果
+
+        Raises:
+            GenerationTimeoutError: 超過 timeout 仍未完成 (生成本身會繼續執行)
+        """
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FuturesTimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise GenerationTimeoutError(f"SQL 生成超過 {self.timeout if timeout is None else timeout} 秒")
+
+    def submit_job(self, fn: Callable, *args) -> str:
+        """將工作放到背景執行，回傳 job id"""
+        self._expire_jobs()
+        job_id = uuid.uuid4().hex
+        job = {'job_id': job_id, 'status': JOB_PENDING, 'created_at': time.time(),
+               'result': None, 'error': None}
+        with self._lock:
+            self._jobs[job_id] = job
+        self._job_executor.submit(self._run_job, job, fn, args)
+        return job_id
+
+    def _run_job(self, job: dict, fn: Callable, args: tuple):
+        job['status'] = JOB_RUNNING
+        try:
+            job['result'] = fn(*args)
+            job['status'] = JOB_DONE
+        except Exception as e:
+            logger.error(f"背景查詢工作失敗: {str(e)}")
+            job['error'] = str(e)
+            job['status'] = JOB_ERROR
+        job['finished_at'] = time.time()
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """查詢背景工作狀態"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _expire_jobs(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('finished_at') and now - job['finished_at'] > self.job_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        """回傳管線統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._inflight)
+            stats['jobs'] = len(self._jobs)
+        stats['max_in_flight'] = self.max_in_flight
+        return stats
@@ -0,0 +1,237 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from contextlib import closing
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import sqlparse
+from sqlparse import tokens as T
+
+from query_governor import LIMIT_TIMEOUT, QueryGovernor, QueryTooExpensiveError
+from query_rewriter import PARTIAL_TABLE, rewrite_to_partials
+from sql_validator import analyze_sql
+
+logger = logging.getLogger(__name__)
+
+# 分區檔名 (與 database/csv_to_sqlite.py 的 partition_path 一致)：sales-YYYY-MM.db、sales-unknown.db
+PARTITION_FILE = re.compile(r'^sales-(\d{4}-\d{2}|unknown)\.db$')
+UNKNOWN_PARTITION = 'unknown'
+# 分區狀態 (database/csv_to_sqlite.py 的 refresh_partitions 寫入主資料庫的 rollup_state)
+PARTITION_STATE = 'sales_partitions'
+# 一個分區最多回傳的部分彙總列數倍數 (相對於 max_rows)，超過時改回主資料庫執行
+PARTIAL_ROWS_FACTOR = 10
+
+# worker 行程內的唯讀連線 (分區檔路徑 → 連線)
+_worker_connections: Dict[str, sqlite3.Connection] = {}
+
+
+class PartitionPlan(NamedTuple):
+    """分區查詢的執行計畫"""
+    paths: Tuple[str, ...]
+    skipped: int
+    partial_sql: str
+    # 合併部分彙總的 SQL；只需查詢一個分區時為 None，partial_sql 即原查詢
+    final_sql: Optional[str]
+
+
+def list_partitions(directory: str) -> Dict[str, str]:
+    """
+    Returns:
+        Dict[str, str]: 月份 (YYYY-MM 或 unknown) → 分區檔路徑
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    partitions = {}
+    for name in names:
+        match = PARTITION_FILE.match(name)
+        if match:
+            partitions[match.group(1)] = os.path.join(directory, name)
+    return partitions
+
+
+def date_bounds(sql: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    由 WHERE 中以 AND 連接的 Date 條件推算需要查詢的月份範圍
+
+    支援 Date 與字串常數的比較 (=、>=、>、<=、<)、BETWEEN 與前綴 LIKE (例如 '2024-03%')；
+    WHERE 的最外層有 OR 或 NOT 時不做篩選。月份 m 的資料列都以 'm-' 開頭，
+    因此 m >= lo 且 m <= hi 的分區才可能有符合的資料列。
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: (lo, hi)，沒有限制的一端為 None
+    """
+    statement = sqlparse.parse(sql)[0]
+    where = next((t for t in statement.tokens if isinstance(t, sqlparse.sql.Where)), None)
+    if where is None:
+        return None, None
+    tokens = [t for t in where.flatten() if not t.is_whitespace and t.ttype not in T.Comment]
+    lows, highs = [], []
+    depth = 0
+    for k, token in enumerate(tokens):
+        if token.ttype in T.Punctuation and token.value in '()':
+            depth += 1 if token.value == '(' else -1
+            continue
+        if depth:
+            continue
+        if token.ttype in T.Keyword and token.normalized in ('OR', 'NOT'):
+            return None, None
+        if not (token.ttype in T.Name or token.ttype in T.String.Symbol or token.ttype in T.Keyword) or \
+                token.value.strip('"[]`').lower() != 'date':
+            continue
+        if k and tokens[k - 1].value == '.':
+            continue
+        operator = tokens[k + 1].normalized.upper() if k + 1 < len(tokens) else ''
+        operands = [_literal(t) for t in tokens[k + 2:k + 5]]
+        if operator in ('=', '==', '>=', '>', '<=', '<') and operands and operands[0] is not None:
+            if operator in ('=', '==', '>=', '>'):
+                lows.append(operands[0][:7])
+            if operator in ('=', '==', '<=', '<'):
+                highs.append(operands[0])
+        elif operator == 'BETWEEN' and len(operands) == 3 and None not in (operands[0], operands[2]) and \
+                tokens[k + 3].normalized == 'AND':
+            lows.append(operands[0][:7])
+            highs.append(operands[2])
+        elif operator == 'LIKE' and operands and operands[0] is not None:
+            prefix = re.split(r'[%_]', operands[0])[0]
+            if prefix:
+                lows.append(prefix[:7])
+                highs.append(prefix + '\uffff')
+    return max(lows, default=None), min(highs, default=None)
+
+
+def _literal(token) -> Optional[str]:
+    if token.ttype in T.String.Single:
+        return token.value[1:-1].replace("''", "'")
+    return None
+
+
+def _run_partition(path: str, sql: str, max_seconds: float, max_rows: int) -> Optional[Tuple[List[str], list]]:
+    """
+    worker：在分區檔上執行查詢 (連線在行程內重複使用)
+
+    Returns:
+        Optional[Tuple[List[str], list]]: (欄位名稱, 資料列)，超過 max_rows 筆時為 None
+    """
+    conn = _worker_connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        _worker_connections[path] = conn
+    deadline = time.monotonic() + max_seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+    try:
+        cursor = conn.execute(sql)
+        columns = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+    finally:
+        conn.set_progress_handler(None, 0)
+    return None if len(rows) > max_rows else (columns, rows)
+
+
+class PartitionedExecutor:
+    """
+    依月份分區的平行查詢
+
+    plan 以 Date 條件篩選分區，並把彙總查詢拆成部分彙總與最終查詢 (query_rewriter.rewrite_to_partials)；
+    execute 以 process pool 同時在各分區計算部分彙總，合併到記憶體中的 sales_partials 後
+    以 QueryGovernor 執行最終查詢。只剩一個分區時直接在該分區執行原查詢。
+    """
+
+    def __init__(self, directory: str, governor: QueryGovernor, workers: Optional[int] = None):
+        self.directory = directory
+        self.governor = governor
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def plan(self, sql: str) -> Optional[PartitionPlan]:
+        """
+        Returns:
+            Optional[PartitionPlan]: 執行計畫，無法以分區執行時為 None
+        """
+        analysis = analyze_sql(sql)
+        if analysis.statement_count != 1 or analysis.statement_type != 'SELECT' or analysis.tables != ('sales',):
+            return None
+        partitions = list_partitions(self.directory)
+        if not partitions:
+            return None
+        lo, hi = date_bounds(sql)
+        # Date 為 NULL 的資料列不符合任何 Date 比較條件，有條件時不需要 unknown 分區
+        bounded = lo is not None or hi is not None
+        selected = [path for month, path in sorted(partitions.items())
+                    if (month == UNKNOWN_PARTITION and not bounded) or
+                    (month != UNKNOWN_PARTITION and (lo is None or month >= lo) and (hi is None or month <= hi))]
+        if not selected:
+            # 保留一個分區，讓查詢照常回傳欄位名稱與空結果
+            selected = [next(iter(sorted(partitions.values())))]
+        skipped = len(partitions) - len(selected)
+        if len(selected) == 1:
+            return PartitionPlan(tuple(selected), skipped, sql, None)
+        split = rewrite_to_partials(sql)
+        if split is None:
+            return None
+        return PartitionPlan(tuple(selected), skipped, split[0], split[1])
+
+    def execute(self, plan: PartitionPlan) -> Optional[Tuple[List[str], List[tuple]]]:
+        """
+        執行分區查詢
+
+        Returns:
+            Optional[Tuple[List[str], List[tuple]]]: (欄位名稱, 資料列)；部分彙總列數過多時為 None，
+            應改回主資料庫執行
+
+        Raises:
+            QueryTooExpensiveError: 超過執行預算
+        """
+        if plan.final_sql is None:
+            with closing(sqlite3.connect(f'file:{plan.paths[0]}?mode=ro', uri=True)) as conn:
+                return self.governor.execute(conn, plan.partial_sql)
+
+        max_seconds = self.governor.max_seconds or float('inf')
+        max_rows = (self.governor.max_rows or 100_000) * PARTIAL_ROWS_FACTOR
+        pool = self._get_pool()
+        futures = [pool.submit(_run_partition, path, plan.partial_sql, max_seconds, max_rows)
+                   for path in plan.paths]
+        done, pending = wait(futures, timeout=None if max_seconds == float('inf') else max_seconds,
+                             return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        timed_out = bool(pending)
+        results = []
+        for future in done:
+            try:
+                results.append(future.result())
+            except sqlite3.OperationalError as e:
+                if 'interrupted' not in str(e):
+                    raise
+                timed_out = True
+        if timed_out:
+            raise QueryTooExpensiveError(LIMIT_TIMEOUT, f"分區查詢超過 {max_seconds} 秒", max_seconds=max_seconds)
+        if any(result is None for result in results):
+            logger.info("部分彙總列數過多，改回主資料庫執行")
+            return None
+
+        columns = results[0][0]
+        with closing(sqlite3.connect(':memory:')) as conn:
+            conn.execute(f"CREATE TABLE {PARTIAL_TABLE} ({', '.join(f'[{col}]' for col in columns)})")
+            placeholders = ', '.join('?' for _ in columns)
+            for _, rows in results:
+                conn.executemany(f"INSERT INTO {PARTIAL_TABLE} VALUES ({placeholders})", rows)
+            return self.governor.execute(conn, plan.final_sql)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
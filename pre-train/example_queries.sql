@@ -1,5 +1,5 @@
 -- 查詢今日總銷售額
-SELECT SUM("Net Sales") FROM sales WHERE DATE(Date) = DATE('now');
+SELECT SUM("Net Sales") FROM sales WHERE Date = DATE('now');
 
 -- 查詢最熱銷商品前10名
 SELECT Item, SUM(Qty) AS total_quantity 
@@ -22,6 +22,6 @@ WHERE Item LIKE '%牛肉麵%';
 -- 2025月1月的所有銷售品項
 SELECT DISTINCT Item, COUNT(*) as Count
 FROM sales
-WHERE Date LIKE '2025-01%'
+WHERE Date >= '2025-01-01' AND Date < '2025-02-01'
 GROUP BY Item
 ORDER BY Count DESC;
\ No newline at end of file
@@ -0,0 +1,211 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from sql_validator import analyze_sql
+
+logger = logging.getLogger(__name__)
+
+# 觸發的限制種類
+LIMIT_PLAN = 'plan'
+LIMIT_TIMEOUT = 'timeout'
+LIMIT_VM_STEPS = 'vm_steps'
+LIMIT_MAX_ROWS = 'max_rows'
+
+# 結果筆數不會與表格筆數相同的寫法：LIMIT、篩選、去重與彙總
+_BOUNDED_PATTERN = re.compile(
+    r'\bLIMIT\s+\d+|\bWHERE\b|\bDISTINCT\b|\bGROUP\s+BY\b|'
+    r'\b(COUNT|SUM|TOTAL|AVG|MIN|MAX|GROUP_CONCAT)\s*\(', re.IGNORECASE)
+
+
+class QueryTooExpensiveError(Exception):
+    """查詢超過執行預算 (執行計畫、執行時間、VM 步數或結果筆數)"""
+
+    def __init__(self, limit: str, message: str, **detail):
+        super().__init__(message)
+        self.limit = limit
+        self.detail = detail
+
+    def to_dict(self) -> dict:
+        """API 回應用的錯誤內容"""
+        return {
+            'error': f'查詢成本過高: {self}',
+            'code': 'query_too_expensive',
+            'limit': self.limit,
+            'detail': self.detail
+        }
+
+
+class QueryGovernor:
+    """
+    查詢執行預算
+
+    - 執行前以 EXPLAIN QUERY PLAN 預先篩選：巢狀迴圈中的全表掃描 (交叉 JOIN、相關子查詢)，
+      以及在大表上沒有 WHERE、LIMIT 也沒有彙總的全表掃描直接拒絕
+    - 執行時以 sqlite3 progress handler 計算 VM 步數與經過時間，超過預算時中斷查詢
+    - 結果超過 max_rows 筆時停止讀取並回報錯誤
+    """
+
+    def __init__(self, max_seconds: float = 10.0, max_vm_steps: int = 500_000_000,
+                 max_rows: int = 100_000, progress_interval: int = 10_000,
+                 screen_plans: bool = True):
+        self.max_seconds = max_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_rows = max_rows
+        self.progress_interval = progress_interval
+        self.screen_plans = screen_plans
+        self._lock = threading.Lock()
+        self._stats = {
+            'executed': 0,
+            LIMIT_PLAN: 0,
+            LIMIT_TIMEOUT: 0,
+            LIMIT_VM_STEPS: 0,
+            LIMIT_MAX_ROWS: 0
+        }
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _reject(self, limit: str, message: str, **detail):
+        self._count(limit)
+        logger.warning(f"查詢超過預算 ({limit}): {message}")
+        raise QueryTooExpensiveError(limit, message, **detail)
+
+    def check_plan(self, conn: sqlite3.Connection, sql: str):
+        """
+        以 EXPLAIN QUERY PLAN 預先檢查查詢成本
+
+        Raises:
+            QueryTooExpensiveError: 執行計畫含有不允許的全表掃描
+        """
+        if not self.screen_plans:
+            return
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        nodes = {row[0]: (row[1], row[3]) for row in plan}
+        scans = [(node_id, parent, detail) for node_id, (parent, detail) in nodes.items()
+                 if _is_scan(detail)]
+
+        for node_id, parent, detail in scans:
+            # 相關子查詢中的全表掃描：外層每一列都會重新掃描一次
+            ancestor = parent
+            while ancestor in nodes:
+                if 'CORRELATED' in nodes[ancestor][1]:
+                    self._reject(LIMIT_PLAN, f"相關子查詢中有全表掃描 ({detail})", plan=_plan_lines(plan))
+                ancestor = nodes[ancestor][0]
+            # 同一層有兩個以上全表掃描：巢狀迴圈 JOIN 的內層每列都要掃描
+            siblings = [s for s in scans if s[1] == parent]
+            if len(siblings) > 1:
+                self._reject(LIMIT_PLAN, "JOIN 的兩邊都需要全表掃描", plan=_plan_lines(plan))
+
+        # 沒有篩選也沒有 LIMIT 的全表掃描會回傳整張表 (有篩選的查詢由 max_rows 在執行時限制)
+        if scans and not _BOUNDED_PATTERN.search(sql):
+            rows = max((_estimate_rows(conn, table) for table in analyze_sql(sql).tables), default=0)
+            if rows > self.max_rows:
+                self._reject(LIMIT_PLAN, f"沒有篩選或 LIMIT 的全表掃描 (約 {rows:,} 筆，上限 {self.max_rows:,})",
+                             plan=_plan_lines(plan), estimated_rows=rows)
+
+    @contextmanager
+    def guard(self, conn: sqlite3.Connection, wall_time: bool = True):
+        """
+        在區塊內以 progress handler 限制 VM 步數 (與執行時間)
+
+        串流回應應設 wall_time=False：區塊內包含等待用戶端讀取的時間
+        """
+        deadline = time.monotonic() + self.max_seconds if wall_time and self.max_seconds else None
+        max_ticks = self.max_vm_steps // self.progress_interval if self.max_vm_steps else None
+        state = {'ticks': 0, 'limit': None}
+
+        def on_progress():
+            state['ticks'] += 1
+            if max_ticks is not None and state['ticks'] > max_ticks:
+                state['limit'] = LIMIT_VM_STEPS
+                return 1
+            if deadline is not None and time.monotonic() > deadline:
+                state['limit'] = LIMIT_TIMEOUT
+                return 1
+            return 0
+
+        conn.set_progress_handler(on_progress, self.progress_interval)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if state['limit'] == LIMIT_VM_STEPS:
+                self._reject(LIMIT_VM_STEPS, f"超過 {self.max_vm_steps:,} 個 VM 步驟",
+                             vm_steps=state['ticks'] * self.progress_interval)
+            if state['limit'] == LIMIT_TIMEOUT:
+                self._reject(LIMIT_TIMEOUT, f"執行超過 {self.max_seconds} 秒", max_seconds=self.max_seconds)
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def execute(self, conn: sqlite3.Connection, sql: str, params=()) -> Tuple[List[str], List[tuple]]:
+        """
+        檢查執行計畫後在預算內執行查詢
+
+        Returns:
+            Tuple[List[str], List[tuple]]: (欄位名稱, 資料列)
+
+        Raises:
+            QueryTooExpensiveError: 超過任一預算
+        """
+        self.check_plan(conn, sql)
+        self._count('executed')
+        with self.guard(conn):
+            cursor = conn.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description or []]
+            rows = cursor.fetchmany(self.max_rows + 1) if self.max_rows else cursor.fetchall()
+        if self.max_rows and len(rows) > self.max_rows:
+            self._reject(LIMIT_MAX_ROWS, f"結果超過 {self.max_rows:,} 筆，請加上 LIMIT 或改用串流/分頁",
+                         max_rows=self.max_rows)
+        return columns, rows
+
+    def limits(self) -> dict:
+        return {
+            'max_seconds': self.max_seconds,
+            'max_vm_steps': self.max_vm_steps,
+            'max_rows': self.max_rows,
+            'screen_plans': self.screen_plans
+        }
+
+    def stats(self) -> dict:
+        """回傳各項限制觸發的次數"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['limits'] = self.limits()
+        return stats
+
+
+def _is_scan(detail: str) -> bool:
+    """SCAN 表格、覆蓋索引或子查詢結果 (不含常數列)"""
+    return detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail
+
+
+def _plan_lines(plan) -> List[str]:
+    return [row[3] for row in plan]
+
+
+def _estimate_rows(conn: sqlite3.Connection, table: str) -> int:
+    """
+    估計表格筆數：優先使用 ANALYZE 的統計，否則以 MAX(rowid) 估計
+
+    view (例如 normalized 配置的 sales) 沒有統計，rowid 為 NULL，改以 MAX(id) 估計
+    """
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+        if row and row[0]:
+            return int(row[0].split()[0])
+    except sqlite3.Error:
+        pass
+    for column in ('rowid', 'id'):
+        try:
+            rows = conn.execute(f'SELECT MAX({column}) FROM "{table}"').fetchone()[0]
+        except sqlite3.Error:
+            continue
+        if rows is not None:
+            return rows
+    return 0
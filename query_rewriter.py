@@ -0,0 +1,681 @@
+import logging
+import math
+import re
+import sqlite3
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import sqlparse
+from sqlparse import tokens as T
+
+from sql_validator import ALLOWED_COLUMNS, analyze_sql, validate_sql
+
+logger = logging.getLogger(__name__)
+
+# 每日彙總表 (由 database/csv_to_sqlite.py 的 refresh_rollups 維護)
+ROLLUP_TABLE = 'sales_daily'
+ROLLUP_DIMENSIONS = frozenset({'date', 'day_key', 'item', 'category', 'location'})
+ROLLUP_MEASURES = frozenset({'qty', 'gross sales', 'discounts', 'net sales', 'tax'})
+ROW_COUNT_EXPR = 'COALESCE(SUM(row_count), 0)'
+# 品項目錄 (每個品項一列，含 row_count 與加總欄位，由 refresh_item_catalog 維護)
+ITEM_CATALOG_TABLE = 'item_catalog'
+ITEM_CATALOG_DIMENSIONS = {'item'}
+# 子字串搜尋索引 (由 refresh_text_search 維護)：搜尋欄位的不重複值與其 FTS5 trigram 索引
+TEXT_SEARCH_TABLE = 'sales_text_fts'
+TEXT_VALUES_TABLE = 'sales_text_values'
+TEXT_SEARCH_COLUMNS = {'item': 'Item', 'category': 'Category', 'modifiers applied': 'Modifiers Applied',
+                       'notes': 'Notes'}
+
+# 分區查詢 (partition_executor.py)：各分區的部分彙總合併到這張暫存表後再計算最終結果
+PARTIAL_TABLE = 'sales_partials'
+PARTITION_MEASURES = ROLLUP_MEASURES | {'count'}
+
+# 彙總表無法正確改寫的寫法
+UNSUPPORTED_KEYWORDS = {'JOIN', 'UNION', 'INTERSECT', 'EXCEPT', 'WITH', 'OVER', 'WINDOW', 'RECURSIVE'}
+AGGREGATES = {'SUM', 'TOTAL', 'COUNT', 'MIN', 'MAX', 'AVG', 'GROUP_CONCAT'}
+SALES_COLUMNS = {col.lower() for col in ALLOWED_COLUMNS} | {'day_key', 'row_key'}
+# 比對用名稱 → 原欄位名稱
+CANONICAL_COLUMNS = {col.lower(): col for col in ALLOWED_COLUMNS | {'day_key', 'row_key'}}
+# 部分彙總可分組的欄位 (每列不同的 id、row_key 分組後與原始資料列一樣多，不適合分區合併)
+PARTITION_DIMENSIONS = frozenset(SALES_COLUMNS - PARTITION_MEASURES - {'id', 'row_key'})
+
+
+def _name(token) -> str:
+    """欄位或名稱 token 的比對用名稱 (去除引號、小寫)"""
+    value = token.value
+    if len(value) >= 2 and value[0] in '"[`' and value[-1] in '"]`':
+        value = value[1:-1]
+    return value.lower()
+
+
+def _is_name(token) -> bool:
+    return token.ttype in T.Name or token.ttype in T.String.Symbol or token.ttype in T.Keyword
+
+
+@lru_cache(maxsize=1024)
+def rewrite_to_rollup(sql: str) -> Optional[str]:
+    """
+    將只用到維度 (Date / day_key / Item / Category / Location) 的彙總查詢改寫到 sales_daily
+
+    可改寫的條件：
+    - 通過 sql_validator 的單一 SELECT，只查詢 sales (無 JOIN、子查詢、CTE、視窗函數)
+    - 有 GROUP BY、DISTINCT 或彙總函數 (否則結果筆數與原始資料列相同)
+    - 加總欄位只出現在 SUM(欄位) / TOTAL(欄位) 中；COUNT 只能是 COUNT(*) 或 COUNT(DISTINCT 維度)；
+      MIN / MAX 只能用於維度
+    - 其他欄位都必須是維度或 SELECT 中定義的別名；別名不能與維度、加總欄位以外的 sales 欄位同名
+      (WHERE 中的名稱先對應 sales 的欄位，改寫後資料表沒有該欄位，會變成對應到別名)
+
+    Returns:
+        Optional[str]: 改寫後的 SQL，無法改寫時為 None
+    """
+    rewritten = _rewrite(sql, ROLLUP_TABLE)
+    return rewritten[0] if rewritten else None
+
+
+@lru_cache(maxsize=1024)
+def rewrite_to_item_catalog(sql: str) -> Optional[str]:
+    """
+    將只用到 Item 維度 (或不分維度) 的彙總查詢改寫到品項目錄 item_catalog
+
+    例如 SELECT DISTINCT Item ... WHERE Item LIKE ...、COUNT(DISTINCT Item)、
+    GROUP BY Item 的 SUM(Qty) 與 COUNT(*)。條件與 rewrite_to_rollup 相同，
+    但目錄只有品項一個維度，掃描的列數與品項數相同。
+
+    Returns:
+        Optional[str]: 改寫後的 SQL，無法改寫時為 None
+    """
+    rewritten = _rewrite(sql, ITEM_CATALOG_TABLE)
+    if rewritten is None or not rewritten[1] <= ITEM_CATALOG_DIMENSIONS:
+        return None
+    return rewritten[0]
+
+
+@lru_cache(maxsize=1024)
+def rewrite_to_partials(sql: str) -> Optional[Tuple[str, str]]:
+    """
+    將彙總查詢拆成每個分區執行的部分彙總，以及合併部分彙總的最終查詢
+
+    部分彙總對 sales 套用原查詢的 WHERE，依用到的欄位分組並加總 SUM / TOTAL 的欄位與筆數
+    (row_count)；最終查詢把原查詢 (去掉 WHERE) 改寫到 sales_partials，條件與 rewrite_to_rollup
+    相同，但可分組的欄位是 PARTITION_DIMENSIONS。WHERE 中只能有 sales 的欄位 (不能用 SELECT 的別名
+    或子查詢)。
+
+    Returns:
+        Optional[Tuple[str, str]]: (部分彙總 SQL, 最終 SQL)，無法拆分時為 None
+    """
+    valid, _ = validate_sql(sql)
+    if not valid:
+        return None
+    statement = sqlparse.parse(sql)[0]
+    where = next((t for t in statement.tokens if isinstance(t, sqlparse.sql.Where)), None)
+    where_sql = ''
+    if where is not None:
+        where_tokens = list(where.flatten())
+        for k, token in enumerate(where_tokens):
+            if token.ttype in T.Keyword.DML:
+                return None
+            if token.ttype not in T.Name and token.ttype not in T.String.Symbol:
+                continue
+            nxt = next((t for t in where_tokens[k + 1:] if not t.is_whitespace), None)
+            if nxt is not None and nxt.value == '(':
+                continue  # 函數名稱
+            if _name(token) not in SALES_COLUMNS:
+                return None
+        where_sql = ' ' + str(where).strip().rstrip(';')
+        sql = ''.join(str(t) for t in statement.tokens if t is not where)
+
+    rewritten = _rewrite(sql, PARTIAL_TABLE, PARTITION_DIMENSIONS, PARTITION_MEASURES)
+    if rewritten is None:
+        return None
+    final_sql, dimensions, measures = rewritten
+    dimensions = [f'[{CANONICAL_COLUMNS[name]}]' for name in sorted(dimensions)]
+    select = dimensions + [f'SUM([{CANONICAL_COLUMNS[name]}]) AS [{CANONICAL_COLUMNS[name]}]'
+                           for name in sorted(measures)]
+    partial_sql = f"SELECT {', '.join(select + ['COUNT(*) AS row_count'])} FROM sales{where_sql}"
+    if dimensions:
+        partial_sql += f" GROUP BY {', '.join(dimensions)}"
+    return partial_sql, final_sql
+
+
+@lru_cache(maxsize=1024)
+def rewrite_text_search(sql: str) -> Optional[str]:
+    """
+    將搜尋欄位 (Item / Category / Modifiers Applied / Notes) 的 LIKE 條件改寫為使用子字串搜尋索引
+
+    例如 Item LIKE '%牛肉麵%' 改為 Item IN (SELECT value FROM sales_text_values ...)：
+    先以 FTS5 trigram 索引找出符合樣式的不重複值 (樣式中沒有連續 3 個字元時改為掃描不重複值)，
+    再以欄位的索引找出資料列，不需要掃描整張 sales。候選值仍以原本的 LIKE 比對，
+    結果與原查詢相同。NOT LIKE 改為 IN (不符合樣式的不重複值)：與 NOT LIKE 相同，NULL 不會符合
+    (NOT IN 在子查詢沒有結果時會讓 NULL 也符合)。
+    只改寫樣式為字串常數且沒有 ESCAPE 的條件，且欄位與樣式是 LIKE 的完整運算元、條件位於
+    WHERE / ON / HAVING / WHEN 中以 AND / OR 連接的位置 (NOT、運算式中與 SELECT 欄位清單中的 LIKE 不改寫)。
+
+    Returns:
+        Optional[str]: 改寫後的 SQL，沒有可改寫的條件時為 None
+    """
+    valid, _ = validate_sql(sql)
+    if not valid:
+        return None
+    analysis = analyze_sql(sql)
+    if analysis.statement_count != 1 or analysis.statement_type != 'SELECT' or analysis.tables != ('sales',):
+        return None
+
+    tokens = [t for t in sqlparse.parse(sql)[0].flatten()]
+    significant = [i for i, t in enumerate(tokens) if not t.is_whitespace and t.ttype not in T.Comment]
+    output = [t.value for t in tokens]
+    predicate_starts = _predicate_term_starts(tokens, significant)
+    rewrites = 0
+    for k in range(1, len(significant) - 1):
+        operator = tokens[significant[k]]
+        if operator.ttype not in T.Operator.Comparison or operator.normalized.upper() not in ('LIKE', 'NOT LIKE'):
+            continue
+        column, pattern = tokens[significant[k - 1]], tokens[significant[k + 1]]
+        if not _is_name(column) or _name(column) not in TEXT_SEARCH_COLUMNS:
+            continue
+        if pattern.ttype not in T.String.Single:
+            continue
+        # 欄位與樣式必須是 LIKE 的完整運算元 (例如 'a' || Item LIKE ... 或 LIKE 'a' || '%' 不改寫)，
+        # 且條件本身位於 WHERE / ON / HAVING / WHEN 中以 AND、OR 連接的位置：
+        # 這裡 NULL 與 false 的效果相同，改寫後 NULL 欄位在子查詢沒有結果時得到 false 而不是 NULL
+        start = k - 3 if k >= 3 and tokens[significant[k - 2]].value == '.' else k - 1
+        if start not in predicate_starts or not _ends_predicate_term(tokens, significant, k + 2):
+            continue
+        negated = operator.normalized.upper() == 'NOT LIKE'
+        condition = f"[column] = '{TEXT_SEARCH_COLUMNS[_name(column)]}' AND value " \
+                    f"{'NOT LIKE' if negated else 'LIKE'} {pattern.value}"
+        # trigram 索引只能比對連續 3 個字元以上的片段，較短的樣式 (與 NOT LIKE) 直接比對不重複值
+        literals = re.split(r'[%_]', pattern.value[1:-1].replace("''", "'"))
+        if not negated and max(len(literal) for literal in literals) >= 3:
+            condition += f" AND id IN (SELECT rowid FROM {TEXT_SEARCH_TABLE} WHERE value LIKE {pattern.value})"
+        output[significant[k]] = 'IN'
+        output[significant[k + 1]] = f"(SELECT value FROM {TEXT_VALUES_TABLE} WHERE {condition})"
+        rewrites += 1
+    return ''.join(output) if rewrites else None
+
+
+# 開始一個條件的子句，條件的值為 NULL 或 false 時效果相同
+PREDICATE_CLAUSES = {'WHERE', 'ON', 'HAVING', 'WHEN'}
+# 結束條件判斷的子句
+NON_PREDICATE_CLAUSES = {'SELECT', 'FROM', 'GROUP BY', 'ORDER BY', 'LIMIT', 'OFFSET', 'THEN', 'ELSE', 'END',
+                         'WINDOW', 'UNION', 'UNION ALL', 'INTERSECT', 'EXCEPT', 'CASE'}
+# 結束 SELECT 欄位清單的子句
+SELECT_LIST_END = {'FROM', 'WHERE', 'GROUP BY', 'HAVING', 'ORDER BY', 'LIMIT', 'WINDOW',
+                   'UNION', 'UNION ALL', 'INTERSECT', 'EXCEPT'}
+# 可以接在完整條件之後的 token
+PREDICATE_TERM_END = {'AND', 'OR', 'GROUP BY', 'ORDER BY', 'LIMIT', 'THEN', 'HAVING', 'WINDOW',
+                      'UNION', 'UNION ALL', 'INTERSECT', 'EXCEPT'}
+
+
+def _predicate_term_starts(tokens, significant: List[int]) -> Set[int]:
+    """
+    以 AND / OR 連接、直接位於 WHERE / ON / HAVING / WHEN 之下的條件的起始位置 (significant 的索引)
+
+    括號只在本身位於這種位置時延續 (函數參數、NOT (...)、IN (...) 等括號內不算)；
+    BETWEEN ... AND 的 AND 不是條件的連接。SELECT 欄位清單中 (含其中的 CASE WHEN 與子查詢) 的條件不算，
+    改寫會改變沒有別名的結果欄位名稱。
+    """
+    starts = set()
+    # 每一層括號：[該層目前是否在條件子句中, 是否有待配對的 BETWEEN, 該層或外層是否在 SELECT 欄位清單中,
+    #              外層是否在 SELECT 欄位清單中]
+    stack = [[False, False, False, False]]
+    for k, i in enumerate(significant):
+        token = tokens[i]
+        level = stack[-1]
+        keyword = token.normalized.upper() if token.is_keyword else None
+        if token.ttype in T.Punctuation and token.value == '(':
+            in_predicate = k in starts
+            stack.append([in_predicate, False, level[2], level[2]])
+            if in_predicate:
+                starts.add(k + 1)
+            continue
+        if token.ttype in T.Punctuation and token.value == ')':
+            if len(stack) > 1:
+                stack.pop()
+            continue
+        if keyword == 'SELECT':
+            level[2] = True
+        elif keyword in SELECT_LIST_END:
+            level[2] = level[3]
+        if keyword in PREDICATE_CLAUSES:
+            level[0] = True
+            if not level[2]:
+                starts.add(k + 1)
+        elif keyword in NON_PREDICATE_CLAUSES or token.ttype in T.Keyword.DML:
+            level[0] = False
+        elif keyword == 'BETWEEN':
+            level[1] = True
+        elif keyword == 'AND' and level[1]:
+            level[1] = False
+        elif keyword in ('AND', 'OR') and level[0] and not level[2]:
+            starts.add(k + 1)
+    return starts
+
+
+def _ends_predicate_term(tokens, significant: List[int], k: int) -> bool:
+    """significant[k] 是否結束一個條件 (語句結尾、右括號、AND / OR 或下一個子句)"""
+    if k >= len(significant):
+        return True
+    token = tokens[significant[k]]
+    if token.ttype in T.Punctuation:
+        return token.value in (')', ';')
+    return token.is_keyword and token.normalized.upper() in PREDICATE_TERM_END
+
+
+def _rewrite(sql: str, table: str, dimensions: FrozenSet[str] = ROLLUP_DIMENSIONS,
+             measures: FrozenSet[str] = ROLLUP_MEASURES) -> Optional[Tuple[str, FrozenSet[str], FrozenSet[str]]]:
+    """
+    將 FROM sales 改為 table 並把 COUNT(*) 改為 row_count 的加總
+
+    table 需含有 dimensions 中的欄位、以原欄位名稱儲存的 measures 部分加總，以及 row_count。
+
+    Returns:
+        Optional[Tuple[str, FrozenSet[str], FrozenSet[str]]]: (改寫後的 SQL, 用到的維度, 用到的加總欄位)，
+        無法改寫時為 None
+    """
+    valid, _ = validate_sql(sql)
+    if not valid:
+        return None
+    analysis = analyze_sql(sql)
+    if analysis.statement_count != 1 or analysis.statement_type != 'SELECT' or analysis.tables != ('sales',):
+        return None
+
+    tokens = [t for t in sqlparse.parse(sql)[0].flatten()]
+    significant = [i for i, t in enumerate(tokens) if not t.is_whitespace and t.ttype not in T.Comment]
+    aliases = {_name(tokens[significant[k + 1]]) for k, i in enumerate(significant[:-1])
+               if tokens[i].ttype in T.Keyword and tokens[i].normalized == 'AS'}
+    # 與 table 沒有的 sales 欄位同名的別名：原查詢中同一個名稱可能指欄位，改寫後卻指別名
+    if aliases & (SALES_COLUMNS - dimensions - measures):
+        return None
+
+    output = [t.value for t in tokens]
+    # 函數堆疊：(函數名稱, '(' 的位置)；一般括號的名稱為 None
+    stack = []
+    selects = 0
+    has_aggregate = False
+    has_grouping = False
+    # SELECT 清單：[(開始, 結束)]，用來為改寫後名稱會改變的欄位加上別名
+    select_items = []
+    item_start = None
+    count_rewrites = set()
+    used_dimensions = set()
+    used_measures = set()
+
+    for k, i in enumerate(significant):
+        token = tokens[i]
+        prev = tokens[significant[k - 1]] if k else None
+        nxt = tokens[significant[k + 1]] if k + 1 < len(significant) else None
+        upper = token.normalized.upper() if token.ttype in T.Keyword else token.value.upper()
+
+        if token.ttype in T.Keyword.DML:
+            selects += 1
+            if selects > 1:
+                return None
+            item_start = k + 1
+            continue
+        if token.ttype in T.Keyword and upper in UNSUPPORTED_KEYWORDS:
+            return None
+        if token.ttype in T.Keyword and upper in ('GROUP BY', 'DISTINCT'):
+            if not stack:
+                has_grouping = True
+                if item_start == k:
+                    item_start = k + 1
+            continue
+        if token.ttype in T.Keyword and upper == 'FROM' and not stack:
+            if item_start is not None:
+                select_items.append((item_start, k))
+                item_start = None
+            if nxt is None or _name(nxt) != 'sales':
+                return None
+            output[significant[k + 1]] = table
+            continue
+        if token.ttype in T.Punctuation and token.value == ',' and not stack and item_start is not None:
+            select_items.append((item_start, k))
+            item_start = k + 1
+            continue
+        if token.ttype in T.Punctuation and token.value == '.':
+            return None
+
+        if token.ttype in T.Punctuation and token.value == '(':
+            function = prev.value.upper() if prev is not None and _is_name(prev) and \
+                prev.ttype not in T.String.Symbol else None
+            stack.append((function, k))
+            if function in AGGREGATES:
+                has_aggregate = True
+                if not _aggregate_allowed(function, tokens, significant, k, dimensions, measures):
+                    return None
+                if function == 'COUNT' and _name(nxt) != 'distinct':
+                    count_rewrites.add(k - 1)
+            continue
+        if token.ttype in T.Punctuation and token.value == ')':
+            if not stack:
+                return None
+            stack.pop()
+            continue
+
+        if token.ttype in T.Wildcard and not (stack and stack[-1][0] == 'COUNT'):
+            return None
+
+        if _is_name(token):
+            if nxt is not None and nxt.value == '(':
+                continue  # 函數名稱
+            name = _name(token)
+            if prev is not None and prev.ttype in T.Keyword and prev.normalized == 'AS':
+                continue  # 別名定義
+            if name == 'sales' and prev is not None and prev.normalized == 'FROM':
+                continue
+            if name in dimensions:
+                used_dimensions.add(name)
+                continue
+            if name in measures:
+                if stack and stack[-1][0] in ('SUM', 'TOTAL'):
+                    used_measures.add(name)
+                    continue
+                return None
+            if name in aliases:
+                continue
+            if name in SALES_COLUMNS or token.ttype in T.Name or token.ttype in T.String.Symbol:
+                return None
+
+    if stack or not (has_aggregate or has_grouping):
+        return None
+
+    # COUNT(*) → COALESCE(SUM(row_count), 0)
+    for k in count_rewrites:
+        start = significant[k]
+        end = _matching_paren(tokens, significant, k + 1)
+        output[start] = ROW_COUNT_EXPR
+        for j in range(start + 1, significant[end] + 1):
+            output[j] = ''
+
+    # 含 COUNT(*) 且沒有別名的 SELECT 欄位，以原始寫法為別名，保持回傳的欄位名稱不變
+    for start, end in select_items:
+        if not any(start <= k < end for k in count_rewrites):
+            continue
+        if any(tokens[significant[k]].ttype in T.Keyword and tokens[significant[k]].normalized == 'AS'
+               for k in range(start, end)):
+            continue
+        original = ''.join(t.value for t in tokens[significant[start]:significant[end - 1] + 1])
+        quoted = original.replace('"', '""')
+        output[significant[end - 1]] += f' AS "{quoted}"'
+
+    return ''.join(output), frozenset(used_dimensions), frozenset(used_measures)
+
+
+def _aggregate_allowed(function: str, tokens, significant: List[int], open_k: int,
+                       dimensions: FrozenSet[str] = ROLLUP_DIMENSIONS,
+                       measures: FrozenSet[str] = ROLLUP_MEASURES) -> bool:
+    """檢查彙總函數的參數是否能以彙總表計算"""
+    close_k = _matching_paren(tokens, significant, open_k)
+    if close_k is None:
+        return False
+    args = [tokens[significant[k]] for k in range(open_k + 1, close_k)]
+    names = [_name(t) for t in args]
+    if function in ('SUM', 'TOTAL'):
+        return len(args) == 1 and _is_name(args[0]) and names[0] in measures
+    if function == 'COUNT':
+        if len(args) == 1 and (args[0].ttype in T.Wildcard or args[0].value == '1'):
+            return True
+        return len(args) == 2 and names[0] == 'distinct' and names[1] in dimensions
+    if function in ('MIN', 'MAX'):
+        return len(args) == 1 and _is_name(args[0]) and names[0] in dimensions
+    return False
+
+
+def _matching_paren(tokens, significant: List[int], open_k: int) -> Optional[int]:
+    depth = 0
+    for k in range(open_k, len(significant)):
+        value = tokens[significant[k]].value
+        if tokens[significant[k]].ttype in T.Punctuation and value == '(':
+            depth += 1
+        elif tokens[significant[k]].ttype in T.Punctuation and value == ')':
+            depth -= 1
+            if depth == 0:
+                return k
+    return None
+
+
+class KeysetQuery(NamedTuple):
+    """可依排序鍵分頁的查詢：SELECT select_list FROM sales [WHERE where] [ORDER BY key [DESC]]"""
+    select_list: str
+    where: Optional[str]
+    # 排序欄位 (加上方括號)；None 表示依 id 排序
+    key: Optional[str]
+    descending: bool
+
+
+# 出現在最外層時無法依排序鍵分頁的子句
+KEYSET_UNSUPPORTED = {'DISTINCT', 'ALL', 'GROUP BY', 'HAVING', 'LIMIT', 'OFFSET', 'UNION', 'UNION ALL', 'INTERSECT',
+                      'EXCEPT', 'WINDOW', 'OVER', 'JOIN', 'NATURAL', 'USING', 'INDEXED BY', 'NOT INDEXED'}
+
+
+def keyset_query(sql: str) -> Optional[KeysetQuery]:
+    """
+    分析只讀取 sales 資料列的查詢 (沒有彙總、分組、DISTINCT 與 LIMIT)，供分頁以 id (或單一排序欄位加上 id)
+    作為排序鍵，以上一頁最後一列的鍵值接續 (不需 OFFSET 重新掃描前面的資料列)
+
+    WHERE 中可以有子查詢 (例如 rewrite_text_search 改寫後的條件)；ORDER BY 只能是 sales 的單一欄位，
+    且不能是 SELECT 清單中的別名。
+
+    Returns:
+        Optional[KeysetQuery]: 無法依排序鍵分頁時為 None
+    """
+    # sql 可能已由 route_sql 改寫 (含不在允許清單中的索引表)，呼叫端已驗證過原查詢
+    statements = [stmt for stmt in sqlparse.parse(sql.strip().rstrip(';')) if str(stmt).strip()]
+    if len(statements) != 1 or statements[0].get_type() != 'SELECT':
+        return None
+    statement = statements[0]
+    tokens = [t for t in statement.flatten()]
+    significant = [i for i, t in enumerate(tokens) if not t.is_whitespace and t.ttype not in T.Comment]
+    # 最外層 (括號外) 的 token
+    top = []
+    depth = 0
+    for k, i in enumerate(significant):
+        token = tokens[i]
+        if token.ttype in T.Punctuation and token.value == '(':
+            depth += 1
+        elif token.ttype in T.Punctuation and token.value == ')':
+            depth -= 1
+        elif depth == 0:
+            top.append(k)
+
+    def keyword(k):
+        token = tokens[significant[k]]
+        return token.normalized.upper() if token.is_keyword else None
+
+    if keyword(top[0]) != 'SELECT':
+        return None
+    from_k = next((k for k in top if keyword(k) == 'FROM'), None)
+    if from_k is None or from_k == 1:
+        return None
+    for k in top:
+        name = keyword(k)
+        if name is not None and (name in KEYSET_UNSUPPORTED or name.endswith('JOIN')):
+            return None
+        if k > from_k and tokens[significant[k]].value == ',':
+            return None
+    # SELECT 清單中不能有彙總函數 (包含子查詢中的，保守起見一律不分頁)
+    for k in range(1, from_k):
+        token = tokens[significant[k]]
+        if (k + 1 < from_k and _is_name(token) and _name(token).upper() in AGGREGATES
+                and tokens[significant[k + 1]].value == '('):
+            return None
+
+    rest = [k for k in top if k > from_k]
+    if not rest or not _is_name(tokens[significant[rest[0]]]) or _name(tokens[significant[rest[0]]]) != 'sales':
+        return None
+    rest = rest[1:]
+    where_k = rest[0] if rest and keyword(rest[0]) == 'WHERE' else None
+    order_k = next((k for k in rest if keyword(k) == 'ORDER BY'), None)
+    if rest and where_k is None and order_k != rest[0]:
+        return None  # 表格別名等
+
+    def text(start_k, end_k):
+        """significant[start_k] 到 significant[end_k - 1] 的原始內容 (含空白與註解)"""
+        return ''.join(t.value for t in tokens[significant[start_k]:significant[end_k - 1] + 1])
+
+    where = None
+    if where_k is not None:
+        end = order_k if order_k is not None else len(significant)
+        if end == where_k + 1:
+            return None
+        where = text(where_k + 1, end)
+
+    key, descending = None, False
+    if order_k is not None:
+        terms = significant[order_k + 1:]
+        if not terms or len(terms) > 2:
+            return None
+        column = tokens[terms[0]]
+        if not _is_name(column) or _name(column) not in SALES_COLUMNS:
+            return None
+        if len(terms) == 2:
+            direction = tokens[terms[1]].normalized.upper() if tokens[terms[1]].is_keyword else None
+            if direction not in ('ASC', 'DESC'):
+                return None
+            descending = direction == 'DESC'
+        name = _name(column)
+        # ORDER BY 的名稱優先對應 SELECT 清單中的別名 (含省略 AS 的別名)
+        for k in range(1, from_k):
+            token = tokens[significant[k]]
+            if not _is_name(token) or _name(token) != name:
+                continue
+            previous = tokens[significant[k - 1]]
+            if (previous.is_keyword and previous.normalized == 'AS') or previous.value == ')' or \
+                    (k - 1 > 0 and previous.ttype not in T.Punctuation and previous.ttype not in T.Operator
+                     and previous.ttype not in T.Wildcard):
+                return None
+        if name != 'id':
+            key = f'[{CANONICAL_COLUMNS[name]}]'
+    return KeysetQuery(text(1, from_k), where, key, descending)
+
+
+def rollup_is_current(conn: sqlite3.Connection, table: str = ROLLUP_TABLE) -> bool:
+    """彙總表 (或品項目錄、子字串搜尋索引) 是否已涵蓋 sales 的所有資料列"""
+    try:
+        row = conn.execute(
+            "SELECT (SELECT last_id FROM rollup_state WHERE name = ?), (SELECT MAX(id) FROM sales)",
+            (table,)
+        ).fetchone()
+    except sqlite3.Error:
+        return False
+    last_id, max_id = row
+    return last_id is not None and last_id >= (max_id or 0)
+
+
+def results_match(left: Sequence[tuple], right: Sequence[tuple], rel_tol: float = 1e-9) -> bool:
+    """比較兩組查詢結果 (數值允許浮點誤差，未排序的查詢不比較順序)"""
+    if len(left) != len(right):
+        return False
+
+    def close(a, b):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            return math.isclose(a, b, rel_tol=rel_tol, abs_tol=1e-6)
+        return a == b
+
+    def key(row):
+        return tuple(
+            (v is None, 0, round(v, 6), '') if isinstance(v, (int, float)) else (v is None, 1, 0, str(v))
+            for v in row
+        )
+
+    for a_row, b_row in zip(sorted(left, key=key), sorted(right, key=key)):
+        if len(a_row) != len(b_row) or not all(close(a, b) for a, b in zip(a_row, b_row)):
+            return False
+    return True
+
+
+def verify_rewrites(conn: sqlite3.Connection, queries: Sequence[str], rewrite=rewrite_to_rollup) -> List[dict]:
+    """
+    對每個查詢分別以原始資料與改寫後的查詢 (rewrite 的結果) 執行，比較欄位名稱與結果
+
+    Returns:
+        List[dict]: 每個查詢的 {'sql', 'rewritten', 'match', 'raw_ms', 'rollup_ms'}
+    """
+    import time
+
+    results = []
+    for sql in queries:
+        rewritten = rewrite(sql)
+        entry = {'sql': sql, 'rewritten': rewritten, 'match': None, 'raw_ms': None, 'rollup_ms': None}
+        if rewritten is not None:
+            start = time.perf_counter()
+            cursor = conn.execute(sql)
+            raw_columns = [d[0] for d in cursor.description]
+            raw_rows = cursor.fetchall()
+            entry['raw_ms'] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            cursor = conn.execute(rewritten)
+            rollup_columns = [d[0] for d in cursor.description]
+            rollup_rows = cursor.fetchall()
+            entry['rollup_ms'] = (time.perf_counter() - start) * 1000
+            entry['match'] = raw_columns == rollup_columns and results_match(raw_rows, rollup_rows)
+        results.append(entry)
+    return results
+
+
+# 驗證用的查詢：涵蓋常見的彙總寫法與不應改寫的查詢
+VERIFY_QUERIES = [
+    'SELECT SUM("Net Sales") FROM sales',
+    'SELECT SUM("Net Sales") FROM sales WHERE Date = DATE(\'now\')',
+    'SELECT COUNT(*) FROM sales WHERE Date = \'1900-01-01\'',
+    'SELECT Item, SUM(Qty) AS total_quantity FROM sales GROUP BY Item ORDER BY total_quantity DESC LIMIT 10',
+    'SELECT Location, SUM("Net Sales") AS total_sales FROM sales GROUP BY Location ORDER BY total_sales DESC',
+    "SELECT DISTINCT Item FROM sales WHERE Item LIKE '%牛肉麵%'",
+    "SELECT DISTINCT Item, COUNT(*) as Count FROM sales WHERE Date >= '2025-01-01' AND Date < '2025-02-01' "
+    "GROUP BY Item ORDER BY Count DESC",
+    'SELECT Date, Location, COUNT(*), SUM("Gross Sales"), SUM(Discounts), SUM(Tax) FROM sales '
+    'GROUP BY Date, Location ORDER BY Date, Location',
+    "SELECT strftime('%Y-%m', Date) AS month, Category, ROUND(SUM(\"Net Sales\"), 2) AS net "
+    "FROM sales GROUP BY month, Category HAVING COUNT(*) > 10 ORDER BY month",
+    'SELECT Category, COUNT(DISTINCT Item) AS items, MIN(Date), MAX(Date) FROM sales GROUP BY Category',
+    'SELECT day_key, TOTAL(Qty) FROM sales WHERE day_key BETWEEN 20000 AND 20100 GROUP BY day_key',
+    'SELECT COUNT(DISTINCT Item) FROM sales',
+    'SELECT Item, COUNT(*) FROM sales GROUP BY Item ORDER BY Item',
+    "SELECT COUNT(*), SUM(\"Net Sales\") FROM sales WHERE Item LIKE '%牛肉麵%'",
+    "SELECT Date, Item, Qty FROM sales WHERE Item LIKE '%tea%' AND Location = 'Flushing' ORDER BY id LIMIT 50",
+    "SELECT COUNT(*) FROM sales WHERE Item LIKE '%麵' OR Category LIKE 'noodle_'",
+    "SELECT COUNT(*) FROM sales WHERE \"Modifiers Applied\" LIKE '%Spicy%' AND [Notes] NOT LIKE '%birthday%'",
+    # 以下不應改寫
+    'SELECT AVG("Net Sales") FROM sales',
+    'SELECT Item, Qty FROM sales LIMIT 10',
+    'SELECT "Transaction ID", SUM("Net Sales") FROM sales GROUP BY "Transaction ID" LIMIT 10',
+    'SELECT Item, SUM(Qty * 2) FROM sales GROUP BY Item',
+    'SELECT COUNT("Net Sales") FROM sales',
+    'SELECT * FROM sales LIMIT 1',
+]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(description='比較彙總表、品項目錄與子字串搜尋索引改寫前後的查詢結果')
+    parser.add_argument('--db', default='database/sales_data.db', help='資料庫位置')
+    parser.add_argument('--examples', default='pre-train/example_queries.sql', help='範例 SQL 檔')
+    args = parser.parse_args()
+
+    with open(args.examples, 'r', encoding='utf-8') as f:
+        examples = [str(stmt).strip() for stmt in sqlparse.parse(sqlparse.format(f.read(), strip_comments=True))
+                    if str(stmt).strip()]
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    mismatches = []
+    for table, rewrite in ((ROLLUP_TABLE, rewrite_to_rollup), (ITEM_CATALOG_TABLE, rewrite_to_item_catalog),
+                           (TEXT_SEARCH_TABLE, rewrite_text_search)):
+        if not rollup_is_current(conn, table):
+            print(f"{table} 不存在或尚未涵蓋所有資料，請先執行 database/csv_to_sqlite.py")
+        results = verify_rewrites(conn, VERIFY_QUERIES + examples, rewrite)
+
+        rows = [[' '.join(r['sql'].split())[:70],
+                 'no' if r['rewritten'] is None else ('ok' if r['match'] else 'MISMATCH'),
+                 f"{r['raw_ms']:.1f}" if r['raw_ms'] is not None else '',
+                 f"{r['rollup_ms']:.1f}" if r['rollup_ms'] is not None else '']
+                for r in results]
+        print(f"\n=== {table} ===")
+        print(tabulate(rows, headers=['SQL', '改寫', '原始 ms', '改寫後 ms'], tablefmt='github'))
+        table_mismatches = [r for r in results if r['match'] is False]
+        print(f"\n{sum(1 for r in results if r['rewritten'])} / {len(results)} 個查詢可改寫，"
+              f"{len(table_mismatches)} 個結果不一致")
+        mismatches.extend(table_mismatches)
+    conn.close()
+    raise SystemExit(1 if mismatches else 0)
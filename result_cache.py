@@ -0,0 +1,177 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import sqlparse
+
+from db_pool import read_only_uri
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    正規化 SQL 作為快取鍵：移除註解、統一關鍵字大小寫與空白
+
+    Args:
+        sql: SQL 查詢字串
+
+    Returns:
+        str: 正規化後的 SQL
+    """
+    formatted = sqlparse.format(sql, strip_comments=True, keyword_case='upper', strip_whitespace=True)
+    return ' '.join(formatted.split()).rstrip(';').strip()
+
+
+def estimate_size(columns: Sequence[str], rows: Sequence[tuple]) -> int:
+    """粗估查詢結果佔用的記憶體 (bytes)"""
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(col) for col in columns)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class ResultCache:
+    """
+    SELECT 查詢結果快取
+
+    以正規化 SQL 為鍵，依記憶體預算做 LRU 淘汰。
+    資料庫版本 (PRAGMA data_version 與匯入時遞增的 user_version) 改變時整個快取失效。
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 64 * 1024 * 1024,
+                 max_entry_bytes: Optional[int] = None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._monitor = None
+        # 每條監看連線的識別碼：data_version 只在同一條連線內可比較
+        self._monitor_id = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _current_version(self) -> Optional[Tuple[int, int]]:
+        """
+        讀取資料庫版本
+
+        data_version 只有在「其他」連線提交變更時才會改變，
+        因此使用一條專屬的長期唯讀連線來觀察。
+        """
+        try:
+            if self._monitor is None:
+                self._monitor = sqlite3.connect(read_only_uri(self.db_path), uri=True, check_same_thread=False)
+                self._monitor_id = os.urandom(8).hex()
+            data_version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+            user_version = self._monitor.execute("PRAGMA user_version").fetchone()[0]
+            return user_version, data_version
+        except sqlite3.Error as e:
+            logger.warning(f"讀取資料庫版本失敗，略過結果快取: {str(e)}")
+            return None
+
+    def _check_version(self) -> bool:
+        """確認資料庫版本，版本改變時清空快取；無法取得版本時回傳 False"""
+        version = self._current_version()
+        if version is None:
+            return False
+        if version != self._version:
+            if self._entries:
+                logger.info(f"資料庫已更新，清除 {len(self._entries)} 筆查詢結果快取")
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        return True
+
+    def data_version(self) -> Optional[str]:
+        """
+        目前的資料庫版本，資料有變更時必定不同 (供 HTTP ETag 使用)
+
+        包含監看連線的識別碼，重新啟動或其他行程的版本不會與之相同。
+
+        Returns:
+            Optional[str]: 版本字串，無法取得時為 None
+        """
+        with self._lock:
+            version = self._current_version()
+            if version is None:
+                return None
+            return self._format_version(version)
+
+    def _format_version(self, version: Tuple[int, int]) -> str:
+        return f'{self._monitor_id}.{version[0]}.{version[1]}'
+
+    def get(self, sql: str) -> Optional[Tuple[List[str], List[tuple]]]:
+        """
+        查詢快取
+
+        Returns:
+            Optional[Tuple[List[str], List[tuple]]]: (欄位名稱, 資料列)，未命中時為 None
+        """
+        key = normalize_sql(sql)
+        with self._lock:
+            if not self._check_version():
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, sql: str, columns: Sequence[str], rows: Sequence[tuple], version: Optional[str] = None):
+        """
+        寫入查詢結果，超過單筆上限的結果不快取
+
+        Args:
+            version: 執行查詢前讀取的 data_version()；與目前版本不同時表示執行期間資料已變更，
+                結果可能混合新舊資料，不寫入快取
+        """
+        size = estimate_size(columns, rows)
+        if size > self.max_entry_bytes:
+            logger.info(f"查詢結果過大 ({size} bytes)，不寫入快取")
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            if not self._check_version():
+                return
+            if version is not None and version != self._format_version(self._version):
+                logger.info("查詢執行期間資料庫已更新，不寫入快取")
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (list(columns), list(rows), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """回傳快取統計"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,106 @@
+import importlib.util
+import io
+import logging
+from typing import Sequence
+
+logger = logging.getLogger(__name__)
+
+# 支援的回應格式
+FORMAT_ROWS = 'rows'
+FORMAT_COLUMNAR = 'columnar'
+FORMAT_ARROW = 'arrow'
+SUPPORTED_FORMATS = (FORMAT_ROWS, FORMAT_COLUMNAR, FORMAT_ARROW)
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def arrow_available() -> bool:
+    """是否已安裝 pyarrow (不實際載入)"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def infer_column_type(values: Sequence) -> str:
+    """
+    依欄位值推斷型別 (SQLite 的 cursor.description 不含型別資訊)
+
+    Returns:
+        str: integer / real / text / blob / null
+    """
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool) or isinstance(value, int):
+            kinds.add('integer')
+        elif isinstance(value, float):
+            kinds.add('real')
+        elif isinstance(value, (bytes, bytearray)):
+            kinds.add('blob')
+        else:
+            kinds.add('text')
+        # 出現 text 或無法合併的型別時結果一定是 text；integer 與 real 需看完所有值
+        if 'text' in kinds or (len(kinds) > 1 and not kinds <= {'integer', 'real'}):
+            break
+    if not kinds:
+        return 'null'
+    if kinds <= {'integer', 'real'}:
+        return 'real' if 'real' in kinds else 'integer'
+    if len(kinds) == 1:
+        return kinds.pop()
+    return 'text'
+
+
+def to_columnar(columns: Sequence[str], rows: Sequence[tuple]) -> dict:
+    """
+    將資料列轉成欄式格式：欄位名稱只出現一次，每個欄位一個陣列
+
+    Returns:
+        dict: {'columns': [...], 'types': [...], 'row_count': n, 'data': [[欄位值...], ...]}
+    """
+    data = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    types = [infer_column_type(col) for col in data]
+    for index, col_type in enumerate(types):
+        if col_type == 'blob':
+            data[index] = [value.hex() if value is not None else None for value in data[index]]
+    return {
+        'columns': list(columns),
+        'types': types,
+        'row_count': len(rows),
+        'data': data
+    }
+
+
+def to_arrow_ipc(columns: Sequence[str], rows: Sequence[tuple], compression: str = None) -> bytes:
+    """
+    將資料列轉成 Arrow IPC stream
+
+    Args:
+        compression: Arrow IPC 壓縮方式 (lz4 / zstd)，None 表示不壓縮
+
+    Raises:
+        RuntimeError: 未安裝 pyarrow
+    """
+    try:
+        # pyarrow 為選用套件，只有 format=arrow 需要；第一次使用時才載入
+        import pyarrow as pa
+        import pyarrow.ipc as pa_ipc
+    except ImportError:
+        raise RuntimeError("format=arrow 需要安裝 pyarrow")
+    columnar = to_columnar(columns, rows)
+    arrays = []
+    for values, col_type in zip(columnar['data'], columnar['types']):
+        if col_type == 'integer':
+            arrays.append(pa.array(values, type=pa.int64()))
+        elif col_type == 'real':
+            arrays.append(pa.array(values, type=pa.float64()))
+        elif col_type == 'null':
+            arrays.append(pa.nulls(len(values)))
+        else:
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    table = pa.Table.from_arrays(arrays, names=list(columns))
+    sink = io.BytesIO()
+    options = pa_ipc.IpcWriteOptions(compression=compression) if compression else None
+    with pa_ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
@@ -0,0 +1,167 @@
+import base64
+import hashlib
+import json
+import logging
+import sqlite3
+from contextlib import nullcontext
+from typing import Iterator, List, Optional, Tuple, Union
+
+from query_governor import QueryTooExpensiveError
+from query_rewriter import KeysetQuery, keyset_query
+
+logger = logging.getLogger(__name__)
+
+# 每次 fetchmany 取回的筆數
+DEFAULT_CHUNK_SIZE = 1000
+# 分頁大小上限
+MAX_PAGE_SIZE = 10000
+
+
+def _sql_digest(sql: str) -> str:
+    return hashlib.sha256(sql.strip().rstrip(';').encode('utf-8')).hexdigest()[:16]
+
+
+def encode_page_token(sql: str, offset: int = 0, key: Optional[list] = None) -> str:
+    """產生分頁 token (包含 SQL 摘要與下一頁的位置：排序鍵 [id, 排序欄位值] 或位移)"""
+    position = {'k': key} if key is not None else {'o': offset}
+    payload = json.dumps({'h': _sql_digest(sql), **position}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_page_token(sql: str, token: Optional[str]) -> Union[int, list]:
+    """
+    解析分頁 token
+
+    Returns:
+        Union[int, list]: 依排序鍵分頁時為上一頁最後一列的 [id, 排序欄位值]，否則為位移 (第一頁為 0)
+
+    Raises:
+        ValueError: token 格式錯誤或不屬於此 SQL
+    """
+    if not token:
+        return 0
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if 'k' in payload:
+            position = payload['k']
+            valid = isinstance(position, list) and len(position) == 2 and isinstance(position[0], int)
+        else:
+            position = int(payload['o'])
+            valid = position >= 0
+    except Exception:
+        raise ValueError("無效的 page_token")
+    if payload.get('h') != _sql_digest(sql) or not valid:
+        raise ValueError("page_token 與查詢不符")
+    return position
+
+
+def _keyset_sql(query: KeysetQuery, after: Optional[list]) -> Tuple[str, list]:
+    """
+    依排序鍵取下一頁的 SQL：前面加上 id (與排序欄位) 作為隱藏欄位，以上一頁最後一列的鍵值接續
+
+    排序欄位相同時依 id 排序；SQLite 遞增排序時 NULL 在最前面，遞減時在最後面。
+    """
+    key = query.key
+    conditions, params = [], []
+    if query.where is not None:
+        # 換行讓條件結尾的 -- 註解不會吃掉右括號
+        conditions.append(f"(\n{query.where}\n)")
+    if after is not None:
+        last_id, last_value = after
+        if key is None:
+            conditions.append('id < ?' if query.descending else 'id > ?')
+            params.append(last_id)
+        elif last_value is None:
+            conditions.append(f'{key} IS NULL AND id > ?' if query.descending
+                              else f'(({key} IS NULL AND id > ?) OR {key} IS NOT NULL)')
+            params.append(last_id)
+        elif query.descending:
+            conditions.append(f'({key} < ? OR ({key} = ? AND id > ?) OR {key} IS NULL)')
+            params.extend([last_value, last_value, last_id])
+        else:
+            conditions.append(f'({key}, id) > (?, ?)')
+            params.extend([last_value, last_id])
+    hidden = 'id' if key is None else f'id, {key}'
+    if key is None:
+        order = 'id DESC' if query.descending else 'id'
+    else:
+        order = f"{key}{' DESC' if query.descending else ''}, id"
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT {hidden}, {query.select_list.strip()} FROM sales{where} ORDER BY {order} LIMIT ?", params
+
+
+def fetch_page(conn: sqlite3.Connection, sql: str, page_size: int,
+               page_token: Optional[str] = None) -> Tuple[List[str], List[tuple], Optional[str]]:
+    """
+    以分頁方式執行查詢，多取一筆判斷是否還有下一頁
+
+    只讀取 sales 資料列的查詢 (query_rewriter.keyset_query) 以 id 或排序欄位加上 id 作為排序鍵，
+    下一頁從上一頁最後一列之後開始，不需要重新掃描前面的資料列；其他查詢 (彙總等) 以 OFFSET 分頁。
+
+    Returns:
+        Tuple[List[str], List[tuple], Optional[str]]: (欄位名稱, 本頁資料列, 下一頁 token)
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    position = decode_page_token(sql, page_token)
+    query = keyset_query(sql)
+    if query is not None:
+        if isinstance(position, int) and position:
+            raise ValueError("page_token 與查詢不符")
+        paged_sql, params = _keyset_sql(query, position if isinstance(position, list) else None)
+        cursor = conn.execute(paged_sql, params + [page_size + 1])
+        hidden = 1 if query.key is None else 2
+        columns = [desc[0] for desc in cursor.description][hidden:]
+        rows = cursor.fetchall()
+        next_token = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            next_token = encode_page_token(sql, key=[last[0], last[1] if query.key is not None else None])
+        return columns, [row[hidden:] for row in rows[:page_size]], next_token
+
+    if isinstance(position, list):
+        raise ValueError("page_token 與查詢不符")
+    inner = sql.strip().rstrip(';')
+    # 換行讓原 SQL 結尾的 -- 註解不會吃掉右括號
+    paged_sql = f"SELECT * FROM (\n{inner}\n) LIMIT ? OFFSET ?"
+    cursor = conn.execute(paged_sql, (page_size + 1, position))
+    columns = [desc[0] for desc in cursor.description or []]
+    rows = cursor.fetchall()
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_token = encode_page_token(sql, position + page_size)
+    return columns, rows, next_token
+
+
+def iter_ndjson(pool, sql: str, header: Optional[dict] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, governor=None) -> Iterator[str]:
+    """
+    以 NDJSON 串流查詢結果
+
+    第一行為 header (含欄位名稱)，之後每行一筆資料，最後一行為 {"done": true, "row_count": n}；
+    執行中發生錯誤時輸出 {"error": ...} 後結束。連線只在串流期間佔用。
+    有 governor 時以其 VM 步數預算限制查詢 (不限制經過時間，因為包含用戶端讀取的時間)。
+    """
+    row_count = 0
+    try:
+        with pool.connection() as conn, (governor.guard(conn, wall_time=False) if governor else nullcontext()):
+            cursor = conn.execute(sql)
+            columns = [desc[0] for desc in cursor.description or []]
+            yield json.dumps({**(header or {}), 'columns': columns}, ensure_ascii=False) + '\n'
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                row_count += len(rows)
+                yield ''.join(
+                    json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+                    for row in rows
+                )
+        yield json.dumps({'done': True, 'row_count': row_count}) + '\n'
+        logger.info(f"串流查詢完成，返回 {row_count} 筆結果")
+    except QueryTooExpensiveError as e:
+        yield json.dumps({**e.to_dict(), 'row_count': row_count}, ensure_ascii=False) + '\n'
+    except Exception as e:
+        logger.error(f"串流查詢失敗: {str(e)}")
+        yield json.dumps({'error': f'資料庫錯誤: {str(e)}', 'row_count': row_count}, ensure_ascii=False) + '\n'
@@ -0,0 +1,319 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 問句正規化時移除的結尾標點 (中英文)
+TRAILING_PUNCTUATION = '?？!！。.，,；; '
+
+
+def normalize_question(question: str) -> str:
+    """
+    正規化問句，讓空白、大小寫與結尾標點不同的問句視為相同
+
+    Args:
+        question: 使用者輸入的問句
+
+    Returns:
+        str: 正規化後的問句
+    """
+    text = re.sub(r'\s+', ' ', question).strip().casefold()
+    return text.rstrip(TRAILING_PUNCTUATION)
+
+
+class CacheLookup(NamedTuple):
+    """SQLCache.get 的結果"""
+    sql: Optional[str]
+    # 命中方式 'exact' / 'similar'，未命中時為 None
+    match: Optional[str]
+    # 查詢時使用的問句 embedding (沒有計算時為 None)，未命中時傳給 put 與 SQL 生成以免重算
+    embedding: Optional[List[float]]
+
+
+def unit_vector(embedding: Optional[List[float]]):
+    """將 embedding 轉為單位向量 (numpy float32)，空的或長度為 0 時回傳 None"""
+    if not embedding:
+        return None
+    import numpy as np
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else None
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """計算兩個向量的 cosine 相似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(y * y for y in b))
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+class SQLCache:
+    """
+    問句 → SQL 快取
+
+    先以正規化後的問句做完全比對，未命中時再以 embedding 相似度比對。
+    以 LRU + TTL 淘汰項目，並寫入 JSON 檔案以便重新啟動後沿用。
+    訓練資料變更時 (training version 不同) 會自動清空。
+
+    相似比對使用寫入 (或載入) 時算好的單位向量，在 lock 外以一次矩陣乘法計算所有項目的相似度，
+    不阻擋其他請求的查詢與寫入。
+
+    寫入 JSON 檔案由背景 thread 進行：變更後最多等待 save_interval 秒，期間的變更合併為一次寫入，
+    序列化與寫檔都不持有快取的 lock。結束前可呼叫 flush 立即寫入。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 500,
+                 ttl_seconds: float = 7 * 24 * 3600, similarity_threshold: float = 0.95,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None, save_interval: float = 1.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self.save_interval = save_interval
+        self.training_version = None
+        self._entries = OrderedDict()
+        # 有 embedding 的項目：key → 單位向量
+        self._vectors = {}
+        # _vectors 每次變更時加一；相似比對用的矩陣 (generation, 維度, keys, 矩陣) 在 generation 不同時重建
+        self._generation = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        # 寫檔的 lock (背景 thread 與 flush 不同時寫入暫存檔)
+        self._save_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._saver = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """從磁碟載入快取"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.training_version = data.get('training_version')
+            for entry in data.get('entries', []):
+                self._entries[entry['key']] = entry
+                vector = unit_vector(entry.get('embedding'))
+                if vector is not None:
+                    self._vectors[entry['key']] = vector
+            self._evict_expired()
+            logger.info(f"載入 SQL 快取 {len(self._entries)} 筆")
+        except Exception as e:
+            logger.error(f"載入 SQL 快取失敗: {str(e)}")
+            self._entries.clear()
+            self._vectors.clear()
+
+    def _schedule_save(self):
+        """標記快取已變更，由背景 thread 寫入磁碟 (呼叫者持有 self._lock)"""
+        if not self.path:
+            return
+        self._dirty.set()
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_loop, name='sql-cache-save', daemon=True)
+            self._saver.start()
+
+    def _save_loop(self):
+        while True:
+            self._dirty.wait()
+            # 等待一段時間，期間的其他變更一起寫入
+            time.sleep(self.save_interval)
+            self.flush()
+
+    def flush(self):
+        """立即將快取寫入磁碟 (先寫暫存檔再取代，避免寫到一半的檔案)"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                # 只在 lock 內複製項目，序列化與寫檔在 lock 外進行
+                data = {
+                    'training_version': self.training_version,
+                    'entries': [dict(entry) for entry in self._entries.values()]
+                }
+            try:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"寫入 SQL 快取失敗: {str(e)}")
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items()
+                   if now - entry['created_at'] > self.ttl_seconds]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        """移除一筆項目 (呼叫者持有 self._lock)"""
+        del self._entries[key]
+        if self._vectors.pop(key, None) is not None:
+            self._generation += 1
+
+    def _clear_entries(self):
+        self._entries.clear()
+        self._vectors.clear()
+        self._generation += 1
+
+    def _embed(self, question: str) -> Optional[List[float]]:
+        if self.embed_fn is None:
+            return None
+        try:
+            return [float(x) for x in self.embed_fn(question)]
+        except Exception as e:
+            logger.warning(f"問句 embedding 失敗，僅使用完全比對: {str(e)}")
+            return None
+
+    def get(self, question: str, embedding: Optional[List[float]] = None) -> CacheLookup:
+        """
+        查詢快取
+
+        Args:
+            question: 使用者輸入的問句
+            embedding: 已算好的問句 embedding (可省略)
+
+        Returns:
+            CacheLookup: (SQL, 命中方式, 問句 embedding)，未命中時 SQL 與命中方式為 None
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch(key)
+                self.hits += 1
+                return CacheLookup(entry['sql'], 'exact', embedding)
+            has_embeddings = bool(self._vectors)
+
+        if not has_embeddings:
+            with self._lock:
+                self.misses += 1
+            return CacheLookup(None, None, embedding)
+
+        if embedding is None:
+            embedding = self._embed(question)
+        best = self._most_similar(unit_vector(embedding))
+        with self._lock:
+            if best is not None:
+                best_key, best_score = best
+                entry = self._entries.get(best_key)
+                # 計算相似度期間項目可能已被淘汰
+                if entry is not None and best_score >= self.similarity_threshold:
+                    self._touch(best_key)
+                    self.hits += 1
+                    logger.info(f"SQL 快取相似命中 ({best_score:.3f}): {entry['question']}")
+                    return CacheLookup(entry['sql'], 'similar', embedding)
+            self.misses += 1
+        return CacheLookup(None, None, embedding)
+
+    def _most_similar(self, vector) -> Optional[Tuple[str, float]]:
+        """
+        找出與單位向量 vector 最相似的項目 (只在取得候選項目時持有 lock)
+
+        Returns:
+            Optional[Tuple[str, float]]: (key, cosine 相似度)，沒有相同維度的項目時為 None
+        """
+        if vector is None:
+            return None
+        import numpy as np
+        dimension = len(vector)
+        with self._lock:
+            generation = self._generation
+            if self._matrix is not None and self._matrix[:2] == (generation, dimension):
+                _, _, keys, matrix = self._matrix
+            else:
+                keys = [key for key, v in self._vectors.items() if len(v) == dimension]
+                matrix = [self._vectors[key] for key in keys]
+        if not keys:
+            return None
+        if isinstance(matrix, list):
+            matrix = np.stack(matrix)
+            with self._lock:
+                # 期間沒有變更時保留矩陣，之後的比對不必重建
+                if self._generation == generation:
+                    self._matrix = (generation, dimension, keys, matrix)
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
+
+    def _touch(self, key: str):
+        entry = self._entries[key]
+        entry['hits'] = entry.get('hits', 0) + 1
+        entry['last_used'] = time.time()
+        self._entries.move_to_end(key)
+
+    def put(self, question: str, sql: str, embedding: Optional[List[float]] = None):
+        """
+        寫入一筆問句與對應的 SQL
+
+        Args:
+            embedding: 已算好的問句 embedding (例如 get 回傳的)，省略時在這裡計算
+        """
+        key = normalize_question(question)
+        if embedding is None:
+            embedding = self._embed(question)
+        vector = unit_vector(embedding)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if vector is not None:
+                self._vectors[key] = vector
+                self._generation += 1
+            self._entries[key] = {
+                'key': key,
+                'question': question,
+                'sql': sql,
+                'embedding': embedding,
+                'created_at': now,
+                'last_used': now,
+                'hits': 0
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._schedule_save()
+
+    def set_training_version(self, version: str):
+        """設定目前的訓練資料版本，版本不同時清空快取"""
+        with self._lock:
+            if self.training_version != version:
+                if self._entries:
+                    logger.info(f"訓練資料已變更，清除 {len(self._entries)} 筆 SQL 快取")
+                self._clear_entries()
+                self.training_version = version
+                self._schedule_save()
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._clear_entries()
+            self._schedule_save()
+
+    def stats(self) -> dict:
+        """回傳快取統計"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'training_version': self.training_version
+            }
@@ -1,6 +1,8 @@
 import sqlparse
-import re
-from typing import Tuple, List
+from sqlparse import sql as sql_tokens
+from sqlparse import tokens as T
+from functools import lru_cache
+from typing import NamedTuple, Tuple, List
 
 ALLOWED_TABLES = {'sales'}
 ALLOWED_COLUMNS = {
@@ -13,109 +15,205 @@ ALLOWED_COLUMNS = {
     'Channel', 'Token'
 }
 
+# 允許的查詢類型
+ALLOWED_TYPES = ['SELECT', 'SHOW', 'DESCRIBE', 'EXPLAIN']
+# 不允許出現的關鍵字
+DANGEROUS_KEYWORDS = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'TRUNCATE', 'CREATE']
+
+
+class SQLAnalysis(NamedTuple):
+    """一次解析得到的 SQL 資訊"""
+    statement_type: str
+    statement_count: int
+    tables: Tuple[str, ...]
+    columns: Tuple[str, ...]
+    keywords: Tuple[str, ...]
+
+
+@lru_cache(maxsize=2048)
+def analyze_sql(sql: str) -> SQLAnalysis:
+    """
+    解析 SQL 一次，在同一次走訪中取得語句類型、表格 (含 JOIN 與子查詢)、
+    SELECT 欄位與危險關鍵字。結果依 SQL 字串快取。
+
+    Args:
+        sql: SQL 查詢字串
+
+    Returns:
+        SQLAnalysis: 解析結果
+    """
+    statements = [stmt for stmt in sqlparse.parse(sql) if str(stmt).strip()]
+    if not statements:
+        return SQLAnalysis('UNKNOWN', 0, (), (), ())
+
+    walker = _Walker()
+    for index, stmt in enumerate(statements):
+        walker.walk(stmt, top_level=(index == 0))
+
+    tables = [t for t in walker.tables if t.lower() not in walker.cte_names]
+    return SQLAnalysis(
+        statement_type=statements[0].get_type().upper(),
+        statement_count=len(statements),
+        tables=tuple(dict.fromkeys(tables)),
+        columns=tuple(walker.columns),
+        keywords=tuple(dict.fromkeys(walker.keywords))
+    )
+
+
+class _Walker:
+    """走訪 sqlparse 語法樹，收集表格、欄位與關鍵字"""
+
+    def __init__(self):
+        self.tables = []
+        self.columns = []
+        self.keywords = []
+        self.cte_names = set()
+
+    def walk(self, token_list, top_level=False, in_cte=False):
+        expect_table = False
+        # 剛收集完表格：sqlparse 不會把 FROM a, (b) 組成 IdentifierList，逗號後仍是表格
+        after_table = False
+        in_select = False
+        for token in token_list.tokens:
+            if token.is_whitespace or token.ttype in T.Comment:
+                continue
+
+            if after_table and token.ttype is T.Punctuation and token.value == ',':
+                expect_table = True
+                continue
+            after_table = False
+
+            if token.is_keyword:
+                keyword = token.normalized
+                if keyword in DANGEROUS_KEYWORDS:
+                    self.keywords.append(keyword)
+                if token.ttype is T.Keyword.CTE:
+                    in_cte = True
+                    continue
+                if token.ttype is T.Keyword.DML and keyword == 'SELECT':
+                    in_select = top_level
+                    in_cte = False
+                    continue
+                if in_select and keyword in ('DISTINCT', 'ALL'):
+                    continue
+                in_select = False
+                expect_table = keyword == 'FROM' or keyword.endswith('JOIN')
+                continue
+
+            if in_cte:
+                self._collect_ctes(token)
+                continue
+
+            if expect_table:
+                self._collect_tables(token)
+                expect_table = False
+                after_table = True
+                continue
+
+            if in_select:
+                self._collect_columns(token)
+
+            if isinstance(token, sql_tokens.TokenList):
+                self.walk(token)
+
+    def _collect_ctes(self, token):
+        """WITH 子句：記錄 CTE 名稱並走訪其中的查詢"""
+        identifiers = token.get_identifiers() if isinstance(token, sql_tokens.IdentifierList) else [token]
+        for identifier in identifiers:
+            if isinstance(identifier, sql_tokens.Identifier):
+                self.cte_names.add(identifier.get_name().lower())
+            if isinstance(identifier, sql_tokens.TokenList):
+                self.walk(identifier)
+
+    def _collect_tables(self, token):
+        """FROM / JOIN 之後的表格；子查詢則遞迴走訪"""
+        if isinstance(token, sql_tokens.IdentifierList):
+            for identifier in token.get_identifiers():
+                self._collect_tables(identifier)
+        elif isinstance(token, sql_tokens.Parenthesis):
+            self._collect_parenthesis(token)
+        elif isinstance(token, sql_tokens.Identifier):
+            subquery = next((t for t in token.tokens if isinstance(t, sql_tokens.Parenthesis)), None)
+            if subquery is not None:
+                self._collect_parenthesis(subquery)
+            else:
+                self.tables.append(_table_name(token.get_real_name()))
+        elif isinstance(token, sql_tokens.Function):
+            self.tables.append(_table_name(token.get_real_name()))
+        elif token.ttype in T.Name or token.ttype in T.String.Symbol:
+            self.tables.append(_table_name(token.value))
+
+    def _collect_parenthesis(self, token):
+        """
+        FROM / JOIN 之後的括號：子查詢則遞迴走訪；
+        否則為加上括號的表格 (例如 FROM (sqlite_master) 或 (a JOIN b ON ...))，第一個項目視為表格
+        """
+        inner = [t for t in token.tokens[1:-1] if not t.is_whitespace and t.ttype not in T.Comment]
+        if not inner or inner[0].ttype is T.Keyword.DML or inner[0].ttype is T.Keyword.CTE:
+            self.walk(token)
+            return
+        self._collect_tables(inner[0])
+        self.walk(sql_tokens.TokenList(inner[1:]))
+
+    def _collect_columns(self, token):
+        """SELECT 清單中的欄位 (有別名時取別名，略過未命名的函數)"""
+        if isinstance(token, sql_tokens.IdentifierList):
+            for identifier in token.get_identifiers():
+                self._collect_columns(identifier)
+        elif isinstance(token, sql_tokens.Identifier):
+            if token.has_alias():
+                self.columns.append(token.get_alias())
+            else:
+                self.columns.append(token.get_name())
+
+
+def _table_name(name: str) -> str:
+    """去除表格名稱的 []、` 與引號"""
+    if name and name[0] in '[`"\'' and name[-1] in ']`"\'':
+        return name[1:-1]
+    return name
+
+
 def validate_sql(sql: str) -> Tuple[bool, str]:
     """
     驗證 SQL 查詢是否安全
-    
+
     Args:
         sql: SQL 查詢字串
-    
+
     Returns:
         Tuple[bool, str]: (是否有效, 錯誤訊息)
     """
     try:
-        # 解析 SQL
-        parsed = sqlparse.parse(sql)
-        if not parsed:
+        analysis = analyze_sql(sql)
+        if not analysis.statement_count:
             return False, "無效的 SQL 查詢"
-        
-        stmt = parsed[0]
-        
-        # 允許的查詢類型
-        allowed_types = ['SELECT', 'SHOW', 'DESCRIBE', 'EXPLAIN']
-        if stmt.get_type().upper() not in allowed_types:
-            return False, f"只允許 {', '.join(allowed_types)} 查詢"
-        
-        # 檢查是否包含危險關鍵字
-        dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'TRUNCATE', 'CREATE']
-        sql_upper = sql.upper()
-        for keyword in dangerous_keywords:
-            if f" {keyword} " in f" {sql_upper} ":
-                return False, f"不允許使用 {keyword} 關鍵字"
-        
-        # 檢查表格名稱
-        tables = extract_tables(sql)
-        if tables:  # 只有當查詢涉及表格時才檢查
-            for table in tables:
-                if table.lower() not in ALLOWED_TABLES:
-                    return False, f"不允許查詢表格: {table}"
-        
+
+        if analysis.statement_type not in ALLOWED_TYPES:
+            return False, f"只允許 {', '.join(ALLOWED_TYPES)} 查詢"
+
+        # 檢查是否包含危險關鍵字 (所有語句皆檢查)
+        if analysis.keywords:
+            return False, f"不允許使用 {analysis.keywords[0]} 關鍵字"
+
+        # 檢查表格名稱 (含 JOIN 與子查詢)
+        for table in analysis.tables:
+            if table.lower() not in ALLOWED_TABLES:
+                return False, f"不允許查詢表格: {table}"
+
         return True, "SQL 查詢有效"
-    
+
     except Exception as e:
         return False, f"SQL 驗證錯誤: {str(e)}"
 
 def extract_tables(sql: str) -> List[str]:
     """
-    從 SQL 查詢中提取表格名稱
+    從 SQL 查詢中提取表格名稱 (含 JOIN 與子查詢)
     """
-    tables = []
-    parsed = sqlparse.parse(sql)[0]
-    
-    def extract_from_token(token):
-        if isinstance(token, sqlparse.sql.Identifier):
-            tables.append(token.get_name())
-        elif isinstance(token, sqlparse.sql.TokenList):
-            for sub_token in token.tokens:
-                extract_from_token(sub_token)
-    
-    # 尋找 FROM 子句
-    from_seen = False
-    for token in parsed.tokens:
-        if token.is_keyword and token.normalized == 'FROM':
-            from_seen = True
-            continue
-        if from_seen:
-            if token.is_whitespace:
-                continue
-            if isinstance(token, (sqlparse.sql.Identifier, sqlparse.sql.TokenList)):
-                extract_from_token(token)
-            break
-            
-    return tables
+    return list(analyze_sql(sql).tables)
 
 def extract_columns(sql: str) -> List[str]:
     """
     從 SQL 查詢中提取欄位名稱
     """
-    columns = []
-    parsed = sqlparse.parse(sql)[0]
-    
-    def extract_from_token(token):
-        if isinstance(token, sqlparse.sql.Identifier):
-            # 處理 COUNT(*) 等函數
-            if token.has_alias():
-                columns.append(token.get_alias())
-            else:
-                columns.append(token.get_name())
-        elif isinstance(token, sqlparse.sql.Function):
-            # 處理函數名稱
-            pass
-        elif isinstance(token, sqlparse.sql.TokenList):
-            for sub_token in token.tokens:
-                extract_from_token(sub_token)
-    
-    # 尋找 SELECT 子句
-    select_seen = False
-    for token in parsed.tokens:
-        if token.is_keyword and token.normalized == 'SELECT':
-            select_seen = True
-            continue
-        if select_seen:
-            if token.is_whitespace:
-                continue
-            if token.is_keyword and token.normalized in ('FROM', 'WHERE', 'GROUP', 'ORDER'):
-                break
-            extract_from_token(token)
-            
-    return columns 
\ No newline at end of file
+    return list(analyze_sql(sql).columns)
@@ -0,0 +1,94 @@
+import contextlib
+import csv
+import io
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+# 模組放在專案根目錄，匯入程式在 database/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'database'))
+
+import csv_to_sqlite  # noqa: E402
+
+# POS 匯出檔的欄位
+CSV_COLUMNS = [
+    'Date', 'Time', 'Time Zone', 'Category', 'Item', 'Qty', 'Price Point Name', 'SKU',
+    'Modifiers Applied', 'Gross Sales', 'Discounts', 'Net Sales', 'Tax', 'Transaction ID',
+    'Payment ID', 'Device Name', 'Notes', 'Details', 'Event Type', 'Location', 'Dining Option',
+    'Customer ID', 'Customer Name', 'Customer Reference ID', 'Unit', 'Count', 'GTIN',
+    'Itemization Type', 'Fulfillment Note', 'Channel', 'Token'
+]
+# (類別, 品項, 單價)：含 LIKE 的萬用字元 % 與 _，空白的類別與品項匯入後為 NULL
+CATALOG = [
+    ('Noodles', '牛肉麵', 15.95), ('Noodles', '紅燒牛肉麵 Braised Beef Noodles', 16.95),
+    ('Rice', '滷肉飯', 9.95), ('Drinks', 'Black Tea 蜜香紅茶', 5.25), ('Drinks', '珍珠奶茶 Bubble Tea', 6.25),
+    ('Drinks', 'Bubble 珍珠 Milk', 6.50), ('Drinks', '100% Juice', 4.00), ('Drinks', 'Tea_Latte', 5.50),
+    ('Dessert', '豆花', 5.50), ('', 'Open Item', 3.00), ('Snacks', '', 2.00),
+]
+LOCATIONS = ['Flushing', 'Manhattan', 'Brooklyn', '']
+MODIFIERS = ['', '', 'Less Ice', 'Extra Spicy', '少冰 Less Sugar']
+NOTES = ['', '', '', '', 'Birthday 生日蠟燭', 'less spicy', '50% sugar']
+ROWS = 3000
+
+
+def write_sales_csv(path, rows=ROWS, seed=7):
+    """產生固定內容的模擬 POS 匯出檔：2024 年 1-6 月，約 2% 的資料列沒有日期"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for n in range(rows):
+            category, item, price = rng.choice(CATALOG)
+            qty = rng.randint(1, 3)
+            gross = round(price * qty, 2)
+            discount = round(gross * 0.1, 2) if rng.random() < 0.1 else 0.0
+            net = round(gross - discount, 2)
+            date = '' if rng.random() < 0.02 else f'2024-{rng.randint(1, 6):02d}-{rng.randint(1, 28):02d}'
+            values = {
+                'Date': date, 'Time': f'{rng.randint(10, 21):02d}:{rng.randint(0, 59):02d}:00',
+                'Time Zone': 'Eastern Time (US & Canada)', 'Category': category, 'Item': item, 'Qty': qty,
+                'Price Point Name': 'Regular', 'Modifiers Applied': rng.choice(MODIFIERS),
+                'Gross Sales': f'${gross:,.2f}', 'Discounts': f'-${discount:,.2f}' if discount else '$0.00',
+                'Net Sales': f'${net:,.2f}', 'Tax': f'${net * 0.08875:,.2f}',
+                'Transaction ID': f'T{n // 2:06d}', 'Payment ID': f'P{n // 2:06d}', 'Device Name': 'iPad',
+                'Notes': rng.choice(NOTES), 'Event Type': 'Payment', 'Location': rng.choice(LOCATIONS),
+                'Dining Option': rng.choice(['For Here', 'To Go']), 'Unit': 'ea', 'Count': 1,
+                'Itemization Type': 'Itemized Sale', 'Channel': rng.choice(['Register', 'Online']),
+            }
+            writer.writerow([values.get(col, '') for col in CSV_COLUMNS])
+
+
+@pytest.fixture(scope='session')
+def sales_db(tmp_path_factory):
+    """
+    以 csv_to_sqlite 匯入模擬資料的資料庫 (含每日彙總表、品項目錄、子字串搜尋索引與月份分區)
+
+    Returns:
+        dict: {'db_path', 'partition_dir'}
+    """
+    workdir = tmp_path_factory.mktemp('sales')
+    csv_folder = workdir / 'csv'
+    csv_folder.mkdir()
+    write_sales_csv(csv_folder / 'sales-000.csv')
+    db_path = str(workdir / 'sales.db')
+    partition_dir = str(workdir / 'partitions')
+    with contextlib.redirect_stdout(io.StringIO()):
+        csv_to_sqlite.import_csv_streaming(str(csv_folder), db_path)
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            csv_to_sqlite.refresh_rollups(conn)
+            csv_to_sqlite.refresh_item_catalog(conn)
+            csv_to_sqlite.refresh_text_search(conn)
+            csv_to_sqlite.refresh_partitions(conn, partition_dir)
+    return {'db_path': db_path, 'partition_dir': partition_dir}
+
+
+@pytest.fixture
+def sales_conn(sales_db):
+    conn = sqlite3.connect(f"file:{sales_db['db_path']}?mode=ro", uri=True)
+    yield conn
+    conn.close()
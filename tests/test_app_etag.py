@@ -0,0 +1,55 @@
+import importlib
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from conftest import REPO_ROOT
+
+SQL = 'SELECT Item, Qty, "Net Sales" FROM sales ORDER BY Date'
+
+
+@pytest.fixture(scope='module')
+def app_module(sales_db, tmp_path_factory):
+    """以 stub 後端與模擬資料庫載入 app (app 在 import 時讀取設定)"""
+    workdir = tmp_path_factory.mktemp('app')
+    env = {
+        'SALES_DB_PATH': sales_db['db_path'], 'NL_LLM_BACKEND': 'stub', 'SQL_QUERY_LOG': '',
+        'SQL_CACHE_PATH': str(workdir / 'sql_cache.json'), 'QUERY_PLAN_SCREEN': '0',
+        'OPENAI_API_KEY': 'offline',
+    }
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        with mock.patch.dict(os.environ, env):
+            yield importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.result_cache.clear()
+    return app_module.app.test_client()
+
+
+def test_repeat_request_is_not_modified(client):
+    response = client.post('/api/raw-sql', json={'sql': SQL})
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    repeat = client.post('/api/raw-sql', json={'sql': SQL}, headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+
+
+def test_truncated_stream_is_not_revalidated(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.query_governor, 'max_vm_steps', 2000)
+    body = {'sql': SQL, 'stream': True}
+    response = client.post('/api/raw-sql', json=body)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.status_code == 200
+    assert 'done' not in lines[-1]
+    assert 'ETag' not in response.headers
+
+    repeat = client.post('/api/raw-sql', json=body, headers={'If-None-Match': '*'})
+    assert repeat.status_code == 200
@@ -0,0 +1,126 @@
+import contextlib
+import csv
+import io
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import csv_to_sqlite
+from conftest import write_sales_csv
+
+ROWS = 400
+
+
+def import_folder(folder, db_path, mode='streaming'):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'parallel':
+            return csv_to_sqlite.import_csv_parallel(str(folder), str(db_path), workers=2, chunksize=97)
+        return csv_to_sqlite.import_csv_streaming(str(folder), str(db_path), chunksize=97)
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+
+def write_rows(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def sales_rows(db_path):
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        return conn.execute('SELECT * FROM sales ORDER BY id').fetchall()
+
+
+@pytest.fixture
+def csv_folder(tmp_path):
+    folder = tmp_path / 'csv'
+    folder.mkdir()
+    write_sales_csv(folder / 'sales-000.csv', ROWS)
+    return folder
+
+
+def test_every_line_item_is_kept(csv_folder, tmp_path):
+    """同一筆交易的多個品項 (包含相同品項) 都要保留"""
+    path = csv_folder / 'sales-000.csv'
+    header, *rows = read_rows(path)
+    write_rows(path, [header, *rows, rows[0], rows[0]])
+    assert import_folder(csv_folder, tmp_path / 'sales.db') == ROWS + 2
+
+
+def test_reexported_rows_are_not_duplicated(csv_folder, tmp_path):
+    """重新匯出 (金額被修正、內容 hash 不同) 的檔案中已匯入的明細不會再寫入"""
+    db_path = tmp_path / 'sales.db'
+    assert import_folder(csv_folder, db_path) == ROWS
+    header, *rows = read_rows(csv_folder / 'sales-000.csv')
+    net = header.index('Net Sales')
+    for row in rows[:ROWS // 2]:
+        row[net] = '$0.01'
+    write_rows(csv_folder / 'sales-001.csv', [header, *rows[:ROWS // 2]])
+    assert import_folder(csv_folder, db_path) == 0
+
+
+def test_rows_without_ids_use_row_hash(csv_folder, tmp_path):
+    path = csv_folder / 'sales-000.csv'
+    header, *rows = read_rows(path)
+    for row in rows[:10]:
+        row[header.index('Transaction ID')] = row[header.index('Payment ID')] = ''
+    write_rows(path, [header, *rows, rows[0], rows[1]])
+    db_path = tmp_path / 'sales.db'
+    # 沒有 ID 的完全相同資料列視為同一筆
+    assert import_folder(csv_folder, db_path) == ROWS
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        keys = [row[0] for row in conn.execute("SELECT row_key FROM sales WHERE [Transaction ID] IS NULL")]
+    assert len(keys) == 10
+    assert not any(':' in key for key in keys)
+
+
+def test_parallel_matches_streaming(csv_folder, tmp_path):
+    header, *rows = read_rows(csv_folder / 'sales-000.csv')
+    write_rows(csv_folder / 'sales-001.csv', [header, *rows[:50]])
+    # 交易 ID 不重疊的另一個檔案，結果與寫入順序無關
+    write_sales_csv(csv_folder / 'sales-002.csv', ROWS, seed=8)
+    header, *rows = read_rows(csv_folder / 'sales-002.csv')
+    for row in rows:
+        row[header.index('Transaction ID')] = 'X' + row[header.index('Transaction ID')]
+    write_rows(csv_folder / 'sales-002.csv', [header, *rows])
+    streaming = import_folder(csv_folder, tmp_path / 'streaming.db')
+    parallel = import_folder(csv_folder, tmp_path / 'parallel.db', mode='parallel')
+    assert streaming == parallel
+    assert streaming == 2 * ROWS
+    assert Counter(row[1:] for row in sales_rows(tmp_path / 'streaming.db')) == \
+        Counter(row[1:] for row in sales_rows(tmp_path / 'parallel.db'))
+    # 暫存檔已刪除
+    assert not list(tmp_path.glob('import-staging-*'))
+
+
+def test_old_row_keys_are_migrated(csv_folder, tmp_path):
+    db_path = tmp_path / 'sales.db'
+    import_folder(csv_folder, db_path)
+    expected = sales_rows(db_path)
+    # 還原為舊版資料庫：row_key 一律為原始資料列 hash，沒有遷移紀錄
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("UPDATE sales SET row_key = printf('%016x', id)")
+        conn.execute("DELETE FROM rollup_state WHERE name = ?", (csv_to_sqlite.ROW_KEY_STATE,))
+        conn.commit()
+    header, *rows = read_rows(csv_folder / 'sales-000.csv')
+    write_rows(csv_folder / 'sales-001.csv', [header, *reversed(rows)])
+    assert import_folder(csv_folder, db_path) == 0
+    assert sales_rows(db_path) == expected
+
+
+def test_normalized_view_matches_plain_and_uses_indexes(csv_folder, tmp_path):
+    plain_path, normalized_path = tmp_path / 'plain.db', tmp_path / 'normalized.db'
+    with contextlib.redirect_stdout(io.StringIO()):
+        csv_to_sqlite.import_csv_streaming(str(csv_folder), str(plain_path))
+        csv_to_sqlite.import_csv_streaming(str(csv_folder), str(normalized_path), layout='normalized')
+    assert sales_rows(plain_path) == sales_rows(normalized_path)
+
+    sql = "SELECT Location, COUNT(*) FROM sales WHERE Item = '牛肉麵' GROUP BY Location"
+    with contextlib.closing(sqlite3.connect(normalized_path)) as conn:
+        plan = ' '.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}'))
+        assert 'idx_sales_item_date' in plan
+        # 代碼為 NULL 的品項 (空白) 仍在 view 中
+        assert conn.execute('SELECT COUNT(*) FROM sales WHERE Item IS NULL').fetchone()[0] > 0
@@ -0,0 +1,28 @@
+import sqlite3
+
+import pytest
+
+from db_pool import ConnectionPool
+from result_cache import ResultCache
+
+
+def test_missing_database_is_not_created(tmp_path):
+    db_path = tmp_path / 'missing.db'
+    pool = ConnectionPool(str(db_path))
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection():
+            pass
+    assert ResultCache(str(db_path)).data_version() is None
+    assert not db_path.exists()
+
+
+def test_journal_mode_is_left_unchanged(tmp_path):
+    db_path = tmp_path / 'sales.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE sales (Item TEXT)")
+    pool = ConnectionPool(str(db_path))
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone() == (0,)
+    assert ResultCache(str(db_path)).data_version() is not None
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
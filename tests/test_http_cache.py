@@ -0,0 +1,31 @@
+import zlib
+
+from werkzeug.http import parse_etags
+
+from http_cache import ENCODING_GZIP, compress_stream, matching_etag, result_etag
+
+
+def test_weak_etag_matches_any_encoding():
+    etag = result_etag('SELECT 1', 'v1', 'raw_sql', {})
+    assert matching_etag(parse_etags(f'W/"{etag}"'), etag)
+    assert matching_etag(parse_etags(f'"other", W/"{etag}"'), etag)
+    assert not matching_etag(parse_etags('W/"other"'), etag)
+    assert not matching_etag(parse_etags(None), etag)
+
+
+def test_compress_stream_yields_before_source_is_exhausted():
+    consumed = []
+
+    def source():
+        for n in range(3):
+            consumed.append(n)
+            yield f'{{"row": {n}}}\n'
+
+    sizes = []
+    stream = compress_stream(source(), ENCODING_GZIP, lambda original, compressed: sizes.append(original))
+    first = next(stream)
+    # 第一段壓縮後立即送出，不先讀取到壓縮門檻
+    assert consumed == [0]
+    body = first + b''.join(stream)
+    assert zlib.decompress(body, 31) == b'{"row": 0}\n{"row": 1}\n{"row": 2}\n'
+    assert sizes == [33]
@@ -0,0 +1,32 @@
+import sqlite3
+
+from result_cache import ResultCache
+
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sales (Item TEXT)")
+    conn.execute("INSERT INTO sales VALUES ('牛肉麵')")
+    conn.commit()
+    return conn
+
+
+def test_put_skips_results_read_before_a_write(tmp_path):
+    db_path = str(tmp_path / 'sales.db')
+    writer = make_db(db_path)
+    cache = ResultCache(db_path)
+    sql = 'SELECT Item FROM sales'
+
+    version = cache.data_version()
+    rows = writer.execute(sql).fetchall()
+    # 查詢執行期間另一條連線寫入資料
+    writer.execute("INSERT INTO sales VALUES ('滷肉飯')")
+    writer.commit()
+    cache.put(sql, ['Item'], rows, version)
+    assert cache.get(sql) is None
+
+    version = cache.data_version()
+    rows = writer.execute(sql).fetchall()
+    cache.put(sql, ['Item'], rows, version)
+    assert cache.get(sql) == (['Item'], rows)
+    writer.close()
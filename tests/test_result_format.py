@@ -0,0 +1,20 @@
+from itertools import permutations
+
+import pytest
+
+from result_format import infer_column_type
+
+
+@pytest.mark.parametrize('values, expected', [
+    ([], 'null'),
+    ([None, None], 'null'),
+    ([1, None, 2], 'integer'),
+    ([1, 2.5, None], 'real'),
+    ([1, 2.5, 'a'], 'text'),
+    ([1, b'x'], 'text'),
+    ([b'x', None], 'blob'),
+    ([True, 3], 'integer'),
+])
+def test_infer_column_type_ignores_value_order(values, expected):
+    for ordering in permutations(values):
+        assert infer_column_type(list(ordering)) == expected, ordering
@@ -0,0 +1,75 @@
+import pytest
+
+from query_rewriter import keyset_query, results_match, rewrite_text_search
+from result_stream import decode_page_token, encode_page_token, fetch_page
+
+
+def all_pages(conn, sql, page_size):
+    pages, token = [], None
+    while True:
+        columns, rows, token = fetch_page(conn, sql, page_size, token)
+        pages.append(rows)
+        if token is None:
+            return columns, pages
+
+
+@pytest.mark.parametrize('sql, order', [
+    ("SELECT id, Item, Qty FROM sales", None),
+    ("SELECT id, Item FROM sales WHERE Location = 'Flushing' ORDER BY id DESC", None),
+    # Date 有 NULL，且同一天有多筆
+    ("SELECT id, Date, Item FROM sales ORDER BY Date", 1),
+    ("SELECT id, Date FROM sales WHERE Qty > 1 ORDER BY Date DESC", 1),
+    ("SELECT id, Item FROM sales WHERE Item NOT LIKE '%Tea%' ORDER BY Item DESC", 1),
+    ('SELECT id, "Net Sales", Item FROM sales ORDER BY "Net Sales" ASC', 1),
+    (rewrite_text_search("SELECT id, Item FROM sales WHERE Item LIKE '%牛肉%' ORDER BY id"), None),
+])
+def test_keyset_pages_cover_every_row_once(sales_conn, sql, order):
+    assert keyset_query(sql) is not None
+    raw_columns = [d[0] for d in sales_conn.execute(sql).description]
+    raw_rows = sales_conn.execute(sql).fetchall()
+    for page_size in (13, 500):
+        columns, pages = all_pages(sales_conn, sql, page_size)
+        rows = [row for page in pages for row in page]
+        assert columns == raw_columns
+        assert all(len(page) == page_size for page in pages[:-1])
+        assert len({row[0] for row in rows}) == len(rows)
+        assert results_match(raw_rows, rows)
+        if order is not None:
+            # 與原查詢相同的排序 (SQLite：NULL 在遞增排序的最前面)
+            assert [row[order] for row in rows] == [row[order] for row in raw_rows]
+
+
+def test_keyset_token_records_last_key(sales_conn):
+    sql = "SELECT Item FROM sales ORDER BY Date"
+    _, rows, token = fetch_page(sales_conn, sql, 3)
+    last_id, last_date = decode_page_token(sql, token)
+    assert isinstance(last_id, int)
+    assert sales_conn.execute("SELECT Date FROM sales WHERE id = ?", (last_id,)).fetchone()[0] == last_date
+
+
+def test_aggregates_fall_back_to_offset(sales_conn):
+    sql = "SELECT Item, SUM(Qty) FROM sales GROUP BY Item ORDER BY Item"
+    assert keyset_query(sql) is None
+    _, pages = all_pages(sales_conn, sql, 4)
+    assert [row for page in pages for row in page] == sales_conn.execute(sql).fetchall()
+    assert decode_page_token(sql, encode_page_token(sql, 4)) == 4
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT Item AS Date FROM sales ORDER BY Date",
+    "SELECT Item Date FROM sales ORDER BY Date",
+    "SELECT Item FROM sales ORDER BY Date, Item",
+    "SELECT Item FROM sales ORDER BY 1",
+    "SELECT DISTINCT Item FROM sales",
+    "SELECT COUNT(*) FROM sales WHERE Qty > 1",
+    "SELECT Item FROM sales s WHERE s.Qty > 1",
+    "SELECT Item FROM sales LIMIT 10",
+])
+def test_queries_without_a_stable_key_are_not_keyset_paged(sql):
+    assert keyset_query(sql) is None
+
+
+def test_token_from_another_query_is_rejected(sales_conn):
+    token = fetch_page(sales_conn, "SELECT Item FROM sales", 2)[2]
+    with pytest.raises(ValueError):
+        fetch_page(sales_conn, "SELECT Qty FROM sales", 2, token)
@@ -0,0 +1,120 @@
+import pytest
+
+from partition_executor import PartitionedExecutor
+from query_governor import QueryGovernor
+from query_rewriter import (
+    ITEM_CATALOG_TABLE, VERIFY_QUERIES, results_match, rewrite_text_search, rewrite_to_item_catalog,
+    rewrite_to_rollup, rollup_is_current, verify_rewrites
+)
+
+# 彙總表可回答的查詢：分組、LIKE / NOT LIKE、NULL 值與日期範圍
+ROLLUP_QUERIES = [
+    'SELECT SUM("Net Sales"), SUM(Qty), COUNT(*) FROM sales',
+    'SELECT Item, SUM(Qty) AS total_qty FROM sales GROUP BY Item ORDER BY total_qty DESC',
+    'SELECT Category, Location, COUNT(*), TOTAL(Discounts) FROM sales GROUP BY Category, Location',
+    'SELECT Date, SUM("Gross Sales"), SUM(Tax) FROM sales GROUP BY Date ORDER BY Date',
+    "SELECT strftime('%Y-%m', Date) AS month, ROUND(SUM(\"Net Sales\"), 2) FROM sales GROUP BY month",
+    "SELECT COUNT(*), SUM(Qty) FROM sales WHERE Date >= '2024-02-01' AND Date < '2024-04-01'",
+    "SELECT Item, COUNT(*) FROM sales WHERE Date BETWEEN '2024-03-01' AND '2024-03-31' GROUP BY Item",
+    "SELECT Location, SUM(\"Net Sales\") FROM sales WHERE Date > '2024-05-15' GROUP BY Location",
+    'SELECT day_key, TOTAL(Qty) FROM sales WHERE day_key BETWEEN 19760 AND 19800 GROUP BY day_key',
+    "SELECT COUNT(*) FROM sales WHERE Item LIKE '%牛肉%'",
+    "SELECT Category, SUM(Qty) FROM sales WHERE Item NOT LIKE '%Tea%' GROUP BY Category",
+    "SELECT COUNT(*) FROM sales WHERE Item LIKE '100%' OR Item LIKE 'Tea_Latte'",
+    # NULL 的日期、類別、品項與地點
+    'SELECT COUNT(*), SUM(Qty) FROM sales WHERE Date IS NULL',
+    'SELECT COUNT(*) FROM sales WHERE Item IS NULL OR Category IS NULL',
+    'SELECT Location, COUNT(*) FROM sales WHERE Location IS NOT NULL GROUP BY Location',
+    'SELECT COUNT(DISTINCT Item), MIN(Date), MAX(Date) FROM sales',
+    "SELECT COUNT(*) FROM sales WHERE Date = '1900-01-01'",
+]
+
+# 品項目錄可回答的查詢
+ITEM_CATALOG_QUERIES = [
+    'SELECT Item, SUM(Qty) AS total_qty, SUM("Net Sales") FROM sales GROUP BY Item ORDER BY total_qty DESC',
+    'SELECT DISTINCT Item FROM sales',
+    "SELECT DISTINCT Item FROM sales WHERE Item LIKE '%麵%'",
+    "SELECT Item, COUNT(*) FROM sales WHERE Item NOT LIKE '%Tea%' GROUP BY Item",
+    'SELECT COUNT(DISTINCT Item) FROM sales',
+    'SELECT Item, COUNT(*) FROM sales WHERE Item IS NULL GROUP BY Item',
+]
+
+# 分區執行 (部分彙總後合併) 的查詢：包含彙總表沒有的欄位
+PARTITION_QUERIES = ROLLUP_QUERIES + [
+    'SELECT Channel, "Dining Option", SUM("Net Sales"), COUNT(*) FROM sales GROUP BY Channel, "Dining Option"',
+    "SELECT \"Modifiers Applied\", SUM(Qty) FROM sales WHERE Date >= '2024-06-01' GROUP BY \"Modifiers Applied\"",
+    "SELECT COUNT(*) FROM sales WHERE Notes LIKE '%生日%' AND Date < '2024-03-01'",
+    "SELECT Notes, COUNT(*) FROM sales WHERE Notes NOT LIKE '%spicy%' GROUP BY Notes",
+    'SELECT SUM(Count) FROM sales WHERE Notes IS NULL',
+]
+
+
+def assert_all_match(results):
+    for entry in results:
+        assert entry['rewritten'] is not None, entry['sql']
+        assert entry['match'], entry
+
+
+def test_derived_tables_are_current(sales_conn):
+    for table in ('sales_daily', ITEM_CATALOG_TABLE):
+        assert rollup_is_current(sales_conn, table)
+
+
+def test_rollup_rewrite_matches_raw(sales_conn):
+    assert_all_match(verify_rewrites(sales_conn, ROLLUP_QUERIES, rewrite_to_rollup))
+
+
+def test_item_catalog_rewrite_matches_raw(sales_conn):
+    assert_all_match(verify_rewrites(sales_conn, ITEM_CATALOG_QUERIES, rewrite_to_item_catalog))
+
+
+@pytest.mark.parametrize('rewrite', [rewrite_to_rollup, rewrite_to_item_catalog, rewrite_text_search])
+def test_verify_queries_match_raw(sales_conn, rewrite):
+    for entry in verify_rewrites(sales_conn, VERIFY_QUERIES, rewrite):
+        assert entry['match'] is not False, entry
+
+
+@pytest.fixture(scope='module')
+def partitioned(sales_db):
+    executor = PartitionedExecutor(sales_db['partition_dir'], QueryGovernor(screen_plans=False), workers=2)
+    yield executor
+    executor.close()
+
+
+@pytest.mark.parametrize('sql', PARTITION_QUERIES)
+def test_partitioned_execution_matches_raw(sales_conn, partitioned, sql):
+    plan = partitioned.plan(sql)
+    assert plan is not None
+    result = partitioned.execute(plan)
+    assert result is not None
+    cursor = sales_conn.execute(sql)
+    assert result[0] == [d[0] for d in cursor.description]
+    assert results_match(cursor.fetchall(), result[1]), plan
+
+
+def test_date_range_skips_partitions(partitioned):
+    plan = partitioned.plan("SELECT SUM(Qty) FROM sales WHERE Date >= '2024-03-01' AND Date <= '2024-04-30'")
+    # 3、4 月兩個分區，其他月份與沒有日期的分區略過
+    assert len(plan.paths) == 2
+    assert plan.skipped == 5
+
+
+# 別名與 sales 的其他欄位同名：WHERE 中的名稱指原始欄位，改寫後會變成指別名
+ALIAS_SHADOWING_QUERIES = [
+    "SELECT Location AS Channel, COUNT(*) FROM sales WHERE Channel = 'Online' GROUP BY Location",
+    "SELECT Item AS Notes, COUNT(*) FROM sales WHERE Notes LIKE '%x%' GROUP BY Item",
+]
+
+
+@pytest.mark.parametrize('sql', ALIAS_SHADOWING_QUERIES)
+def test_alias_shadowing_column_is_not_rewritten(sql):
+    assert rewrite_to_rollup(sql) is None
+
+
+
+def test_alias_shadowing_column_is_not_rewritten_to_item_catalog(sales_conn):
+    sql = "SELECT Item AS Notes, COUNT(*) FROM sales WHERE Notes LIKE '%spicy%' GROUP BY Item"
+    assert rewrite_to_item_catalog(sql) is None
+    # 改寫後會以品項名稱過濾，結果不同
+    shadowed = sql.replace('FROM sales', f'FROM {ITEM_CATALOG_TABLE}').replace('COUNT(*)', 'SUM(row_count)')
+    assert not results_match(sales_conn.execute(sql).fetchall(), sales_conn.execute(shadowed).fetchall())
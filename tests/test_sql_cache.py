@@ -0,0 +1,71 @@
+import json
+import time
+
+from sql_cache import SQLCache
+
+
+class CountingEmbedder:
+    """以字元出現次數當作 embedding，記錄呼叫次數"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return [text.count(c) for c in 'abcdefghij']
+
+
+def test_miss_embeds_once(tmp_path):
+    embed = CountingEmbedder()
+    cache = SQLCache(str(tmp_path / 'cache.json'), embed_fn=embed)
+    cache.put('total sales', 'SELECT SUM("Net Sales") FROM sales')
+    assert embed.calls == 1
+
+    lookup = cache.get('daily items')
+    assert lookup.sql is None
+    assert lookup.embedding is not None
+    cache.put('daily items', 'SELECT Date, Item FROM sales', embedding=lookup.embedding)
+    assert embed.calls == 2
+
+    assert cache.get('Daily items?') == ('SELECT Date, Item FROM sales', 'exact', None)
+    assert cache.get('daily itemz').match == 'similar'
+
+
+def test_saves_are_batched_in_background(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache = SQLCache(str(path), save_interval=0.2)
+    for n in range(20):
+        cache.put(f'question {n}', f'SELECT {n}')
+    # 寫入延遲到背景 thread，put 不寫檔
+    assert not path.exists()
+
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(json.loads(path.read_text(encoding='utf-8'))['entries']) == 20
+
+
+def test_flush_writes_pending_changes(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache = SQLCache(str(path), save_interval=60)
+    cache.set_training_version('v1')
+    cache.put('total sales', 'SELECT SUM("Net Sales") FROM sales')
+    cache.flush()
+
+    reloaded = SQLCache(str(path))
+    assert reloaded.training_version == 'v1'
+    assert reloaded.get('total sales').sql == 'SELECT SUM("Net Sales") FROM sales'
+
+
+def test_similar_lookup_follows_evictions_and_updates():
+    embed = CountingEmbedder()
+    cache = SQLCache(max_entries=2, embed_fn=embed)
+    cache.put('abc', 'SELECT 1')
+    assert cache.get('abcz').sql == 'SELECT 1'
+    cache.put('abc', 'SELECT 2')
+    assert cache.get('abcz').sql == 'SELECT 2'
+    # 超過 max_entries 淘汰最舊的項目，相似比對不再回傳
+    cache.put('defg', 'SELECT 3')
+    cache.put('hij', 'SELECT 4')
+    assert cache.get('abcz').sql is None
+    assert cache.get('hijz')[:2] == ('SELECT 4', 'similar')
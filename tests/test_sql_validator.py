@@ -0,0 +1,35 @@
+import pytest
+
+from sql_validator import analyze_sql, validate_sql
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT name, sql FROM (sqlite_master)',
+    'SELECT * FROM ((sqlite_master))',
+    'SELECT * FROM ("sqlite_master")',
+    'SELECT * FROM ([sqlite_master])',
+    'SELECT * FROM (`sqlite_master`)',
+    'SELECT * FROM (sqlite_master) m',
+    'SELECT * FROM sales JOIN (sqlite_master) ON 1',
+    'SELECT * FROM sales LEFT JOIN (sqlite_master) m ON m.name = sales.Item',
+    'SELECT * FROM (sales JOIN sqlite_master ON 1)',
+    'SELECT * FROM sales, (sqlite_master)',
+    'SELECT * FROM sales, [sqlite_master]',
+])
+def test_parenthesized_tables_are_checked(sql):
+    is_valid, message = validate_sql(sql)
+    assert not is_valid
+    assert 'sqlite_master' in message
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT * FROM (sales)',
+    'SELECT * FROM (sales) s WHERE s.Qty > 1',
+    'SELECT * FROM [sales]',
+    'SELECT * FROM (SELECT Item, Qty FROM sales) t',
+    'SELECT * FROM sales a, sales b WHERE a.id = b.id',
+    'SELECT * FROM sales JOIN (SELECT Item FROM sales GROUP BY Item) t ON t.Item = sales.Item',
+])
+def test_allowed_tables(sql):
+    assert validate_sql(sql) == (True, 'SQL 查詢有效')
+    assert analyze_sql(sql).tables == ('sales',)
@@ -0,0 +1,50 @@
+import pytest
+
+chromadb = pytest.importorskip('chromadb')
+
+import vector_store  # noqa: E402
+from vector_store import COMPACT_SUFFIX, collection_names, create_client, rebuild_collection  # noqa: E402
+
+EMBEDDINGS = [[0.1, 0.2, 0.3], [0.3, 0.2, 0.1], [0.5, 0.5, 0.5]]
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = create_client(str(tmp_path))
+    collection = client.create_collection('sql')
+    collection.add(ids=['a', 'b', 'c'], embeddings=EMBEDDINGS, documents=['一', '二', '三'])
+    return client
+
+
+def interrupt_after_delete(client, name):
+    """模擬重建時在刪除舊的 collection 之後、改名之前中斷"""
+    original = client.delete_collection
+
+    def delete_then_fail(target):
+        original(target)
+        if target == name:
+            raise KeyboardInterrupt
+
+    client.delete_collection = delete_then_fail
+    with pytest.raises(KeyboardInterrupt):
+        rebuild_collection(client, name)
+    client.delete_collection = original
+
+
+def test_rebuild_recovers_interrupted_rename(client):
+    interrupt_after_delete(client, 'sql')
+    assert collection_names(client) == ['sql' + COMPACT_SUFFIX]
+
+    switched = []
+    rebuilt = rebuild_collection(client, 'sql', on_rebuilt=lambda name, c: switched.append(name))
+    assert collection_names(client) == ['sql']
+    assert sorted(rebuilt.get()['ids']) == ['a', 'b', 'c']
+    assert switched == ['sql']
+
+
+def test_new_client_recovers_before_collections_are_created(client, tmp_path):
+    interrupt_after_delete(client, 'sql')
+    reopened = create_client(str(tmp_path))
+    # vanna 啟動時以 get_or_create_collection 取得 collection，不會建立空的
+    assert reopened.get_or_create_collection('sql').count() == 3
+    assert vector_store.recover_interrupted(reopened) == []
@@ -0,0 +1,46 @@
+from warmup import WARMUP_FAILED, WARMUP_READY, Warmup
+
+
+def flaky(failures):
+    calls = []
+
+    def stage():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise RuntimeError('vector store unavailable')
+    return stage, calls
+
+
+def test_failed_stage_is_retried_until_ready():
+    first_calls = []
+    stage, calls = flaky(2)
+    warmup = Warmup([('db_pool', lambda: first_calls.append(1)), ('vector_store', stage)],
+                    retry_delay=0.01, max_retry_delay=0.02)
+    warmup.run()
+    assert warmup.ready
+    assert len(calls) == 3
+    # 已完成的階段不重新執行
+    assert len(first_calls) == 1
+    status = warmup.status()
+    assert status['error'] is None
+    assert status['stages']['vector_store'] == {'status': WARMUP_READY, 'ms': status['stages']['vector_store']['ms'],
+                                                'attempts': 3}
+
+
+def test_wait_returns_while_retry_is_pending():
+    stage, _ = flaky(100)
+    warmup = Warmup([('vector_store', stage)], retry_delay=30)
+    warmup.start()
+    assert warmup.wait(5) is False
+    status = warmup.status()
+    assert status['state'] == WARMUP_FAILED
+    assert status['retry_in_s'] > 0
+
+
+def test_gives_up_after_max_attempts():
+    stage, calls = flaky(100)
+    warmup = Warmup([('vector_store', stage), ('training', lambda: None)], retry_delay=0.01, max_attempts=2)
+    warmup.run()
+    assert not warmup.ready
+    assert len(calls) == 2
+    assert warmup.status()['stages']['training']['status'] == 'skipped'
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 訓練項目類型
+KIND_DDL = 'ddl'
+KIND_DOCUMENTATION = 'documentation'
+KIND_SQL = 'sql'
+
+
+def make_item(kind: str, content: str, question: Optional[str] = None) -> dict:
+    """
+    建立一個訓練項目，並以內容計算 hash
+
+    Args:
+        kind: 項目類型 (ddl / documentation / sql)
+        content: DDL、文件或 SQL 內容
+        question: SQL 對應的問句 (僅 sql 類型)
+
+    Returns:
+        dict: 訓練項目
+    """
+    digest = hashlib.sha256()
+    digest.update(kind.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update((question or '').encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(content.encode('utf-8'))
+    return {
+        'kind': kind,
+        'content': content,
+        'question': question,
+        'hash': digest.hexdigest()
+    }
+
+
+def parse_example_queries(text: str) -> List[Tuple[Optional[str], str]]:
+    """
+    解析範例查詢檔，以每段 SQL 前的 `--` 註解作為問句
+
+    Returns:
+        List[Tuple[Optional[str], str]]: (問句, SQL) 清單，沒有註解的 SQL 問句為 None
+    """
+    queries = []
+    for block in text.split(';'):
+        question = None
+        sql_lines = []
+        for line in block.strip().splitlines():
+            stripped = line.strip()
+            if stripped.startswith('--'):
+                if not sql_lines:
+                    question = stripped.lstrip('-').strip() or question
+                continue
+            if stripped:
+                sql_lines.append(line.rstrip())
+        if sql_lines:
+            queries.append((question, '\n'.join(sql_lines)))
+    return queries
+
+
+def split_documentation(text: str) -> List[str]:
+    """
+    將 Markdown 文件拆成術語層級的項目：每個清單項目一筆，並在前面加上所屬的標題，
+    其他段落各自一筆。檢索時只會取回與問題相關的術語，而不是整份文件。
+
+    Returns:
+        List[str]: 文件項目
+    """
+    entries = []
+    heading = None
+    paragraph = []
+
+    def flush():
+        if paragraph:
+            entries.append('\n'.join(([heading] if heading else []) + paragraph))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush()
+        elif stripped.startswith('#'):
+            flush()
+            heading = stripped.lstrip('#').strip()
+        elif stripped.startswith(('- ', '* ')):
+            flush()
+            paragraph.append(stripped)
+        else:
+            paragraph.append(stripped)
+    flush()
+    return entries
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    """讀取訓練 manifest，檔案不存在或損毀時回傳空的 manifest"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('items', {})
+    except Exception as e:
+        logger.error(f"讀取訓練 manifest 失敗，將重新訓練: {str(e)}")
+        return {}
+
+
+def save_manifest(path: str, manifest: Dict[str, dict]):
+    """寫入訓練 manifest"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'items': manifest}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def plan_training(items: List[dict], manifest: Dict[str, dict]) -> Tuple[List[dict], Dict[str, dict]]:
+    """
+    比對訓練項目與 manifest
+
+    Returns:
+        Tuple[List[dict], Dict[str, dict]]: (需要新增的項目, 需要移除的 manifest 項目)
+    """
+    current = {item['hash'] for item in items}
+    new_items = [item for item in items if item['hash'] not in manifest]
+    stale = {h: entry for h, entry in manifest.items() if h not in current}
+    return new_items, stale
+
+
+def training_fingerprint(items: List[dict]) -> str:
+    """以所有訓練項目的 hash 計算訓練資料版本"""
+    digest = hashlib.sha256()
+    for item_hash in sorted(item['hash'] for item in items):
+        digest.update(item_hash.encode('ascii'))
+    return digest.hexdigest()
+
@@ -0,0 +1,216 @@
+"""
+Vanna (ChromaDB + OpenAI) 後端
+
+vanna、chromadb、openai 與 pandas 的載入時間較長，app.py 只在第一次需要
+Vanna 時 (背景暖機或第一個 NL 查詢) 才載入這個模組。
+"""
+import json
+import logging
+import threading
+from typing import Callable, List, Sequence, Tuple
+
+import pandas as pd
+from vanna.chromadb import ChromaDB_VectorStore
+from vanna.openai import OpenAI_Chat
+from vanna.utils import deterministic_uuid
+
+import metrics
+import vector_store
+from prompt_context import DEFAULT_DDL_KEEP_COLUMNS, PromptContextBuilder, estimate_tokens
+from training_manifest import KIND_DDL, KIND_DOCUMENTATION, KIND_SQL
+
+logger = logging.getLogger(__name__)
+
+
+class MyVanna(ChromaDB_VectorStore, OpenAI_Chat):
+    def __init__(self, config=None,
+                 query_fn: Callable[[str], Tuple[List[str], Sequence[tuple], bool]] = None):
+        ChromaDB_VectorStore.__init__(self, config=config)
+        OpenAI_Chat.__init__(self, config=config)
+        # 執行 SQL 的函數 (app.query_database)，經過連線池、查詢預算與結果快取
+        self.query_fn = query_fn
+        # 訓練與向量資料庫維護不可同時進行 (重建 collection 時寫入的項目會遺失)
+        self.maintenance_lock = threading.Lock()
+        self.prompt_builder = PromptContextBuilder(
+            max_tokens=self.config.get('prompt_context_tokens', 2000),
+            keep_columns=self.config.get('ddl_keep_columns', DEFAULT_DDL_KEEP_COLUMNS)
+        )
+
+    def run_sql(self, sql):
+        """重寫 run_sql 方法以使用 SQLite"""
+        try:
+            columns, rows, _ = self.query_fn(sql)
+            return pd.DataFrame(rows, columns=columns)
+        except Exception as e:
+            logger.error(f"執行 SQL 失敗: {str(e)}")
+            raise
+
+    def embed_questions(self, questions: List[str]) -> List[List[float]]:
+        """以一次 embedding function 呼叫計算多個問句的 embedding"""
+        if not questions:
+            return []
+        with metrics.span('embedding'):
+            return [[float(x) for x in embedding] for embedding in self.embedding_function(list(questions))]
+
+    def generate_sql(self, question, embedding=None, **kwargs):
+        """
+        產生 SQL；問句 embedding 只計算一次，三個 collection 的檢索共用
+
+        Args:
+            embedding: 已算好的問句 embedding (例如批次查詢一次算好的)，省略時在這裡計算
+        """
+        if embedding is None:
+            embedding = self.embed_questions([question])[0]
+        return super().generate_sql(question, embedding=embedding, **kwargs)
+
+    def _query_collection(self, collection, n_results, question, embedding=None):
+        """以問句 embedding (沒有時以問句文字) 查詢 collection"""
+        with metrics.span('retrieval'):
+            if embedding is None:
+                results = collection.query(query_texts=[question], n_results=n_results)
+            else:
+                results = collection.query(query_embeddings=[embedding], n_results=n_results)
+            return ChromaDB_VectorStore._extract_documents(results)
+
+    def get_similar_question_sql(self, question, **kwargs):
+        return self._query_collection(self.sql_collection, self.n_results_sql, question, kwargs.get('embedding'))
+
+    def get_related_ddl(self, question, **kwargs):
+        return self._query_collection(self.ddl_collection, self.n_results_ddl, question, kwargs.get('embedding'))
+
+    def get_related_documentation(self, question, **kwargs):
+        return self._query_collection(
+            self.documentation_collection, self.n_results_documentation, question, kwargs.get('embedding'))
+
+    def str_to_approx_token_count(self, string: str) -> int:
+        return estimate_tokens(string)
+
+    def get_sql_prompt(self, initial_prompt, question, question_sql_list, ddl_list, doc_list, **kwargs):
+        """精簡 DDL 並依 token 預算挑選檢索結果後，再交給 vanna 組合 prompt"""
+        context = self.prompt_builder.build(question, question_sql_list, ddl_list, doc_list)
+        prompt = super().get_sql_prompt(
+            initial_prompt=initial_prompt,
+            question=question,
+            question_sql_list=context.question_sql_list,
+            ddl_list=context.ddl_list,
+            doc_list=context.doc_list,
+            **kwargs
+        )
+        total = sum(estimate_tokens(message.get('content', '')) for message in prompt)
+        for section, tokens in context.tokens.items():
+            metrics.PROMPT_CONTEXT_TOKENS.observe(tokens, section=section)
+        metrics.PROMPT_CONTEXT_TOKENS.observe(total, section='total')
+        logger.info(
+            f"prompt 估計 {total} tokens (DDL {context.tokens['ddl']}、範例 SQL {context.tokens['sql']}、"
+            f"文件 {context.tokens['documentation']}；{len(context.ddl_list)} 個表格、"
+            f"{len(context.question_sql_list)} 個範例、{len(context.doc_list)} 筆文件)"
+        )
+        return prompt
+
+    def submit_prompt(self, prompt, **kwargs):
+        """呼叫 OpenAI 產生回應，並記錄時間與 token 用量"""
+        if not prompt:
+            raise Exception("Prompt is empty")
+        try:
+            with metrics.span('llm'):
+                response = self.client.chat.completions.create(
+                    model=kwargs.get('model') or self.config.get('model', 'gpt-4'),
+                    messages=prompt,
+                    stop=None,
+                    temperature=self.temperature
+                )
+        except Exception:
+            metrics.LLM_REQUESTS.inc(status='error')
+            raise
+        metrics.LLM_REQUESTS.inc(status='ok')
+        usage = getattr(response, 'usage', None)
+        metrics.record_token_usage(usage)
+        if usage is not None:
+            logger.info(f"LLM token 用量: prompt {usage.prompt_tokens}，completion {usage.completion_tokens}")
+        return response.choices[0].message.content
+
+    def _training_targets(self):
+        """各訓練類型對應的 collection 與 id 後綴 (與 ChromaDB_VectorStore 的 add_* 一致)"""
+        return {
+            KIND_DDL: (self.ddl_collection, '-ddl'),
+            KIND_DOCUMENTATION: (self.documentation_collection, '-doc'),
+            KIND_SQL: (self.sql_collection, '-sql')
+        }
+
+    def load_collections(self) -> dict:
+        """
+        讀取各 collection 的筆數，讓 Chroma 在暖機時就載入資料
+
+        Returns:
+            dict: 訓練類型 → 筆數
+        """
+        return {kind: collection.count() for kind, (collection, _) in self._training_targets().items()}
+
+    def train_batch(self, items):
+        """
+        批次加入訓練項目，每種類型只呼叫一次 embedding function
+
+        Args:
+            items: training_manifest.make_item 建立的訓練項目
+
+        Returns:
+            dict: 項目 hash → 向量資料庫中的 id
+        """
+        ids = {}
+        with self.maintenance_lock:
+            for kind, (collection, suffix) in self._training_targets().items():
+                batch = [item for item in items if item['kind'] == kind]
+                if not batch:
+                    continue
+                if kind == KIND_SQL:
+                    documents = [
+                        json.dumps({'question': item['question'], 'sql': item['content']}, ensure_ascii=False)
+                        for item in batch
+                    ]
+                else:
+                    documents = [item['content'] for item in batch]
+                batch_ids = [deterministic_uuid(doc) + suffix for doc in documents]
+                collection.upsert(
+                    documents=documents,
+                    embeddings=self.embedding_function(documents),
+                    ids=batch_ids
+                )
+                for item, item_id in zip(batch, batch_ids):
+                    ids[item['hash']] = item_id
+        return ids
+
+    def existing_training_ids(self, ids):
+        """回傳仍存在於向量資料庫中的 id"""
+        existing = set()
+        for collection, suffix in self._training_targets().values():
+            wanted = [item_id for item_id in ids if item_id.endswith(suffix)]
+            if wanted:
+                existing.update(collection.get(ids=wanted, include=[])['ids'])
+        return existing
+
+    def vector_store_report(self) -> dict:
+        """各 collection 的筆數、重複筆數與 segment 大小 (見 vector_store.collection_report)"""
+        return vector_store.collection_report(self.chroma_client, self.config.get('path', '.'))
+
+    def maintain_vector_store(self, keep_ids=(), dedup=True, compact=True, dry_run=False) -> dict:
+        """
+        去除重複的訓練項目並重建 HNSW segment (見 vector_store.maintain)
+
+        重建完成時先把檢索用的 collection 切換到新的 collection 再刪除舊的，維護期間檢索不中斷；
+        訓練在維護完成前等待。
+        """
+        attributes = {
+            'ddl': 'ddl_collection',
+            'documentation': 'documentation_collection',
+            'sql': 'sql_collection'
+        }
+
+        def switch(name, collection):
+            if name in attributes:
+                setattr(self, attributes[name], collection)
+
+        with self.maintenance_lock:
+            return vector_store.maintain(
+                self.chroma_client, self.config.get('path', '.'), keep_ids, dedup=dedup, compact=compact,
+                dry_run=dry_run, embedding_function=self.embedding_function, on_rebuilt=switch
+            )
@@ -0,0 +1,318 @@
+"""
+Chroma 向量資料庫的維護：依內容去除重複的訓練項目、以既有 embedding 重建 HNSW segment，
+並回報各 collection 的筆數與磁碟用量
+
+chromadb 只在建立 client 時才載入；維護 app 正在使用的資料目錄時請改用 app 的
+/api/vector-store/maintenance (同一個目錄不應由兩個行程同時寫入)。
+"""
+import logging
+import os
+import re
+import shutil
+import sqlite3
+from contextlib import closing
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 預設的資料目錄 (app.py 的 CHROMA_PATH)
+DEFAULT_PATH = 'database/chroma'
+# Chroma 的目錄資料庫：collection、segment 與文件內容
+CATALOG_FILE = 'chroma.sqlite3'
+# HNSW segment 目錄以 segment id (UUID) 命名
+SEGMENT_DIR = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+# 重建時暫存的 collection 名稱後綴
+COMPACT_SUFFIX = '__compact'
+# 讀取與寫入 collection 時每批的筆數
+PAGE_SIZE = 1000
+
+
+def create_client(path: str = DEFAULT_PATH, memory_limit_bytes: int = 0):
+    """
+    建立 PersistentClient
+
+    Chroma 在第一次查詢某個 collection 時才把它的 HNSW segment 載入記憶體；
+    memory_limit_bytes > 0 時以 LRU 限制同時載入的 segment 大小，超過時釋放最久未使用的 collection。
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    options = {'anonymized_telemetry': False}
+    if memory_limit_bytes:
+        options.update(chroma_segment_cache_policy='LRU', chroma_memory_limit_bytes=memory_limit_bytes)
+    os.makedirs(path, exist_ok=True)
+    client = chromadb.PersistentClient(path=path, settings=Settings(**options))
+    # 必須在 vanna 以 get_or_create_collection 建立空的 collection 之前復原
+    recover_interrupted(client)
+    return client
+
+
+def collection_names(client) -> List[str]:
+    """所有 collection 名稱 (不同版本的 list_collections 回傳名稱或 Collection)"""
+    return [c if isinstance(c, str) else c.name for c in client.list_collections()]
+
+
+def recover_interrupted(client) -> List[str]:
+    """
+    復原重建中斷的 collection：舊的已刪除但暫存的還沒改名時，暫存的 collection 已寫入所有項目，
+    改回原本的名稱
+
+    Returns:
+        List[str]: 復原的 collection 名稱
+    """
+    names = set(collection_names(client))
+    recovered = []
+    for temp_name in sorted(names):
+        name = temp_name[:-len(COMPACT_SUFFIX)]
+        if temp_name.endswith(COMPACT_SUFFIX) and name not in names:
+            client.get_collection(temp_name).modify(name=name)
+            logger.warning(f"collection {name} 重建時中斷，已由 {temp_name} 復原")
+            recovered.append(name)
+    return recovered
+
+
+def get_collection(client, name: str, embedding_function=None):
+    if embedding_function is None:
+        return client.get_collection(name)
+    return client.get_collection(name, embedding_function=embedding_function)
+
+
+def directory_bytes(path: str) -> int:
+    """目錄下所有檔案的大小"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def vector_segments(path: str) -> Optional[Dict[str, str]]:
+    """
+    由 chroma.sqlite3 的 segments 表讀取各 collection 的 HNSW segment
+
+    Returns:
+        Optional[Dict[str, str]]: collection id → segment id，無法讀取目錄資料庫時為 None
+    """
+    catalog = os.path.join(path, CATALOG_FILE)
+    if not os.path.exists(catalog):
+        return None
+    try:
+        with closing(sqlite3.connect(f'file:{catalog}?mode=ro', uri=True)) as conn:
+            return {collection: segment for segment, collection in conn.execute(
+                "SELECT id, collection FROM segments WHERE scope = 'VECTOR'")}
+    except sqlite3.Error as e:
+        logger.warning(f"讀取 {catalog} 失敗: {str(e)}")
+        return None
+
+
+def orphan_segment_dirs(path: str) -> List[str]:
+    """
+    不屬於任何 collection 的 HNSW segment 目錄 (例如刪除 collection 後殘留的)
+
+    沒有目錄資料庫或無法讀取時無法判斷，回傳空清單
+    """
+    segments = vector_segments(path)
+    if segments is None:
+        return []
+    referenced = set(segments.values())
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if SEGMENT_DIR.match(name) and name not in referenced and os.path.isdir(os.path.join(path, name))
+    )
+
+
+def _documents(collection) -> Tuple[List[str], List[Optional[str]]]:
+    """分批讀取 collection 的 id 與文件 (依加入順序)"""
+    ids, documents = [], []
+    while True:
+        page = collection.get(include=['documents'], limit=PAGE_SIZE, offset=len(ids))
+        if not page['ids']:
+            return ids, documents
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+
+
+def find_duplicates(collection, keep_ids: Iterable[str] = ()) -> List[str]:
+    """
+    內容相同的文件只保留一筆，回傳其餘的 id
+
+    優先保留 keep_ids 中的 id (訓練 manifest 記錄的 id)，其次是最先加入的
+    """
+    keep_ids = set(keep_ids)
+    ids, documents = _documents(collection)
+    kept = {}
+    for item_id, document in zip(ids, documents):
+        if document is None:
+            continue
+        current = kept.get(document)
+        if current is None or (item_id in keep_ids and current not in keep_ids):
+            kept[document] = item_id
+    survivors = set(kept.values())
+    return [item_id for item_id, document in zip(ids, documents) if document is not None and item_id not in survivors]
+
+
+def collection_report(client, path: str) -> dict:
+    """
+    各 collection 的筆數、重複筆數與 HNSW segment 大小，以及目錄資料庫與殘留 segment 的大小
+    """
+    segments = vector_segments(path) or {}
+    collections = []
+    for name in collection_names(client):
+        collection = client.get_collection(name)
+        segment = segments.get(str(collection.id))
+        collections.append({
+            'name': name,
+            'count': collection.count(),
+            'duplicates': len(find_duplicates(collection)),
+            'segment': segment,
+            'segment_bytes': directory_bytes(os.path.join(path, segment)) if segment else 0
+        })
+    catalog = os.path.join(path, CATALOG_FILE)
+    return {
+        'path': path,
+        'catalog_bytes': os.path.getsize(catalog) if os.path.exists(catalog) else 0,
+        'collections': collections,
+        'orphans': [{'dir': d, 'bytes': directory_bytes(d)} for d in orphan_segment_dirs(path)]
+    }
+
+
+def rebuild_collection(client, name: str, embedding_function=None,
+                       on_rebuilt: Optional[Callable[[str, object], None]] = None):
+    """
+    以既有的 embedding 重建 collection：刪除後的節點會一直留在 HNSW 索引中，
+    重新加入所有項目可得到只含現有項目的新索引 (不需要重新計算 embedding)
+
+    先寫入暫存的 collection，完成後才刪除舊的並改名，on_rebuilt(name, 新 collection) 在刪除舊的之前呼叫，
+    讓使用中的程式先切換到新的 collection。
+
+    Returns:
+        重建後的 collection
+    """
+    temp_name = name + COMPACT_SUFFIX
+    names = collection_names(client)
+    if name not in names and temp_name in names:
+        # 上次在刪除舊的之後、改名之前中斷：暫存的 collection 已完整，改回原名即可
+        recover_interrupted(client)
+        new = get_collection(client, name, embedding_function)
+        if on_rebuilt is not None:
+            on_rebuilt(name, new)
+        return new
+    old = get_collection(client, name, embedding_function)
+    if temp_name in names:
+        client.delete_collection(temp_name)  # 上次在複製途中中斷留下的
+    options = {'metadata': old.metadata or None}
+    if embedding_function is not None:
+        options['embedding_function'] = embedding_function
+    new = client.create_collection(temp_name, **options)
+
+    copied = 0
+    while True:
+        page = old.get(include=['embeddings', 'documents', 'metadatas'], limit=PAGE_SIZE, offset=copied)
+        if not page['ids']:
+            break
+        batch = {
+            'ids': page['ids'],
+            'embeddings': [[float(x) for x in embedding] for embedding in page['embeddings']],
+            'documents': page['documents']
+        }
+        # vanna 的訓練項目沒有 metadata；只有每筆都有時才帶入 (空的 metadata 無法寫入)
+        metadatas = page.get('metadatas')
+        if metadatas and all(metadatas):
+            batch['metadatas'] = metadatas
+        new.add(**batch)
+        copied += len(page['ids'])
+
+    if on_rebuilt is not None:
+        on_rebuilt(name, new)
+    client.delete_collection(name)
+    new.modify(name=name)
+    logger.info(f"collection {name} 已重建 ({copied} 筆)")
+    return new
+
+
+def maintain(client, path: str, keep_ids: Iterable[str] = (), dedup: bool = True, compact: bool = True,
+             dry_run: bool = False, embedding_function=None,
+             on_rebuilt: Optional[Callable[[str, object], None]] = None) -> dict:
+    """
+    去除重複項目、重建 HNSW segment 並刪除殘留的 segment 目錄
+
+    Args:
+        keep_ids: 重複時優先保留的 id (訓練 manifest 記錄的 id)
+        dry_run: 只回報會刪除的項目與殘留目錄，不做任何修改
+
+    Returns:
+        dict: 維護前後的 collection_report，以及刪除的重複筆數、重建的 collection 與刪除的殘留目錄
+    """
+    keep_ids = set(keep_ids)
+    if not dry_run:
+        recover_interrupted(client)
+    before = collection_report(client, path)
+    result = {'dry_run': dry_run, 'before': before, 'removed_duplicates': {}, 'rebuilt': [], 'removed_orphans': []}
+    for name in collection_names(client):
+        if name.endswith(COMPACT_SUFFIX):
+            continue
+        if dedup:
+            collection = get_collection(client, name, embedding_function)
+            duplicates = find_duplicates(collection, keep_ids)
+            if duplicates and not dry_run:
+                for start in range(0, len(duplicates), PAGE_SIZE):
+                    collection.delete(ids=duplicates[start:start + PAGE_SIZE])
+                logger.info(f"collection {name} 刪除 {len(duplicates)} 筆重複項目")
+            result['removed_duplicates'][name] = len(duplicates)
+        if compact and not dry_run:
+            rebuild_collection(client, name, embedding_function, on_rebuilt)
+            result['rebuilt'].append(name)
+    if compact:
+        # 重建後舊的 segment 不再被參照，重新列出殘留目錄
+        orphans = orphan_segment_dirs(path) if not dry_run else [o['dir'] for o in before['orphans']]
+        for orphan in orphans:
+            if not dry_run:
+                shutil.rmtree(orphan, ignore_errors=True)
+            result['removed_orphans'].append(orphan)
+    result['after'] = before if dry_run else collection_report(client, path)
+    return result
+
+
+def print_report(report: dict):
+    from tabulate import tabulate
+
+    rows = [[c['name'], c['count'], c['duplicates'], c['segment'] or '-', f"{c['segment_bytes'] / 1024:.1f}"]
+            for c in report['collections']]
+    print(tabulate(rows, headers=['collection', '筆數', '重複', 'segment', 'KB'], tablefmt='github'))
+    print(f"目錄資料庫 {report['catalog_bytes'] / 1024:.1f} KB，"
+          f"殘留 segment {len(report['orphans'])} 個 ({sum(o['bytes'] for o in report['orphans']) / 1024:.1f} KB)")
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Chroma 向量資料庫維護 (請在 app 停止時執行)')
+    parser.add_argument('command', choices=['report', 'maintain'],
+                        help='report: 各 collection 的筆數與大小；maintain: 去除重複並重建 segment')
+    parser.add_argument('--path', default=os.getenv('CHROMA_PATH', DEFAULT_PATH), help='Chroma 資料目錄')
+    parser.add_argument('--manifest', default=os.getenv('TRAINING_MANIFEST_PATH', 'database/training_manifest.json'),
+                        help='訓練 manifest，重複時優先保留其中記錄的 id')
+    parser.add_argument('--no-dedup', action='store_true', help='不去除重複項目')
+    parser.add_argument('--no-compact', action='store_true', help='不重建 segment')
+    parser.add_argument('--dry-run', action='store_true', help='只列出會刪除的項目')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    client = create_client(args.path)
+    if args.command == 'report':
+        print_report(collection_report(client, args.path))
+    else:
+        from training_manifest import load_manifest
+
+        manifest_ids = [entry['id'] for entry in load_manifest(args.manifest).values()]
+        result = maintain(client, args.path, manifest_ids, dedup=not args.no_dedup, compact=not args.no_compact,
+                          dry_run=args.dry_run)
+        print_report(result['before'])
+        print(json.dumps({key: result[key] for key in ('dry_run', 'removed_duplicates', 'rebuilt', 'removed_orphans')},
+                         ensure_ascii=False, indent=2))
+        if not args.dry_run:
+            print_report(result['after'])
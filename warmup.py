@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 暖機狀態
+WARMUP_PENDING = 'pending'
+WARMUP_RUNNING = 'running'
+WARMUP_READY = 'ready'
+WARMUP_FAILED = 'failed'
+
+
+class Warmup:
+    """
+    背景暖機
+
+    在獨立執行緒中依序執行各階段 (連線池、page cache、向量資料庫、訓練)，
+    讓 app 啟動後可以立即接受請求；各階段的狀態與耗時供 /readyz 查詢。
+    階段失敗時以指數退避 (retry_delay 起算，每次加倍，最多 max_retry_delay 秒) 重試該階段，
+    已完成的階段不重新執行；重試 max_attempts 次仍失敗時停止，其餘階段標為 skipped。
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[], None]]], retry_delay: float = 1.0,
+                 max_retry_delay: float = 60.0, max_attempts: Optional[int] = None):
+        self.stages = list(stages)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.state = WARMUP_PENDING
+        self.error = None
+        self.retry_at = None
+        self.started_at = None
+        self.finished_at = None
+        self._stage_status = {name: {'status': WARMUP_PENDING, 'ms': None, 'attempts': 0}
+                              for name, _ in self.stages}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        # 狀態變為就緒或失敗 (含等待重試) 時通知 wait
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def start(self) -> bool:
+        """
+        啟動背景暖機 (重複呼叫不會重複執行)
+
+        Returns:
+            bool: 是否由這次呼叫啟動
+        """
+        if self._thread is not None:
+            return False
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.state = WARMUP_RUNNING
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+        self._thread.start()
+        return True
+
+    def run(self):
+        """在目前執行緒執行暖機並等待完成"""
+        if self.start():
+            self._thread.join()
+        else:
+            self._done.wait()
+
+    def _run_stage(self, name: str, fn: Callable[[], None]) -> bool:
+        with self._lock:
+            self.state, self.retry_at = WARMUP_RUNNING, None
+            self._stage_status[name]['status'] = WARMUP_RUNNING
+            self._stage_status[name]['attempts'] += 1
+        start = time.perf_counter()
+        try:
+            fn()
+            status, error = WARMUP_READY, None
+        except Exception as e:
+            logger.error(f"暖機階段 {name} 失敗: {str(e)}")
+            logger.error(traceback.format_exc())
+            status, error = WARMUP_FAILED, f"{name}: {str(e)}"
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stage_status[name].update(status=status, ms=round(elapsed_ms, 1))
+            if error:
+                self.state, self.error = WARMUP_FAILED, error
+                self._changed.notify_all()
+        logger.info(f"暖機階段 {name}: {status} ({elapsed_ms:.1f}ms)")
+        return error is None
+
+    def _run(self):
+        total_start = time.perf_counter()
+        delay = self.retry_delay
+        for index, (name, fn) in enumerate(self.stages):
+            while not self._run_stage(name, fn):
+                attempts = self._stage_status[name]['attempts']
+                if self.max_attempts is not None and attempts >= self.max_attempts:
+                    with self._lock:
+                        for skipped, _ in self.stages[index + 1:]:
+                            self._stage_status[skipped]['status'] = 'skipped'
+                        self.finished_at = time.time()
+                    logger.error(f"暖機階段 {name} 已失敗 {attempts} 次，停止暖機")
+                    self._done.set()
+                    return
+                with self._lock:
+                    self.retry_at = time.time() + delay
+                logger.warning(f"{delay:.1f} 秒後重試暖機階段 {name} (第 {attempts} 次失敗)")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+        with self._lock:
+            self.state = WARMUP_READY
+            self.error = self.retry_at = None
+            self.finished_at = time.time()
+            self._changed.notify_all()
+        logger.info(f"暖機結束: {self.state}，耗時 {(time.perf_counter() - total_start) * 1000:.1f}ms")
+        self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == WARMUP_READY
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待暖機就緒；階段失敗 (含等待重試) 時立即返回
+
+        Returns:
+            bool: 是否已就緒 (逾時或失敗時為 False)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.state in (WARMUP_READY, WARMUP_FAILED), timeout)
+            return self.state == WARMUP_READY
+
+    def stage_seconds(self) -> List[Tuple[str, float]]:
+        """已完成階段的耗時 (秒)"""
+        with self._lock:
+            return [(name, status['ms'] / 1000) for name, status in self._stage_status.items()
+                    if status['ms'] is not None]
+
+    def status(self) -> dict:
+        """回傳暖機狀態"""
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                'ready': self.state == WARMUP_READY,
+                'state': self.state,
+                'error': self.error,
+                'retry_in_s': round(max(self.retry_at - time.time(), 0), 1) if self.retry_at else None,
+                'elapsed_ms': round((end - self.started_at) * 1000, 1) if self.started_at else None,
+                'stages': {name: dict(status) for name, status in self._stage_status.items()}
+            }